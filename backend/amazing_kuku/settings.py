@@ -35,6 +35,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'apps.consolidated.access_log.APIAccessLogMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -81,6 +82,12 @@ DATABASES = {
         'PASSWORD': 'kuku123',
         'HOST': 'localhost',
         'PORT': '5432',
+        # Keep connections open between requests instead of reconnecting every
+        # time; 0 closes them after each request (use with DB_POOL_MODE=null,
+        # when an external pooler such as PgBouncer does the pooling)
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '0' if os.getenv('DB_POOL_MODE') == 'null' else '60')),
+        # Check a persistent connection is still usable before reusing it
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
@@ -122,10 +129,26 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Cache shared by all processes, e.g. redis://localhost:6379/0. Without it
+# each process has its own local-memory cache.
+DJANGO_CACHE_URL = os.getenv('DJANGO_CACHE_URL', '')
+if DJANGO_CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': DJANGO_CACHE_URL,
+        }
+    }
+
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # request.user built from token claims, without a query per request.
+        # Needs the shared cache for access versions (checks.py), so it is on
+        # by default only with DJANGO_CACHE_URL
+        'apps.consolidated.authentication.StatelessJWTAuthentication'
+        if os.getenv('JWT_STATELESS_AUTH', 'true' if DJANGO_CACHE_URL else 'false').lower() == 'true'
+        else 'rest_framework_simplejwt.authentication.JWTAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -135,10 +158,53 @@ REST_FRAMEWORK = {
         'rest_framework.filters.SearchFilter',
         'rest_framework.filters.OrderingFilter',
     ],
+    'DEFAULT_THROTTLE_CLASSES': [
+        'apps.consolidated.throttling.SubscriptionPlanRateThrottle',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,
 }
 
+# Rate limits by subscription plan (apps/consolidated/throttling.py):
+# plan type -> (requests per minute, burst). 'none' is for users without an
+# active subscription; staff get 'staff' whatever their plan.
+API_RATE_LIMIT_ENABLED = os.getenv('API_RATE_LIMIT', 'true').lower() == 'true'
+API_RATE_LIMITS = {
+    'anonymous': (30, 10),
+    'none': (60, 20),
+    'free': (60, 20),
+    'basic': (300, 60),
+    'premium': (1200, 200),
+    'enterprise': (6000, 1000),
+    'staff': (6000, 1000),
+}
+# Seconds a user's plan is cached (apps/consolidated/plans.py). Plan changes
+# reach other processes only through the shared cache, hence the short default without it
+PLAN_CACHE_TTL = int(os.getenv('PLAN_CACHE_TTL', '300' if DJANGO_CACHE_URL else '30'))
+# memory: buckets per process; cache: buckets in API_RATE_LIMIT_CACHE (e.g. Redis), shared
+API_RATE_LIMIT_BACKEND = os.getenv('API_RATE_LIMIT_BACKEND', 'memory')
+API_RATE_LIMIT_CACHE = os.getenv('API_RATE_LIMIT_CACHE', 'default')
+
+# API access log (apps/consolidated/access_log.py): entries are buffered in
+# memory and written in batches by a background thread
+API_ACCESS_LOG = {
+    'ENABLED': os.getenv('API_ACCESS_LOG', 'true').lower() == 'true',
+    'BUFFER_SIZE': int(os.getenv('API_ACCESS_LOG_BUFFER_SIZE', '10000')),
+    'FLUSH_INTERVAL_MS': int(os.getenv('API_ACCESS_LOG_FLUSH_INTERVAL_MS', '1000')),
+    'FLUSH_ROWS': int(os.getenv('API_ACCESS_LOG_FLUSH_ROWS', '500')),
+    # Above this buffer fill ratio only SAMPLE_RATE of successful requests are kept
+    'SAMPLE_ABOVE': float(os.getenv('API_ACCESS_LOG_SAMPLE_ABOVE', '0.5')),
+    'SAMPLE_RATE': float(os.getenv('API_ACCESS_LOG_SAMPLE_RATE', '0.1')),
+    # Store JSON request/response bodies (credentials masked) up to CAPTURE_MAX_BYTES
+    'CAPTURE_BODIES': os.getenv('API_ACCESS_LOG_CAPTURE_BODIES', 'false').lower() == 'true',
+    'CAPTURE_MAX_BYTES': int(os.getenv('API_ACCESS_LOG_CAPTURE_MAX_BYTES', '2048')),
+}
+
+# Inventory consumption forecasts (apps/consolidated/forecast.py): half-life
+# in days of the exponentially weighted daily consumption. Run
+# `manage.py rebuild_consumption_forecasts` after changing it.
+INVENTORY_FORECAST_HALF_LIFE_DAYS = float(os.getenv('INVENTORY_FORECAST_HALF_LIFE_DAYS', '7'))
+
 # JWT Settings
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
@@ -147,6 +213,9 @@ SIMPLE_JWT = {
     'BLACKLIST_AFTER_ROTATION': True,
     'UPDATE_LAST_LOGIN': True,
     'AUTH_HEADER_TYPES': ('Bearer',),
+    # Put role, staff status and the access version into the tokens
+    'TOKEN_OBTAIN_SERIALIZER': 'apps.consolidated.authentication.ClaimsTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'apps.consolidated.authentication.ClaimsTokenRefreshSerializer',
 }
 
 # CORS Settings
@@ -1,43 +1,71 @@
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Tuple
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 import os
 
 from database import get_db
 from .models import User
-from .schemas import TokenData, UserInDB
+from .password_hashing import PasswordHashingPool, max_concurrent_hashes
+from .schemas import TokenData, UserInDB, UserPrincipal
+from .user_cache import UserPrincipalCache
 
 # Security configuration
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-here")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# Argon2 parameters; existing hashes are upgraded on the next login when these change
+ARGON2_TIME_COST = int(os.getenv("ARGON2_TIME_COST", "3"))
+ARGON2_MEMORY_COST = int(os.getenv("ARGON2_MEMORY_COST", "65536"))  # KiB per hash
+ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", "4"))
+
 # Using Argon2 for password hashing (more secure and no password length limit)
 pwd_context = CryptContext(
     schemes=["argon2"],
     default="argon2",
-    argon2__time_cost=3,
-    argon2__memory_cost=65536,
-    argon2__parallelism=4,
+    argon2__time_cost=ARGON2_TIME_COST,
+    argon2__memory_cost=ARGON2_MEMORY_COST,
+    argon2__parallelism=ARGON2_PARALLELISM,
     argon2__hash_len=32,
     deprecated="auto"
 )
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
+# Hashing runs off the event loop, with concurrency capped by memory (see password_hashing.py)
+password_hasher = PasswordHashingPool(
+    max_workers=int(os.getenv("PASSWORD_HASH_WORKERS", "0")) or max_concurrent_hashes(
+        ARGON2_MEMORY_COST,
+        float(os.environ["PASSWORD_HASH_MEMORY_MB"]) if os.getenv("PASSWORD_HASH_MEMORY_MB") else None
+    ),
+    max_queue=int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "64")),
+    queue_timeout=float(os.getenv("PASSWORD_HASH_QUEUE_TIMEOUT", "10"))
+)
+
+# Token subject -> UserPrincipal, so authenticated requests skip the user query (see user_cache.py)
+user_cache = UserPrincipalCache(
+    ttl=float(os.getenv("USER_CACHE_TTL", "30")),
+    max_entries=int(os.getenv("USER_CACHE_MAX_ENTRIES", "10000"))
+)
+
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against a hash."""
-    return pwd_context.verify(plain_password, hashed_password)
+    return await password_hasher.run(pwd_context.verify, plain_password, hashed_password)
 
-def get_password_hash(password: str) -> str:
+async def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Verify a password; also return a new hash if the stored one uses outdated parameters."""
+    return await password_hasher.run(pwd_context.verify_and_update, plain_password, hashed_password)
+
+async def get_password_hash(password: str) -> str:
     """Create a password hash."""
-    return pwd_context.hash(password)
+    return await password_hasher.run(pwd_context.hash, password)
 
-def get_user(db: Session, email: str) -> Optional[UserInDB]:
-    user = db.query(User).filter(User.email == email).first()
+async def get_user(db: AsyncSession, email: str) -> Optional[UserInDB]:
+    user = (await db.execute(select(User).where(User.email == email))).scalars().first()
     if user:
         return UserInDB(
             id=str(user.id),
@@ -55,12 +83,18 @@ def get_user(db: Session, email: str) -> Optional[UserInDB]:
         )
     return None
 
-def authenticate_user(db: Session, email: str, password: str):
-    user = get_user(db, email)
+async def authenticate_user(db: AsyncSession, email: str, password: str):
+    user = await get_user(db, email)
     if not user:
         return False
-    if not verify_password(password, user.password):
+    valid, new_hash = await verify_and_update_password(password, user.password)
+    if not valid:
         return False
+    if new_hash is not None:
+        # Hashed with older Argon2 parameters: store it re-hashed with the current ones
+        await db.execute(update(User).where(User.email == email).values(password=new_hash))
+        await db.commit()
+        user.password = new_hash
     return user
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -73,7 +107,7 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -87,18 +121,24 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
         token_data = TokenData(email=email)
     except JWTError:
         raise credentials_exception
-    user = get_user(db, email=token_data.email)
-    if user is None:
-        raise credentials_exception
-    return user
+    
+    principal = user_cache.get(token_data.email)
+    if principal is None:
+        version = user_cache.version(token_data.email)
+        user = (await db.execute(select(User).where(User.email == token_data.email))).scalars().first()
+        if user is None:
+            raise credentials_exception
+        principal = UserPrincipal.model_validate(user)
+        user_cache.put(token_data.email, principal, version)
+    return principal
 
-def get_current_active_user(current_user: UserInDB = Depends(get_current_user)):
+def get_current_active_user(current_user: UserPrincipal = Depends(get_current_user)):
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
 
 async def get_current_admin_user(
-    current_user: UserInDB = Depends(get_current_user)
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     if current_user.role != "admin":
         raise HTTPException(
@@ -1,5 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 import uuid
 
@@ -13,7 +14,7 @@ router = APIRouter(prefix="/farms", tags=["farms"])
 @router.post("/", response_model=schemas.FarmInDB, status_code=status.HTTP_201_CREATED)
 async def create_farm(
     farm: schemas.FarmCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """Create a new farm"""
@@ -27,34 +28,32 @@ async def create_farm(
     )
     
     db.add(db_farm)
-    db.commit()
-    db.refresh(db_farm)
+    await db.commit()
+    await db.refresh(db_farm)
     return db_farm
 
 @router.get("/", response_model=List[schemas.FarmInDB])
 async def read_farms(
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """List all farms (admin sees all, others see their own)"""
-    if current_user.role == "admin":
-        farms = db.query(Farm).offset(skip).limit(limit).all()
-    else:
-        farms = db.query(Farm).filter(
-            Farm.owner_id == current_user.id
-        ).offset(skip).limit(limit).all()
+    query = select(Farm)
+    if current_user.role != "admin":
+        query = query.where(Farm.owner_id == current_user.id)
+    farms = (await db.execute(query.offset(skip).limit(limit))).scalars().all()
     return farms
 
 @router.get("/{farm_id}", response_model=schemas.FarmInDB)
 async def read_farm(
     farm_id: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """Get a specific farm by ID"""
-    farm = db.query(Farm).filter(Farm.id == farm_id).first()
+    farm = await db.get(Farm, farm_id)
     if not farm:
         raise HTTPException(status_code=404, detail="Farm not found")
     
@@ -71,11 +70,11 @@ async def read_farm(
 async def update_farm(
     farm_id: str,
     farm_update: schemas.FarmUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """Update a farm"""
-    db_farm = db.query(Farm).filter(Farm.id == farm_id).first()
+    db_farm = await db.get(Farm, farm_id)
     if not db_farm:
         raise HTTPException(status_code=404, detail="Farm not found")
     
@@ -91,18 +90,18 @@ async def update_farm(
         setattr(db_farm, field, value)
     
     db.add(db_farm)
-    db.commit()
-    db.refresh(db_farm)
+    await db.commit()
+    await db.refresh(db_farm)
     return db_farm
 
 @router.delete("/{farm_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_farm(
     farm_id: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """Delete a farm"""
-    db_farm = db.query(Farm).filter(Farm.id == farm_id).first()
+    db_farm = await db.get(Farm, farm_id)
     if not db_farm:
         raise HTTPException(status_code=404, detail="Farm not found")
     
@@ -113,6 +112,6 @@ async def delete_farm(
             detail="Not authorized to delete this farm"
         )
     
-    db.delete(db_farm)
-    db.commit()
+    await db.delete(db_farm)
+    await db.commit()
     return None
@@ -1,5 +1,7 @@
 from fastapi import FastAPI, Depends, HTTPException, status, File, UploadFile, Form
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
@@ -13,18 +15,17 @@ from PIL import Image  # Add this import for image processing
 load_dotenv()
 
 # Import database and models
-from database import engine, Base, get_db
+from database import engine, Base, get_db, pool_stats, POOL_CHECKOUT_SECONDS
 from api.models import User, Farm  # Import our SQLAlchemy models
-
-# Create database tables
-Base.metadata.create_all(bind=engine)
+from image_pool import image_pool, decode_image, encode_jpeg
+from metrics import CONTENT_TYPE, render_metrics
 
 # Import API routes
 import api.auth_endpoints as auth_endpoints
 import api.users as users
 import api.farms as farms
-from api.schemas import UserInDB
-from api.auth import get_current_active_user
+from api.schemas import UserPrincipal
+from api.auth import get_current_active_user, password_hasher, user_cache
 
 app = FastAPI(
     title="Amazing Kuku API",
@@ -34,6 +35,18 @@ app = FastAPI(
     redoc_url="/redoc"
 )
 
+# Tables are created by the explicit migration step (python init_db.py), not at
+# import time, so a cold start does not wait on the database. Set
+# DB_CREATE_TABLES=true to create them at startup instead (local development).
+@app.on_event("startup")
+async def create_tables():
+    if os.getenv("DB_CREATE_TABLES", "false").lower() == "true":
+        await run_in_threadpool(Base.metadata.create_all, bind=engine)
+
+@app.on_event("shutdown")
+async def stop_password_hasher():
+    password_hasher.shutdown()
+
 # CORS middleware configuration
 app.add_middleware(
     CORSMiddleware,
@@ -53,9 +66,18 @@ app.include_router(farms.router, prefix="/api", tags=["farms"])
 async def health_check():
     return {"status": "healthy", "version": "1.0.0"}
 
+# Prometheus metrics: connection pool state, checkout wait times and password hashing queue
+@app.get("/api/metrics", tags=["health"])
+async def metrics():
+    body = render_metrics(
+        {"db_pool": pool_stats(), "password_hashing": password_hasher.stats(), "user_cache": user_cache.stats()},
+        histograms=[POOL_CHECKOUT_SECONDS]
+    )
+    return PlainTextResponse(body, media_type=CONTENT_TYPE)
+
 # Protected route example
 @app.get("/api/protected-route", tags=["examples"])
-async def protected_route(current_user: UserInDB = Depends(get_current_active_user)):
+async def protected_route(current_user: UserPrincipal = Depends(get_current_active_user)):
     return {
         "message": "This is a protected route",
         "user": current_user.email,
@@ -84,16 +106,16 @@ class DiseasePredictor:
         """
         Predict disease using external API
         """
+        # Imported on first use so it does not add to cold start time
+        import aiohttp
+        
         try:
-            # Convert PIL Image to bytes
-            img_buffer = io.BytesIO()
-            image.save(img_buffer, format='JPEG')
-            img_buffer.seek(0)
+            # Convert PIL Image to bytes (in the image worker pool)
+            image_bytes = await image_pool.run(encode_jpeg, image, 75)
             
             # Prepare the file for multipart upload
-            files = {
-                'file': ('image.jpg', img_buffer, 'image/jpeg')
-            }
+            files = aiohttp.FormData()
+            files.add_field('file', image_bytes, filename='image.jpg', content_type='image/jpeg')
             
             # Make async request to external API
             async with aiohttp.ClientSession() as session:
@@ -138,6 +160,8 @@ async def root():
 
 @app.get("/health")
 async def health_check():
+    import aiohttp
+    
     try:
         # Test external API connectivity
         async with aiohttp.ClientSession() as session:
@@ -154,7 +178,8 @@ async def health_check():
         "services": {
             "disease_prediction": "operational",
             "image_processing": "operational"
-        }
+        },
+        "image_pool": image_pool.stats()
     }
 
 @app.post("/predict/")
@@ -173,13 +198,9 @@ async def predict_disease(
                 detail="File must be an image (JPEG, PNG, etc.)"
             )
         
-        # Read and process image
+        # Read and process image (decode and RGB conversion run in the image worker pool)
         image_data = await file.read()
-        image = Image.open(io.BytesIO(image_data))
-        
-        # Convert to RGB if necessary
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
+        image = await image_pool.run(decode_image, image_data)
         
         # Get prediction from external API
         prediction_result = await predictor.predict(image)
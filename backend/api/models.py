@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Boolean, DateTime, Enum, Text
+from sqlalchemy import Column, String, Boolean, DateTime, Enum, Integer, Text
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import declarative_base
 import uuid
@@ -21,11 +21,13 @@ class User(Base):
     is_active = Column(Boolean, default=True, nullable=False)
     is_staff = Column(Boolean, default=False, nullable=False)
     is_superuser = Column(Boolean, default=False, nullable=False)
+    # Bumped when role, is_staff, is_superuser or is_active changes (see the Django User)
+    access_version = Column(Integer, default=0, nullable=False)
     last_login = Column(DateTime(timezone=True), nullable=True)
     date_joined = Column(DateTime(timezone=True), default=datetime.utcnow, nullable=False)
     created_at = Column(DateTime(timezone=True), default=datetime.utcnow, nullable=False)
     updated_at = Column(DateTime(timezone=True), default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
-    username = Column(String(150), unique=True, nullable=False, default=uuid.uuid4)
+    username = Column(String(150), unique=True, nullable=False, default=lambda: str(uuid.uuid4()))
     
     def __repr__(self):
         return f"<User {self.email}>"
@@ -0,0 +1,143 @@
+"""
+Bounded worker pool for password hashing.
+
+Argon2 is slow and memory-hungry by design (memory_cost KiB per hash). Run
+inline in an async handler, a burst of logins freezes the event loop, and
+enough concurrent hashes can exhaust the instance's memory. Hashes run in a
+dedicated thread pool instead; argon2-cffi releases the GIL, so the threads
+hash in parallel. The number of concurrent hashes is capped so that
+workers x memory_cost stays within a memory budget. Callers beyond the cap
+wait in a bounded queue and get 503 once it is full.
+"""
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+from fastapi import HTTPException, status
+
+# Share of the memory limit that concurrent hashes may use
+MEMORY_SHARE = 0.25
+FALLBACK_MEMORY_BUDGET = 256 * 1024 * 1024
+
+
+def _memory_limit_bytes() -> Optional[int]:
+    # A container's cgroup limit is usually well below the host's physical memory
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        try:
+            with open(path) as limit_file:
+                value = limit_file.read().strip()
+        except OSError:
+            continue
+        if value.isdigit() and int(value) < 1 << 60:
+            return int(value)
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def max_concurrent_hashes(memory_cost_kib: int, memory_budget_mb: Optional[float] = None) -> int:
+    """
+    How many hashes may run at once: no more than the CPU count, and no more
+    than fit in the memory budget (PASSWORD_HASH_MEMORY_MB, or a quarter of
+    the memory limit).
+    """
+    if memory_budget_mb is not None:
+        budget = memory_budget_mb * 1024 * 1024
+    else:
+        limit = _memory_limit_bytes()
+        budget = limit * MEMORY_SHARE if limit else FALLBACK_MEMORY_BUDGET
+    by_memory = int(budget // (memory_cost_kib * 1024))
+    return max(1, min(os.cpu_count() or 1, by_memory))
+
+
+class PasswordHashingPool:
+    """Runs hash/verify calls on a fixed number of threads and keeps queue metrics."""
+
+    def __init__(self, max_workers: int, max_queue: int = 64, queue_timeout: float = 10, retry_after: int = 2):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+        # Metrics
+        self.in_flight = 0
+        self.queued = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.total_run_seconds = 0.0
+
+    def _busy(self, detail: str) -> HTTPException:
+        return HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=detail,
+            headers={"Retry-After": str(self.retry_after)}
+        )
+
+    async def run(self, func: Callable, *args):
+        """Run `func(*args)` on a hashing thread once one is free."""
+        if self._executor is None:
+            # Created on first use, inside the running event loop
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="password-hash")
+            self._semaphore = asyncio.Semaphore(self.max_workers)
+
+        if self._semaphore.locked() and self.queued >= self.max_queue:
+            self.rejected += 1
+            raise self._busy("Too many sign-in attempts in progress - please try again shortly")
+
+        self.queued += 1
+        submitted = time.monotonic()
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise self._busy("Timed out waiting to check the password - please try again shortly")
+        finally:
+            self.queued -= 1
+
+        started = time.monotonic()
+        waited = started - submitted
+        self.total_wait_seconds += waited
+        self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+        self.in_flight += 1
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphore
+        future = self._executor.submit(func, *args)
+        # The permit goes back when the hash finishes, not when the caller stops
+        # waiting: a cancelled request (client gone) leaves its hash running
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(self._finished, semaphore, started))
+        return await asyncio.wrap_future(future)
+
+    def _finished(self, semaphore: asyncio.Semaphore, started: float):
+        self.in_flight -= 1
+        self.completed += 1
+        self.total_run_seconds += time.monotonic() - started
+        semaphore.release()
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            self._semaphore = None
+
+    def stats(self) -> dict:
+        return {
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "avg_wait_ms": round(self.total_wait_seconds / self.completed * 1000, 2) if self.completed else 0.0,
+            "max_wait_ms": round(self.max_wait_seconds * 1000, 2),
+            "avg_hash_ms": round(self.total_run_seconds / self.completed * 1000, 2) if self.completed else 0.0,
+        }
@@ -4,6 +4,10 @@ from datetime import datetime
 from enum import Enum
 import uuid
 
+def _uuid_to_str(value):
+    # The models use UUID columns; the API exposes ids as strings
+    return str(value) if isinstance(value, uuid.UUID) else value
+
 # Enums
 class UserRole(str, Enum):
     ADMIN = "admin"
@@ -44,12 +48,26 @@ class UserInDB(UserBase):
     created_at: datetime
     updated_at: datetime
 
+    _stringify_id = validator("id", pre=True, allow_reuse=True)(_uuid_to_str)
+
     class Config:
         from_attributes = True
         json_encoders = {
             uuid.UUID: lambda v: str(v)
         }
 
+class UserPrincipal(UserBase):
+    """The authenticated user as seen by request handlers (no password hash)"""
+    id: str
+    created_at: datetime
+    updated_at: datetime
+
+    _stringify_id = validator("id", pre=True, allow_reuse=True)(_uuid_to_str)
+
+    class Config:
+        from_attributes = True
+        frozen = True
+
 # Farm schemas
 class FarmBase(BaseModel):
     name: str
@@ -72,6 +90,8 @@ class FarmInDB(FarmBase):
     created_at: datetime
     updated_at: datetime
 
+    _stringify_ids = validator("id", "owner_id", pre=True, allow_reuse=True)(_uuid_to_str)
+
     class Config:
         from_attributes = True
 
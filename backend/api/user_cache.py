@@ -0,0 +1,92 @@
+"""
+Short-lived cache from token subject to the authenticated user.
+
+get_current_user runs on every authenticated request; with this cache the
+steady state costs no database query. Entries hold a UserPrincipal (no
+password hash) and expire after `ttl` seconds.
+
+invalidate() drops the subject's entry and gives it a new version stamp
+whenever a user is updated, deactivated or deleted. put() only stores a
+principal whose stamp is still current, so a lookup that started before an
+update cannot put stale data back into the cache. A stamp only matters while
+such lookups can be in flight, so stamps are pruned after `ttl` seconds (and
+beyond `max_entries`). Subjects without a stamp share a floor: the newest
+pruned stamp, which is above every stamp handed out before it.
+
+Entries and stamps live in this process. Other worker processes see a change
+once their entry's TTL runs out, so keep USER_CACHE_TTL short.
+"""
+import itertools
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from .schemas import UserPrincipal
+
+
+class UserPrincipalCache:
+    def __init__(self, ttl: float = 30, max_entries: int = 10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # subject -> (principal, expires at); least recently used first
+        self._entries: "OrderedDict[str, Tuple[UserPrincipal, float]]" = OrderedDict()
+        # subject -> (version stamp, set at); oldest first
+        self._versions: "OrderedDict[str, Tuple[int, float]]" = OrderedDict()
+        self._stamps = itertools.count(1)
+        self._floor = 0
+
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+
+    def version(self, subject: str) -> int:
+        """Current version stamp; read it before loading the user and pass it to put()."""
+        stamp = self._versions.get(subject)
+        return stamp[0] if stamp is not None else self._floor
+
+    def get(self, subject: str) -> Optional[UserPrincipal]:
+        entry = self._entries.get(subject)
+        if entry is not None:
+            principal, expires_at = entry
+            if time.monotonic() < expires_at:
+                self._entries.move_to_end(subject)
+                self.hits += 1
+                return principal
+            del self._entries[subject]
+        self.misses += 1
+        return None
+
+    def put(self, subject: str, principal: UserPrincipal, version: int):
+        if self.ttl <= 0 or version != self.version(subject):
+            # Caching disabled, or the user changed while it was being loaded
+            return
+        self._entries[subject] = (principal, time.monotonic() + self.ttl)
+        self._entries.move_to_end(subject)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, subject: str):
+        """Call after changing or deleting the user identified by `subject`."""
+        now = time.monotonic()
+        self._versions[subject] = (next(self._stamps), now)
+        self._versions.move_to_end(subject)
+        self._entries.pop(subject, None)
+
+        # Lookups that started before the oldest stamps have finished by now
+        while self._versions:
+            oldest, (stamp, set_at) = next(iter(self._versions.items()))
+            if set_at > now - self.ttl and len(self._versions) <= self.max_entries:
+                break
+            del self._versions[oldest]
+            self._floor = max(self._floor, stamp)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "version_stamps": len(self._versions),
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
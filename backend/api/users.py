@@ -1,11 +1,12 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 import uuid
 
 from . import schemas
 from .models import User, Farm
-from .auth import get_password_hash, get_current_active_user, get_current_admin_user
+from .auth import get_password_hash, get_current_active_user, get_current_admin_user, user_cache
 from database import get_db
 
 router = APIRouter(prefix="/users", tags=["users"])
@@ -13,19 +14,19 @@ router = APIRouter(prefix="/users", tags=["users"])
 @router.post("/", response_model=schemas.UserInDB, status_code=status.HTTP_201_CREATED)
 async def create_user(
     user: schemas.UserCreate, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_admin_user)
 ):
     """Create a new user (Admin only)"""
-    db_user = db.query(User).filter(User.email == user.email).first()
+    db_user = (await db.execute(select(User).where(User.email == user.email))).scalars().first()
     if db_user:
         raise HTTPException(status_code=400, detail="Email already registered")
     
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await get_password_hash(user.password)
     db_user = User(
         id=str(uuid.uuid4()),
         email=user.email,
-        hashed_password=hashed_password,
+        password=hashed_password,
         first_name=user.first_name,
         last_name=user.last_name,
         phone_number=user.phone_number,
@@ -36,12 +37,12 @@ async def create_user(
     )
     
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     return db_user
 
-@router.get("/me", response_model=schemas.UserInDB)
-async def read_users_me(current_user: User = Depends(get_current_active_user)):
+@router.get("/me", response_model=schemas.UserPrincipal)
+async def read_users_me(current_user: schemas.UserPrincipal = Depends(get_current_active_user)):
     """Get current user details"""
     return current_user
 
@@ -49,21 +50,21 @@ async def read_users_me(current_user: User = Depends(get_current_active_user)):
 async def read_users(
     skip: int = 0, 
     limit: int = 100,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_admin_user)
 ):
     """Retrieve users (Admin only)"""
-    users = db.query(User).offset(skip).limit(limit).all()
+    users = (await db.execute(select(User).offset(skip).limit(limit))).scalars().all()
     return users
 
 @router.get("/{user_id}", response_model=schemas.UserInDB)
 async def read_user(
     user_id: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_admin_user)
 ):
     """Get a specific user by ID (Admin only)"""
-    db_user = db.query(User).filter(User.id == user_id).first()
+    db_user = await db.get(User, user_id)
     if db_user is None:
         raise HTTPException(status_code=404, detail="User not found")
     return db_user
@@ -71,33 +72,50 @@ async def read_user(
 @router.put("/me", response_model=schemas.UserInDB)
 async def update_user_me(
     user_update: schemas.UserUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """Update current user details"""
+    # current_user is a detached schema object; update the row itself
+    db_user = await db.get(User, current_user.id)
+    if db_user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    
     update_data = user_update.dict(exclude_unset=True)
+    if "password" in update_data:
+        update_data["password"] = await get_password_hash(update_data["password"])
+    # Django trusts role and activation from token claims until access_version moves
+    claims_changed = any(
+        field in update_data and update_data[field] != getattr(db_user, field)
+        for field in ("role", "is_active")
+    )
     for field, value in update_data.items():
-        setattr(current_user, field, value)
+        setattr(db_user, field, value)
+    if claims_changed:
+        db_user.access_version = User.access_version + 1
     
-    db.add(current_user)
-    db.commit()
-    db.refresh(current_user)
-    return current_user
+    await db.commit()
+    await db.refresh(db_user)
+    # Cached principals are keyed by email, which may itself have changed
+    user_cache.invalidate(current_user.email)
+    user_cache.invalidate(db_user.email)
+    return db_user
 
 @router.delete("/{user_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_user(
     user_id: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_admin_user)
 ):
     """Delete a user (Admin only)"""
     if user_id == current_user.id:
         raise HTTPException(status_code=400, detail="Cannot delete yourself")
     
-    db_user = db.query(User).filter(User.id == user_id).first()
+    db_user = await db.get(User, user_id)
     if not db_user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    db.delete(db_user)
-    db.commit()
+    await db.delete(db_user)
+    await db.commit()
+    user_cache.invalidate(db_user.email)
     return None
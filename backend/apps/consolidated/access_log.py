@@ -0,0 +1,290 @@
+"""
+Batched APIAccessLog writer.
+
+APIAccessLogMiddleware records one entry per API request, with no INSERT on
+the request path. Entries go into a bounded in-memory buffer. A background
+thread writes them with bulk_create every FLUSH_INTERVAL_MS, or sooner once
+FLUSH_ROWS entries are waiting.
+
+Requests never wait for the database. If the flusher falls behind (a slow
+database, a traffic spike), the buffer fills and entries are shed:
+    - above SAMPLE_ABOVE (a fill ratio), successful requests are kept with
+      probability SAMPLE_RATE; 4xx/5xx responses are always kept
+    - once the buffer is full, new entries are dropped
+Both are counted in stats(). Entries still buffered when the process exits
+are flushed by an atexit hook; a crash loses them. Sampled-out and dropped
+entries are missing from the hourly rollups (rollups.py) too, which are fed
+from each flushed batch.
+
+Request and response bodies are captured only with CAPTURE_BODIES, only for
+JSON, and only up to CAPTURE_MAX_BYTES. Credential fields are masked.
+"""
+import atexit
+import ipaddress
+import json
+import logging
+import random
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.utils import timezone
+
+from .models import APIAccessLog, User
+from .rollups import record_batch, route_template
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': True,
+    'PATH_PREFIXES': ('/api/',),
+    'BUFFER_SIZE': 10000,
+    'FLUSH_INTERVAL_MS': 1000,
+    'FLUSH_ROWS': 500,
+    'SAMPLE_ABOVE': 0.5,
+    'SAMPLE_RATE': 0.1,
+    'CAPTURE_BODIES': False,
+    'CAPTURE_MAX_BYTES': 2048,
+}
+
+SENSITIVE_KEYS = {'password', 'old_password', 'new_password', 'token', 'access', 'refresh', 'secret'}
+PATH_MAX_LENGTH = APIAccessLog._meta.get_field('path').max_length
+
+
+def access_log_settings() -> dict:
+    return {**DEFAULTS, **getattr(settings, 'API_ACCESS_LOG', {})}
+
+
+class AccessLogWriter:
+    """Ring buffer of pending log entries plus the thread that flushes it."""
+
+    def __init__(self, buffer_size=10000, flush_interval_ms=1000, flush_rows=500,
+                 sample_above=0.5, sample_rate=0.1):
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.flush_rows = flush_rows
+        self.sample_threshold = int(buffer_size * sample_above)
+        self.sample_rate = sample_rate
+        self._buffer = deque()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        # Flush listeners get every flushed batch (e.g. to update aggregates)
+        self.listeners = []
+
+        # Metrics
+        self.recorded = 0
+        self.sampled_out = 0
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+        self.flushes = 0
+        self.last_flush_seconds = 0.0
+
+    def record(self, entry: dict):
+        """Queue one entry; never blocks on the database."""
+        with self._lock:
+            pending = len(self._buffer)
+            if pending >= self.buffer_size:
+                self.dropped += 1
+                return
+            if (pending >= self.sample_threshold and entry['status_code'] < 400
+                    and random.random() >= self.sample_rate):
+                self.sampled_out += 1
+                return
+            self._buffer.append(entry)
+            self.recorded += 1
+            pending += 1
+            if self._thread is None:
+                self._start()
+        if pending >= self.flush_rows:
+            self._wakeup.set()
+
+    def _start(self):
+        # Started on first use, so management commands never spawn it
+        self._thread = threading.Thread(target=self._run, name='api-access-log', daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('API access log flush failed')
+            finally:
+                # This thread holds its own connection; drop it if it has gone bad
+                close_old_connections()
+
+    def _drain(self) -> list:
+        with self._lock:
+            batch = list(self._buffer)
+            self._buffer.clear()
+        return batch
+
+    def _write(self, batch: list):
+        with transaction.atomic():
+            APIAccessLog.objects.bulk_create(
+                [APIAccessLog(**entry) for entry in batch],
+                batch_size=self.flush_rows,
+            )
+
+    def flush(self) -> int:
+        """Write everything buffered so far; returns the number of rows written."""
+        batch = self._drain()
+        if not batch:
+            return 0
+        started = time.perf_counter()
+        try:
+            try:
+                self._write(batch)
+            except IntegrityError:
+                # A user deleted since the request was logged; keep the entries without it
+                existing = set(User.objects.filter(
+                    pk__in={entry['user_id'] for entry in batch if entry['user_id']}
+                ).values_list('pk', flat=True))
+                for entry in batch:
+                    if entry['user_id'] not in existing:
+                        entry['user_id'] = None
+                self._write(batch)
+        except Exception:
+            self.failed += len(batch)
+            raise
+        self.written += len(batch)
+        self.flushes += 1
+        self.last_flush_seconds = time.perf_counter() - started
+        for listener in self.listeners:
+            try:
+                listener(batch)
+            except Exception:
+                logger.exception('API access log flush listener failed')
+        return len(batch)
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending = len(self._buffer)
+        return {
+            'buffer_size': self.buffer_size,
+            'pending': pending,
+            'recorded': self.recorded,
+            'sampled_out': self.sampled_out,
+            'dropped': self.dropped,
+            'written': self.written,
+            'failed': self.failed,
+            'flushes': self.flushes,
+            'last_flush_ms': round(self.last_flush_seconds * 1000, 2),
+        }
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer() -> AccessLogWriter:
+    """The process-wide writer, configured from settings.API_ACCESS_LOG."""
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                config = access_log_settings()
+                _writer = AccessLogWriter(
+                    buffer_size=config['BUFFER_SIZE'],
+                    flush_interval_ms=config['FLUSH_INTERVAL_MS'],
+                    flush_rows=config['FLUSH_ROWS'],
+                    sample_above=config['SAMPLE_ABOVE'],
+                    sample_rate=config['SAMPLE_RATE'],
+                )
+                _writer.listeners.append(record_batch)
+    return _writer
+
+
+def _mask(data):
+    if isinstance(data, dict):
+        return {key: '***' if key in SENSITIVE_KEYS else _mask(value) for key, value in data.items()}
+    if isinstance(data, list):
+        return [_mask(value) for value in data]
+    return data
+
+
+def _capture_json(content_type: str, body: bytes, max_bytes: int) -> dict:
+    if not body:
+        return {}
+    if 'json' not in (content_type or ''):
+        return {'content_type': content_type, 'size': len(body)}
+    if len(body) > max_bytes:
+        return {'truncated': True, 'size': len(body)}
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return {'invalid_json': True, 'size': len(body)}
+    return _mask(data) if isinstance(data, dict) else {'data': _mask(data)}
+
+
+def _client_ip(request):
+    forwarded = request.META.get('HTTP_X_FORWARDED_FOR')
+    address = forwarded.split(',')[0].strip() if forwarded else request.META.get('REMOTE_ADDR')
+    try:
+        return str(ipaddress.ip_address(address)) if address else None
+    except ValueError:
+        return None
+
+
+class APIAccessLogMiddleware:
+    """Records method, path, status and response time of API requests into APIAccessLog."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.config = access_log_settings()
+        self.prefixes = tuple(self.config['PATH_PREFIXES'])
+        self.capture = self.config['CAPTURE_BODIES']
+        self.max_bytes = self.config['CAPTURE_MAX_BYTES']
+        self.writer = get_writer()
+
+    def __call__(self, request):
+        if not self.config['ENABLED'] or not request.path.startswith(self.prefixes):
+            return self.get_response(request)
+
+        request_data = {}
+        if self.capture:
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+            if 0 < length <= self.max_bytes:
+                # Read now: once the view has consumed the stream the body is gone
+                request_data = _capture_json(request.content_type, request.body, self.max_bytes)
+            elif length:
+                request_data = {'truncated': True, 'size': length}
+
+        started = time.perf_counter()
+        response = self.get_response(request)
+        elapsed = time.perf_counter() - started
+
+        response_data = {}
+        if self.capture and not response.streaming:
+            response_data = _capture_json(response.get('Content-Type', ''), response.content, self.max_bytes)
+
+        # DRF authenticates inside the view and sets request.user on this request too;
+        # user_id avoids loading the row for a token-backed user
+        user = getattr(request, 'user', None)
+        self.writer.record({
+            'user_id': user.pk if user is not None and user.is_authenticated else None,
+            'path': request.path[:PATH_MAX_LENGTH],
+            'route': route_template(getattr(request, 'resolver_match', None))[:PATH_MAX_LENGTH],
+            'method': request.method,
+            'status_code': response.status_code,
+            'response_time': elapsed,
+            'ip_address': _client_ip(request),
+            'user_agent': request.META.get('HTTP_USER_AGENT', ''),
+            'request_data': request_data,
+            'response_data': response_data,
+            'error_message': getattr(request, '_access_log_error', None),
+            'created_at': timezone.now(),
+        })
+        return response
+
+    def process_exception(self, request, exception):
+        # The 500 response is built after this; keep the reason for the log entry
+        request._access_log_error = f'{type(exception).__name__}: {exception}'[:1000]
+        return None
@@ -0,0 +1,10 @@
+from django.apps import AppConfig
+
+
+class ConsolidatedConfig(AppConfig):
+    name = 'apps.consolidated'
+    label = 'consolidated'
+
+    def ready(self):
+        # Register signal handlers and system checks
+        from . import checks, signals  # noqa: F401
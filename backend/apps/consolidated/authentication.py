@@ -0,0 +1,147 @@
+"""
+Stateless JWT authentication for the DRF API.
+
+simplejwt's JWTAuthentication loads the User row on every request, yet most
+views only look at request.user's id, role and is_staff. Tokens issued here
+carry those fields as claims, and StatelessJWTAuthentication builds
+request.user from them without a query. The result is a real User instance:
+it works in filters (`Q(owner=user)`), FK assignments and `==` checks. Every
+other field is deferred, and the first access to one loads the whole row in
+a single query (see User.refresh_from_db).
+
+Claims go stale when a user's role, staff status or activation changes.
+User.save() and User.objects.update() bump User.access_version whenever one
+of CLAIM_FIELDS changes, and deleting a user drops its cached version
+(signals.py). Each token records the version it was issued at.
+Authentication compares it against the current version, which is cached for
+ACCESS_VERSION_TTL seconds. A token whose version is behind falls back to
+loading the user from the database, so the user gets their current
+permissions.
+
+The cached versions must be shared by every process, or a change made in one
+would go unnoticed by the others until ACCESS_VERSION_TTL. The stateless
+path is therefore only enabled with a shared cache (DJANGO_CACHE_URL); the
+system check in checks.py rejects it on a per-process cache. The FastAPI
+users API bumps the same column but cannot reach Django's cache, so its
+changes take effect within ACCESS_VERSION_TTL.
+"""
+import os
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import F
+from django.db.models.base import DEFERRED
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from .models import User
+
+# User fields copied into tokens and trusted without a query
+CLAIM_FIELDS = User.CLAIM_FIELDS
+VERSION_CLAIM = 'access_version'
+
+# How long a process trusts its cached copy of a user's access version
+ACCESS_VERSION_TTL = int(os.getenv('JWT_ACCESS_VERSION_TTL', '300'))
+
+
+def _version_key(user_id) -> str:
+    return f'auth:access_version:{user_id}'
+
+
+def current_access_version(user_id) -> int:
+    """The user's access version, from the cache or (on a miss) a single-column query."""
+    key = _version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        version = User.objects.filter(pk=user_id).values_list('access_version', flat=True).first()
+        if version is None:
+            raise AuthenticationFailed(_('User not found'), code='user_not_found')
+        cache.set(key, version, ACCESS_VERSION_TTL)
+    return version
+
+
+def bump_access_version(user):
+    """
+    Increment the user's access version, so that tokens issued before stop
+    being trusted. User.save() calls it when a claim field changes.
+    """
+    User.objects.filter(pk=user.pk).update(access_version=F('access_version') + 1)
+    version = User.objects.filter(pk=user.pk).values_list('access_version', flat=True).first()
+    if version is not None:
+        user.access_version = version
+        transaction.on_commit(lambda: cache.set(_version_key(user.pk), version, ACCESS_VERSION_TTL))
+
+
+def forget_access_versions(user_ids):
+    """Drop the cached versions once the transaction commits; the next request reads the row."""
+    keys = [_version_key(user_id) for user_id in user_ids]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def add_user_claims(token, user):
+    for field in CLAIM_FIELDS:
+        token[field] = getattr(user, field)
+    token[VERSION_CLAIM] = user.access_version
+    return token
+
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """Issues token pairs carrying the claims StatelessJWTAuthentication relies on."""
+
+    @classmethod
+    def get_token(cls, user):
+        return add_user_claims(super().get_token(user), user)
+
+
+class ClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Restamps the claims from the current user on refresh, so a token issued
+    before an access change does not stay on the slow path for its whole
+    refresh lifetime.
+    """
+
+    def validate(self, attrs):
+        data = super().validate(attrs)
+        access = AccessToken(data['access'])
+        try:
+            user = User.objects.get(pk=access[api_settings.USER_ID_CLAIM])
+        except User.DoesNotExist:
+            raise AuthenticationFailed(_('User not found'), code='user_not_found')
+        data['access'] = str(add_user_claims(access, user))
+        if 'refresh' in data:
+            data['refresh'] = str(add_user_claims(RefreshToken(data['refresh']), user))
+        return data
+
+
+class StatelessJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication whose request.user comes from the token claims."""
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+
+        claims_present = VERSION_CLAIM in validated_token and all(
+            field in validated_token for field in CLAIM_FIELDS
+        )
+        if not claims_present or validated_token[VERSION_CLAIM] != current_access_version(user_id):
+            # Issued before this scheme, or the user's access changed since
+            return super().get_user(validated_token)
+
+        claims = {
+            User._meta.pk.attname: User._meta.pk.to_python(user_id),
+            'access_version': validated_token[VERSION_CLAIM],
+            **{field: validated_token[field] for field in CLAIM_FIELDS},
+        }
+        values = [claims.get(field.attname, DEFERRED) for field in User._meta.concrete_fields]
+        user = User.from_db(DEFAULT_DB_ALIAS, [field.attname for field in User._meta.concrete_fields], values)
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        return user
@@ -0,0 +1,143 @@
+"""
+Point-in-time stock levels of inventory items.
+
+An item's balance at an instant T is the sum of its transactions dated at or
+before T: purchases and transfers in add, usage, wastage and transfers out
+subtract, and adjustments carry their own sign. Replaying years of daily usage
+for every query is slow, so `manage.py snapshot_inventory_balances` stores
+InventoryBalanceSnapshot rows, each holding the balance from the transactions
+dated before its taken_at. A query starts from the item's latest snapshot at
+or before T and replays only the transactions after it. That takes two
+queries for any number of items.
+
+Snapshots are taken at midnight (TIME_ZONE) of the days an item had
+transactions. With a minimum number of transactions per snapshot, an idle
+item is not snapshotted every day. A transaction recorded with an earlier
+transaction_date drops the item's later snapshots (stock.py). The next run
+recreates them.
+"""
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from functools import reduce
+from operator import or_
+
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Trunc
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import InventoryBalanceSnapshot, InventoryTransaction
+from .stock import signed_quantity_expression
+
+
+def parse_instant(value):
+    """
+    The instant an `at` query parameter names: an ISO datetime, or a date for
+    the end of that day. None means now. Raises ValueError.
+    """
+    if not value:
+        return timezone.now()
+    # Dates first: parse_datetime() also takes a bare date, as midnight
+    day = parse_date(value)
+    at = datetime.combine(day, time.max) if day is not None else parse_datetime(value)
+    if at is None:
+        raise ValueError(f'{value!r} is not a date or datetime')
+    if timezone.is_naive(at):
+        at = timezone.make_aware(at)
+    return at
+
+
+def start_of_day(day) -> datetime:
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _latest_snapshots(item_ids, at) -> dict:
+    """{item_id: (taken_at, quantity)} of each item's latest snapshot at or before `at`."""
+    return {
+        item_id: (taken_at, quantity)
+        for item_id, taken_at, quantity in (
+            InventoryBalanceSnapshot.objects
+            .filter(item_id__in=item_ids, taken_at__lte=at)
+            .order_by('item_id', '-taken_at')
+            .distinct('item_id')
+            .values_list('item_id', 'taken_at', 'quantity')
+        )
+    }
+
+
+def _replay_filter(item_ids, snapshots) -> Q:
+    """
+    Transactions of the items from their snapshot on. Items sharing a
+    snapshot time share a condition, so that each condition is one range
+    scan of the (item, transaction_date) index.
+    """
+    starts = defaultdict(list)
+    for item_id in item_ids:
+        starts[snapshots[item_id][0] if item_id in snapshots else None].append(item_id)
+    return reduce(or_, (
+        Q(item_id__in=ids, transaction_date__gte=start) if start is not None else Q(item_id__in=ids)
+        for start, ids in starts.items()
+    ))
+
+
+def balances_at(item_ids, at) -> dict:
+    """{item_id: balance at `at`} for the given items."""
+    item_ids = list(item_ids)
+    if not item_ids:
+        return {}
+    snapshots = _latest_snapshots(item_ids, at)
+    deltas = dict(
+        InventoryTransaction.objects
+        .filter(_replay_filter(item_ids, snapshots), transaction_date__lte=at)
+        .values('item_id')
+        .annotate(delta=Sum(signed_quantity_expression()))
+        .order_by()
+        .values_list('item_id', 'delta')
+    )
+    return {
+        item_id: snapshots.get(item_id, (None, 0))[1] + deltas.get(item_id, 0)
+        for item_id in item_ids
+    }
+
+
+def balance_at(item_id, at):
+    return balances_at([item_id], at)[item_id]
+
+
+def take_snapshots(item_ids, until, min_transactions: int = 1) -> int:
+    """
+    Snapshot the given items at each midnight up to `until` (a midnight) that
+    ends a day with transactions, once at least `min_transactions` have
+    accumulated since the previous snapshot. Returns the number of snapshots
+    created.
+
+    Call it with the items' rows locked, so that no stock movement commits
+    between reading the transactions and storing the snapshots.
+    """
+    snapshots = _latest_snapshots(item_ids, until)
+    days = (
+        InventoryTransaction.objects
+        .filter(_replay_filter(item_ids, snapshots), transaction_date__lt=until)
+        .annotate(day=Trunc('transaction_date', 'day'))
+        .values('item_id', 'day')
+        .annotate(delta=Sum(signed_quantity_expression()), count=Count('id'))
+        .order_by('item_id', 'day')
+        .values_list('item_id', 'day', 'delta', 'count')
+    )
+
+    new_snapshots = []
+    running = {item_id: [quantity, 0] for item_id, (_, quantity) in snapshots.items()}
+    for item_id, day, delta, count in days:
+        state = running.setdefault(item_id, [0, 0])
+        state[0] += delta
+        state[1] += count
+        if state[1] >= min_transactions:
+            new_snapshots.append(InventoryBalanceSnapshot(
+                item_id=item_id,
+                taken_at=start_of_day(timezone.localdate(day) + timedelta(days=1)),
+                quantity=state[0],
+                transaction_count=state[1],
+            ))
+            state[1] = 0
+    InventoryBalanceSnapshot.objects.bulk_create(new_snapshots, ignore_conflicts=True)
+    return len(new_snapshots)
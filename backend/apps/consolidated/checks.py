@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Error, Tags, register
+
+STATELESS_AUTHENTICATION = 'apps.consolidated.authentication.StatelessJWTAuthentication'
+
+
+@register(Tags.security, Tags.caches)
+def check_stateless_auth_cache(app_configs, **kwargs):
+    # Access versions cached per process would let a demoted or deactivated
+    # user keep their token's claims on every other process
+    classes = getattr(settings, 'REST_FRAMEWORK', {}).get('DEFAULT_AUTHENTICATION_CLASSES', [])
+    if STATELESS_AUTHENTICATION not in classes:
+        return []
+    if not isinstance(caches['default'], LocMemCache):
+        return []
+    return [Error(
+        'StatelessJWTAuthentication needs a cache shared by all processes.',
+        hint='Set DJANGO_CACHE_URL to a Redis URL, or JWT_STATELESS_AUTH=false.',
+        obj=STATELESS_AUTHENTICATION,
+        id='consolidated.E001',
+    )]
@@ -0,0 +1,273 @@
+"""
+Consumption forecasts and days of stock remaining for inventory items.
+
+An item's consumption rate is the exponentially weighted moving average of
+its daily usage and wastage, with a half-life of
+INVENTORY_FORECAST_HALF_LIFE_DAYS. Days without consumption count as zero,
+so the rate decays while an item sits idle. Days of stock remaining is
+current_quantity / rate.
+
+The average is linear in the daily amounts, so it is updated per
+transaction without rescanning the history. With r the daily decay and
+a = 1 - r, InventoryConsumption stores per item:
+
+    weighted_rate      sum of a * r^(last_day - 1 - D) * x_D over the days D
+                       before last_day (x_D: consumption on day D)
+    last_day           latest day with consumption, still open
+    last_day_quantity  consumption on last_day so far
+    first_day          first day with consumption
+
+A transaction on last_day adds to last_day_quantity. One on a later day
+folds last_day and the idle days in between into weighted_rate. A
+backdated one adds its own term to weighted_rate. Reading the rate on day
+T folds the same way without storing. The result is divided by
+1 - r^(T - first_day), so that a short history is not biased towards zero.
+
+stock.py records consumption in the transaction that moves the stock.
+That transaction holds the item row lock, so updates of an item's state
+serialize. `manage.py rebuild_consumption_forecasts` recomputes the states
+from the transaction history with NumPy over per-item daily series. Run it
+for existing data or after changing the half-life. NumPy is imported on
+first use.
+"""
+import logging
+import uuid
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db.models import Max, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Alert, AlertRule, InventoryConsumption, InventoryItem, InventoryTransaction
+
+logger = logging.getLogger(__name__)
+
+CONSUMPTION_TYPES = ('usage', 'wastage')
+# AlertRule condition types evaluated by check_low_stock_alerts()
+LOW_STOCK_CONDITIONS = ('inventory_low', 'inventory_days_lt')
+
+
+def _decay() -> float:
+    return 0.5 ** (1 / settings.INVENTORY_FORECAST_HALF_LIFE_DAYS)
+
+
+def record_consumption(consumption: dict):
+    """
+    Fold {item_id: [(day, quantity), ...]} into the items' stored rates. Call
+    it in the transaction that records the consumption, with the items'
+    rows locked.
+    """
+    if not consumption:
+        return
+    r = _decay()
+    a = 1 - r
+    consumption = {uuid.UUID(str(item_id)): entries for item_id, entries in consumption.items()}
+    states = InventoryConsumption.objects.in_bulk(list(consumption))
+    now = timezone.now()
+    created, updated = [], []
+    for item_id, entries in consumption.items():
+        state = states.get(item_id)
+        if state is not None:
+            updated.append(state)
+        for day, quantity in entries:
+            quantity = float(quantity)
+            if state is None:
+                state = InventoryConsumption(
+                    item_id=item_id, first_day=day, last_day=day, last_day_quantity=quantity
+                )
+                created.append(state)
+            elif day == state.last_day:
+                state.last_day_quantity += quantity
+            elif day > state.last_day:
+                idle_days = (day - state.last_day).days - 1
+                state.weighted_rate = (r * state.weighted_rate + a * state.last_day_quantity) * r ** idle_days
+                state.last_day, state.last_day_quantity = day, quantity
+            else:
+                state.weighted_rate += a * r ** ((state.last_day - day).days - 1) * quantity
+                state.first_day = min(state.first_day, day)
+        state.updated_at = now
+
+    InventoryConsumption.objects.bulk_create(created)
+    InventoryConsumption.objects.bulk_update(
+        updated, ['weighted_rate', 'first_day', 'last_day', 'last_day_quantity', 'updated_at']
+    )
+
+
+def consumption_rates(states, today) -> list:
+    """
+    Daily consumption rate on `today` for each InventoryConsumption; None
+    until a day with consumption has ended.
+    """
+    import numpy as np
+
+    if not states:
+        return []
+    r = _decay()
+    weighted = np.array([state.weighted_rate for state in states])
+    last_quantity = np.array([state.last_day_quantity for state in states])
+    first = np.array([state.first_day.toordinal() for state in states])
+    last = np.array([state.last_day.toordinal() for state in states])
+    today = today.toordinal()
+
+    # Fold last_day and the idle days up to yesterday in, as record_consumption() would
+    closed = today > last
+    folded = np.where(
+        closed, (r * weighted + (1 - r) * last_quantity) * r ** np.maximum(today - last - 1, 0), weighted
+    )
+    days = np.where(closed, today - first, last - first)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rates = folded / (1 - r ** days)
+    return [float(rate) if count > 0 else None for rate, count in zip(rates, days)]
+
+
+def stock_forecasts(items, today=None) -> dict:
+    """{item.id: {'daily_consumption', 'days_of_stock'}} for the given items."""
+    items = list(items)
+    today = today or timezone.localdate()
+    states = InventoryConsumption.objects.in_bulk([item.id for item in items])
+    found = [states[item.id] for item in items if item.id in states]
+    rates = dict(zip((state.item_id for state in found), consumption_rates(found, today)))
+
+    forecasts = {}
+    for item in items:
+        rate = rates.get(item.id)
+        days = float(item.current_quantity) / rate if rate else None
+        forecasts[item.id] = {
+            'daily_consumption': round(rate, 2) if rate is not None else None,
+            'days_of_stock': round(days, 1) if days is not None else None,
+        }
+    return forecasts
+
+
+def rebuild(item_ids) -> int:
+    """Recompute the items' stored states from their transactions. Returns the states written."""
+    import numpy as np
+
+    series = list(
+        InventoryTransaction.objects
+        .filter(item_id__in=item_ids, transaction_type__in=CONSUMPTION_TYPES)
+        .annotate(day=TruncDate('transaction_date'))
+        .values('item_id', 'day')
+        .annotate(quantity=Sum('quantity'))
+        .order_by()
+        .values_list('item_id', 'day', 'quantity')
+    )
+    InventoryConsumption.objects.filter(item_id__in=item_ids).delete()
+    if not series:
+        return 0
+
+    # One row of daily consumption per item, one column per day
+    ids = sorted({item_id for item_id, _, _ in series})
+    row_of = {item_id: row for row, item_id in enumerate(ids)}
+    rows = np.array([row_of[item_id] for item_id, _, _ in series])
+    ordinals = np.array([day.toordinal() for _, day, _ in series])
+    start = ordinals.min()
+    columns = ordinals - start
+    daily = np.zeros((len(ids), columns.max() + 1))
+    np.add.at(daily, (rows, columns), np.array([float(quantity) for _, _, quantity in series]))
+    first = np.full(len(ids), daily.shape[1])
+    np.minimum.at(first, rows, columns)
+    last = np.zeros(len(ids), dtype=int)
+    np.maximum.at(last, rows, columns)
+
+    # weighted_rate: days before last_day weighted a * r^(last_day - 1 - day)
+    r = _decay()
+    age = last[:, None] - 1 - np.arange(daily.shape[1])[None, :]
+    weights = np.where(age >= 0, (1 - r) * r ** np.maximum(age, 0), 0.0)
+    weighted = (daily * weights).sum(axis=1)
+    last_quantity = daily[np.arange(len(ids)), last]
+
+    now = timezone.now()
+    InventoryConsumption.objects.bulk_create([
+        InventoryConsumption(
+            item_id=item_id,
+            weighted_rate=float(weighted[row]),
+            first_day=date.fromordinal(int(start + first[row])),
+            last_day=date.fromordinal(int(start + last[row])),
+            last_day_quantity=float(last_quantity[row]),
+            updated_at=now,
+        )
+        for row, item_id in enumerate(ids)
+    ])
+    return len(ids)
+
+
+def check_low_stock_alerts(item_ids):
+    """
+    Trigger the active low stock rules of the items, and the farm-wide ones
+    (no inventory_item) of their farms:
+
+        inventory_low      current_quantity is condition_value or less
+        inventory_days_lt  fewer than condition_value days of stock left at
+                           the item's current consumption rate
+
+    A rule that created an alert within its cooldown is skipped, whatever
+    the alert's status.
+    """
+    item_ids = list(item_ids)
+    if not item_ids:
+        return
+    rules = list(
+        AlertRule.objects
+        .filter(condition_type__in=LOW_STOCK_CONDITIONS, is_active=True)
+        .filter(
+            Q(inventory_item_id__in=item_ids) |
+            Q(inventory_item__isnull=True, farm__inventory_items__id__in=item_ids)
+        )
+        .distinct()
+    )
+    if not rules:
+        return
+
+    items = InventoryItem.objects.in_bulk(item_ids)
+    forecasts = {}
+    if any(rule.condition_type == 'inventory_days_lt' for rule in rules):
+        forecasts = stock_forecasts(items.values())
+    latest_alerts = dict(
+        Alert.objects
+        .filter(rule__in=rules)
+        .values('rule_id')
+        .annotate(latest=Max('created_at'))
+        .values_list('rule_id', 'latest')
+    )
+    now = timezone.now()
+    for rule in rules:
+        try:
+            # Skip rules that triggered within their cooldown
+            latest = latest_alerts.get(rule.id)
+            if latest is not None and latest > now - timedelta(minutes=rule.cooldown_minutes):
+                continue
+            if rule.inventory_item_id is not None:
+                candidates = [items[rule.inventory_item_id]]
+            else:
+                candidates = [item for item in items.values() if item.farm_id == rule.farm_id]
+            for item in candidates:
+                if _trigger_low_stock(rule, item, forecasts.get(item.id)):
+                    break
+        except Exception as e:
+            logger.error(f"Error checking alert rule {rule.id}: {str(e)}")
+
+
+def _trigger_low_stock(rule, item, forecast) -> bool:
+    if rule.condition_type == 'inventory_low':
+        if item.current_quantity > rule.condition_value:
+            return False
+        value = float(item.current_quantity)
+        reason = f"{item.current_quantity} {item.unit} left"
+    else:
+        days = forecast['days_of_stock']
+        if days is None or days >= rule.condition_value:
+            return False
+        value = days
+        reason = f"{days:g} days of stock left at {forecast['daily_consumption']:g} {item.unit}/day"
+
+    Alert.objects.create(
+        rule=rule,
+        status='triggered',
+        title=f"{rule.get_condition_type_display()} {rule.condition_value:g}: {item.name}",
+        message=f"{rule.name}: {item.name} has {reason}",
+        severity=rule.severity,
+        triggered_value=value
+    )
+    return True
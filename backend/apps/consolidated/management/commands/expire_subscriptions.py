@@ -0,0 +1,81 @@
+import logging
+import time
+
+from django.conf import settings
+from django.core.mail import send_mass_mail
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from apps.consolidated.models import Subscription
+from apps.consolidated.plans import invalidate_user_plan
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        'Mark subscriptions past their end date as expired and email their owners. '
+        'Run it from cron (e.g. every 5 minutes), or keep it running with --interval.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Subscriptions per UPDATE')
+        parser.add_argument('--interval', type=int, default=0,
+                            help='Keep running and sweep every this many seconds')
+        parser.add_argument('--no-notify', action='store_true', help='Do not send expiry emails')
+
+    def handle(self, *args, **options):
+        while True:
+            expired = self.sweep(options['chunk_size'], notify=not options['no_notify'])
+            self.stdout.write(f'Expired {expired} subscriptions')
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
+
+    def sweep(self, chunk_size: int, notify: bool = True) -> int:
+        now = timezone.now()
+        expired = 0
+        while True:
+            with transaction.atomic():
+                # One chunk per transaction keeps row locks short; rows another
+                # sweeper holds are skipped rather than waited for
+                chunk = list(
+                    Subscription.objects
+                    .select_for_update(skip_locked=True, of=('self',))
+                    .filter(status='active', end_date__lte=now)
+                    .order_by('end_date')
+                    .values_list('id', 'user_id', 'user__email', 'plan__name', 'end_date')[:chunk_size]
+                )
+                if not chunk:
+                    break
+                Subscription.objects.filter(id__in=[row[0] for row in chunk]).update(
+                    status='expired', is_active=False, updated_at=now
+                )
+            expired += len(chunk)
+
+            for user_id in {row[1] for row in chunk}:
+                invalidate_user_plan(user_id)
+            if notify:
+                self.notify(chunk)
+            if len(chunk) < chunk_size:
+                break
+        return expired
+
+    def notify(self, chunk):
+        messages = [
+            (
+                'Your Amazing Kuku subscription has expired',
+                f'Your {plan_name} subscription ended on {end_date:%Y-%m-%d}. '
+                f'Renew it to keep using your plan features.',
+                settings.DEFAULT_FROM_EMAIL,
+                [email],
+            )
+            for _, _, email, plan_name, end_date in chunk
+        ]
+        try:
+            # A single connection for the whole chunk
+            send_mass_mail(messages, fail_silently=False)
+        except Exception:
+            # The expiry itself is committed; a failed email is not retried
+            logger.exception('Sending %d subscription expiry emails failed', len(messages))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from apps.consolidated.forecast import rebuild
+from apps.consolidated.models import InventoryItem
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute the inventory consumption forecasts from the transaction history. '
+        'Run it once for existing data and after changing INVENTORY_FORECAST_HALF_LIFE_DAYS.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=200, help='Items per transaction')
+
+    def handle(self, *args, **options):
+        written = items = 0
+        last_id = None
+        while True:
+            with transaction.atomic():
+                # Locking the items makes stock movements on them wait until
+                # their forecasts are rewritten
+                chunk = InventoryItem.objects.select_for_update(no_key=True).order_by('id')
+                if last_id is not None:
+                    chunk = chunk.filter(id__gt=last_id)
+                item_ids = list(chunk.values_list('id', flat=True)[:options['chunk_size']])
+                if not item_ids:
+                    break
+                written += rebuild(item_ids)
+            items += len(item_ids)
+            last_id = item_ids[-1]
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {written} forecasts ({items} items checked)'))
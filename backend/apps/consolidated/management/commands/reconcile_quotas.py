@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from apps.consolidated.models import Device, Farm, UserQuotaUsage
+
+
+class Command(BaseCommand):
+    help = 'Recount farms and devices per user and fix drifted quota counters.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report drift without changing anything')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            # Locked first: creates and deletes wait on their counter until the recount is in
+            usages = {usage.user_id: usage for usage in UserQuotaUsage.objects.select_for_update()}
+            farms = dict(Farm.objects.values_list('owner_id').annotate(n=Count('id')).order_by())
+            devices = dict(Device.objects.values_list('farm__owner_id').annotate(n=Count('id')).order_by())
+            drifted, missing = [], []
+            for user_id in usages.keys() | farms.keys() | devices.keys():
+                farm_count, device_count = farms.get(user_id, 0), devices.get(user_id, 0)
+                usage = usages.get(user_id)
+                if usage is None:
+                    missing.append(UserQuotaUsage(user_id=user_id, farm_count=farm_count, device_count=device_count))
+                elif (usage.farm_count, usage.device_count) != (farm_count, device_count):
+                    self.stdout.write(
+                        f'{user_id}: farms {usage.farm_count} -> {farm_count}, '
+                        f'devices {usage.device_count} -> {device_count}'
+                    )
+                    usage.farm_count, usage.device_count = farm_count, device_count
+                    drifted.append(usage)
+
+            if not options['dry_run']:
+                UserQuotaUsage.objects.bulk_update(drifted, ['farm_count', 'device_count'])
+                UserQuotaUsage.objects.bulk_create(missing)
+
+        action = 'Would fix' if options['dry_run'] else 'Fixed'
+        self.stdout.write(self.style.SUCCESS(
+            f'{action} {len(drifted)} drifted and {len(missing)} missing counters '
+            f'({len(usages)} checked)'
+        ))
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from apps.consolidated.balances import start_of_day, take_snapshots
+from apps.consolidated.models import InventoryItem
+
+
+class Command(BaseCommand):
+    help = (
+        'Store inventory balance snapshots for point-in-time stock queries. '
+        'Run it daily from cron; the first run backfills the full history.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-transactions', type=int, default=1,
+                            help='Transactions an item needs since its last snapshot to get a new one')
+        parser.add_argument('--until', help='Snapshot up to the start of this date (default: today)')
+        parser.add_argument('--chunk-size', type=int, default=200, help='Items per transaction')
+
+    def handle(self, *args, **options):
+        until = timezone.localdate()
+        if options['until']:
+            until = parse_date(options['until'])
+            if until is None:
+                raise CommandError('--until must be a date (YYYY-MM-DD)')
+        until = start_of_day(until)
+
+        created = items = 0
+        last_id = None
+        while True:
+            with transaction.atomic():
+                # Locking the items makes stock movements on them wait until
+                # the snapshots are stored
+                chunk = InventoryItem.objects.select_for_update(no_key=True).order_by('id')
+                if last_id is not None:
+                    chunk = chunk.filter(id__gt=last_id)
+                item_ids = list(chunk.values_list('id', flat=True)[:options['chunk_size']])
+                if not item_ids:
+                    break
+                created += take_snapshots(item_ids, until, max(options['min_transactions'], 1))
+            items += len(item_ids)
+            last_id = item_ids[-1]
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {created} snapshots up to {until:%Y-%m-%d %H:%M %Z} ({items} items checked)'
+        ))
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consolidated', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='access_version',
+            field=models.PositiveIntegerField(default=0, help_text='Bumped when role, staff status, activation or farm access changes; older tokens are re-checked'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:16
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consolidated', '0002_user_access_version'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='apiaccesslog',
+            name='created_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:20
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consolidated', '0003_apiaccesslog_created_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='apiaccesslog',
+            name='route',
+            field=models.CharField(blank=True, default='', help_text='URL pattern the path matched', max_length=255),
+        ),
+        migrations.CreateModel(
+            name='APIAccessRollup',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('route', models.CharField(max_length=255)),
+                ('method', models.CharField(max_length=10)),
+                ('status_class', models.CharField(help_text='2xx, 3xx, 4xx or 5xx', max_length=3)),
+                ('period', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=4)),
+                ('period_start', models.DateTimeField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('error_count', models.PositiveIntegerField(default=0, help_text='5xx responses and unhandled exceptions')),
+                ('total_time', models.FloatField(default=0, help_text='Sum of response times in seconds')),
+                ('max_time', models.FloatField(default=0, help_text='Slowest response time in seconds')),
+                ('p50_ms', models.FloatField(default=0)),
+                ('p95_ms', models.FloatField(default=0)),
+                ('p99_ms', models.FloatField(default=0)),
+                ('latency_sketch', models.JSONField(default=dict, help_text='Mergeable response time sketch in milliseconds')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['-period_start'],
+                'indexes': [models.Index(fields=['period', 'period_start'], name='consolidate_period_876b41_idx')],
+                'constraints': [models.UniqueConstraint(fields=('route', 'method', 'status_class', 'period', 'period_start'), name='unique_api_access_rollup')],
+            },
+        ),
+    ]
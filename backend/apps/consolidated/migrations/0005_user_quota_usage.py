@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:22
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consolidated', '0004_api_access_rollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserQuotaUsage',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='quota_usage', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('farm_count', models.PositiveIntegerField(default=0)),
+                ('device_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:30
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consolidated', '0006_subscription_status_end_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventoryBalanceSnapshot',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('taken_at', models.DateTimeField()),
+                ('quantity', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('transaction_count', models.PositiveIntegerField(default=0, help_text='Transactions since the previous snapshot')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-taken_at'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='inventorytransaction',
+            index=models.Index(fields=['item', 'transaction_date'], name='consolidate_item_id_a426a0_idx'),
+        ),
+        migrations.AddField(
+            model_name='inventorybalancesnapshot',
+            name='item',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_snapshots', to='consolidated.inventoryitem'),
+        ),
+        migrations.AddConstraint(
+            model_name='inventorybalancesnapshot',
+            constraint=models.UniqueConstraint(fields=('item', 'taken_at'), name='unique_inventory_balance_snapshot'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consolidated', '0007_inventory_balance_snapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventoryConsumption',
+            fields=[
+                ('item', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='consumption', serialize=False, to='consolidated.inventoryitem')),
+                ('weighted_rate', models.FloatField(default=0, help_text='Weighted daily consumption over the days before last_day')),
+                ('first_day', models.DateField(help_text='First day with consumption')),
+                ('last_day', models.DateField(help_text='Latest day with consumption')),
+                ('last_day_quantity', models.FloatField(default=0, help_text='Consumption on last_day so far')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consolidated', '0008_inventory_consumption'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='user',
+            name='access_version',
+            field=models.PositiveIntegerField(default=0, help_text='Bumped when role, staff status or activation changes; older tokens are re-checked'),
+        ),
+    ]
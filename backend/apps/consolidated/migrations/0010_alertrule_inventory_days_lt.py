@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consolidated', '0009_user_access_version_help_text'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='alertrule',
+            name='condition_type',
+            field=models.CharField(choices=[('temperature_gt', 'Temperature >'), ('temperature_lt', 'Temperature <'), ('humidity_gt', 'Humidity >'), ('humidity_lt', 'Humidity <'), ('feed_level_lt', 'Feed Level <'), ('water_level_lt', 'Water Level <'), ('inventory_low', 'Inventory Low'), ('inventory_days_lt', 'Days of Stock <'), ('inventory_expired', 'Inventory Expired')], max_length=20),
+        ),
+    ]
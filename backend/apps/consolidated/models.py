@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser, BaseUserManager
 from django.utils.translation import gettext_lazy as _
 from django.core.validators import MinValueValidator, MaxValueValidator
@@ -8,7 +8,20 @@ from django.contrib.contenttypes.models import ContentType
 import uuid
 
 # Core Models
-class UserManager(BaseUserManager):
+class UserQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        # Bulk claim changes invalidate outstanding tokens, as User.save() does
+        if 'access_version' in kwargs or not set(kwargs).intersection(User.CLAIM_FIELDS):
+            return super().update(**kwargs)
+        from .authentication import forget_access_versions
+        with transaction.atomic():
+            user_ids = list(self.values_list('pk', flat=True))
+            rows = super().update(access_version=models.F('access_version') + 1, **kwargs)
+            forget_access_versions(user_ids)
+        return rows
+
+
+class UserManager(BaseUserManager.from_queryset(UserQuerySet)):
     def create_user(self, email, password=None, **extra_fields):
         if not email:
             raise ValueError('The Email field must be set')
@@ -37,6 +50,10 @@ class User(AbstractUser):
     role = models.CharField(max_length=20, choices=ROLE_CHOICES, default='farmer')
     address = models.TextField(blank=True, null=True)
     profile_picture = models.URLField(blank=True, null=True)
+    access_version = models.PositiveIntegerField(
+        default=0,
+        help_text='Bumped when role, staff status or activation changes; older tokens are re-checked'
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -45,9 +62,89 @@ class User(AbstractUser):
     
     objects = UserManager()
     
+    # Fields copied into JWT claims (authentication.py); changing one bumps access_version
+    CLAIM_FIELDS = ('role', 'is_staff', 'is_superuser', 'is_active')
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        user = super().from_db(db, field_names, values)
+        # The claim values as stored, to tell in save() whether they changed
+        user._stored_claims = {
+            name: value for name, value in zip(field_names, values)
+            if name in cls.CLAIM_FIELDS and value is not models.DEFERRED
+        }
+        return user
+    
+    def _changed_claims(self, update_fields=None):
+        if self._state.adding:
+            return False
+        fields = set(self.CLAIM_FIELDS) - self.get_deferred_fields()
+        if update_fields is not None:
+            fields &= set(update_fields)
+        if not fields:
+            return False
+        stored = getattr(self, '_stored_claims', {})
+        missing = fields - set(stored)
+        if missing:
+            # Not loaded from the database; compare with the row
+            row = type(self)._base_manager.filter(pk=self.pk).values(*missing).first()
+            if row is None:
+                return False
+            stored = {**stored, **row}
+        return any(getattr(self, field) != stored[field] for field in fields)
+    
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if not self._changed_claims(update_fields):
+            super().save(*args, **kwargs)
+        else:
+            from .authentication import bump_access_version
+            with transaction.atomic(using=kwargs.get('using')):
+                super().save(*args, **kwargs)
+                bump_access_version(self)
+        deferred_fields = self.get_deferred_fields()
+        self._stored_claims = {
+            **getattr(self, '_stored_claims', {}),
+            **{
+                field: getattr(self, field) for field in self.CLAIM_FIELDS
+                if (update_fields is None or field in update_fields) and field not in deferred_fields
+            },
+        }
+    
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        # Touching one deferred field loads all of them in a single query; the
+        # token-backed request.user defers everything but its claims
+        if fields is not None:
+            fields = set(fields)
+            deferred_fields = self.get_deferred_fields()
+            if fields.intersection(deferred_fields):
+                fields = fields.union(deferred_fields)
+        super().refresh_from_db(using, fields, **kwargs)
+        deferred_fields = self.get_deferred_fields()
+        self._stored_claims = {
+            **getattr(self, '_stored_claims', {}),
+            **{
+                field: getattr(self, field) for field in self.CLAIM_FIELDS
+                if (fields is None or field in fields) and field not in deferred_fields
+            },
+        }
+    
     def __str__(self):
         return self.email
 
+class UserQuotaUsage(models.Model):
+    """
+    Running counts of a user's farms and devices, checked against their plan's
+    max_farms / max_devices without counting rows (see quotas.py).
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='quota_usage')
+    farm_count = models.PositiveIntegerField(default=0)
+    device_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.user_id}: {self.farm_count} farms, {self.device_count} devices"
+
 # Farms App Models
 class Farm(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -166,6 +263,11 @@ class SubscriptionPlan(models.Model):
     def __str__(self):
         return f"{self.get_plan_type_display()} Plan"
 
+class SubscriptionQuerySet(models.QuerySet):
+    def valid(self):
+        """Same as Subscription.is_valid, on stored fields (still checks end_date between sweeps)."""
+        return self.filter(status='active', is_active=True, end_date__gt=timezone.now())
+
 class Subscription(models.Model):
     STATUS_CHOICES = [
         ('active', 'Active'),
@@ -184,6 +286,14 @@ class Subscription(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = SubscriptionQuerySet.as_manager()
+    
+    class Meta:
+        indexes = [
+            # The expiry sweep: status='active' AND end_date <= now
+            models.Index(fields=['status', 'end_date'], name='subscription_status_end_idx'),
+        ]
+    
     @property
     def is_valid(self):
         return self.is_active and self.status == 'active' and self.end_date > timezone.now()
@@ -296,24 +406,55 @@ class InventoryTransaction(models.Model):
         if self.unit_price is not None:
             self.total_amount = self.quantity * self.unit_price
         
-        # Update inventory item quantity
-        if not self.pk:  # Only for new transactions
-            if self.transaction_type in ['purchase', 'transfer_in']:
-                self.item.current_quantity += self.quantity
-            elif self.transaction_type in ['usage', 'wastage', 'transfer_out']:
-                self.item.current_quantity -= self.quantity
-            
-            # Ensure quantity doesn't go below zero
-            if self.item.current_quantity < 0:
-                self.item.current_quantity = 0
-            
-            self.item.save()
-        
+        # Stock levels are not touched here: stock.record_transaction() moves
+        # the item's current_quantity atomically with the ledger row
         super().save(*args, **kwargs)
     
+    class Meta:
+        # Balance replays read an item's transactions by date (balances.py)
+        indexes = [models.Index(fields=['item', 'transaction_date'])]
+    
     def __str__(self):
         return f"{self.get_transaction_type_display()} - {self.quantity} of {self.item.name}"
 
+class InventoryConsumption(models.Model):
+    """
+    Exponentially weighted daily consumption (usage and wastage) of an item,
+    updated with each transaction instead of recomputed from the history
+    (see forecast.py).
+    """
+    item = models.OneToOneField(InventoryItem, on_delete=models.CASCADE, primary_key=True, related_name='consumption')
+    weighted_rate = models.FloatField(default=0, help_text='Weighted daily consumption over the days before last_day')
+    first_day = models.DateField(help_text='First day with consumption')
+    last_day = models.DateField(help_text='Latest day with consumption')
+    last_day_quantity = models.FloatField(default=0, help_text='Consumption on last_day so far')
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.item_id}: {self.weighted_rate:.2f}/day up to {self.last_day}"
+
+class InventoryBalanceSnapshot(models.Model):
+    """
+    An item's stock level computed from its transactions dated before
+    taken_at, so that point-in-time balances replay only the transactions
+    after the nearest snapshot (see balances.py).
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    item = models.ForeignKey(InventoryItem, on_delete=models.CASCADE, related_name='balance_snapshots')
+    taken_at = models.DateTimeField()
+    quantity = models.DecimalField(max_digits=10, decimal_places=2)
+    transaction_count = models.PositiveIntegerField(default=0, help_text='Transactions since the previous snapshot')
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-taken_at']
+        constraints = [
+            models.UniqueConstraint(fields=['item', 'taken_at'], name='unique_inventory_balance_snapshot'),
+        ]
+    
+    def __str__(self):
+        return f"{self.item_id} at {self.taken_at:%Y-%m-%d %H:%M}: {self.quantity}"
+
 # Alerts App Models
 class AlertRule(models.Model):
     CONDITION_TYPES = [
@@ -324,6 +465,7 @@ class AlertRule(models.Model):
         ('feed_level_lt', 'Feed Level <'),
         ('water_level_lt', 'Water Level <'),
         ('inventory_low', 'Inventory Low'),
+        ('inventory_days_lt', 'Days of Stock <'),
         ('inventory_expired', 'Inventory Expired'),
     ]
     
@@ -430,6 +572,7 @@ class APIAccessLog(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='api_access_logs')
     path = models.CharField(max_length=255)
+    route = models.CharField(max_length=255, blank=True, default='', help_text='URL pattern the path matched')
     method = models.CharField(max_length=10)
     status_code = models.PositiveSmallIntegerField()
     response_time = models.FloatField(help_text='Response time in seconds')
@@ -438,10 +581,51 @@ class APIAccessLog(models.Model):
     request_data = models.JSONField(default=dict, blank=True)
     response_data = models.JSONField(default=dict, blank=True)
     error_message = models.TextField(blank=True, null=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Set by the access log writer to the request time; rows are inserted later in batches
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
     
     class Meta:
         ordering = ['-created_at']
     
     def __str__(self):
         return f"{self.method} {self.path} - {self.status_code} ({self.response_time}s)"
+
+class APIAccessRollup(models.Model):
+    """
+    Per-route aggregate of APIAccessLog over an hour or a day, kept up to date
+    by the access log writer. Day rows let reports over weeks read a handful
+    of rows per route.
+    """
+    PERIODS = [
+        ('hour', 'Hour'),
+        ('day', 'Day'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    route = models.CharField(max_length=255)
+    method = models.CharField(max_length=10)
+    status_class = models.CharField(max_length=3, help_text='2xx, 3xx, 4xx or 5xx')
+    period = models.CharField(max_length=4, choices=PERIODS)
+    period_start = models.DateTimeField()
+    count = models.PositiveIntegerField(default=0)
+    error_count = models.PositiveIntegerField(default=0, help_text='5xx responses and unhandled exceptions')
+    total_time = models.FloatField(default=0, help_text='Sum of response times in seconds')
+    max_time = models.FloatField(default=0, help_text='Slowest response time in seconds')
+    p50_ms = models.FloatField(default=0)
+    p95_ms = models.FloatField(default=0)
+    p99_ms = models.FloatField(default=0)
+    latency_sketch = models.JSONField(default=dict, help_text='Mergeable response time sketch in milliseconds')
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['-period_start']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['route', 'method', 'status_class', 'period', 'period_start'],
+                name='unique_api_access_rollup'
+            ),
+        ]
+        indexes = [models.Index(fields=['period', 'period_start'])]
+    
+    def __str__(self):
+        return f"{self.method} {self.route} {self.status_class} {self.period} {self.period_start:%Y-%m-%d %H:00} ({self.count})"
@@ -0,0 +1,78 @@
+"""
+Cached lookup of a user's active subscription plan.
+
+Rate limiting and quota checks run on hot paths, so the plan type and
+limits are cached per user. An entry lasts settings.PLAN_CACHE_TTL seconds,
+and never past the subscription's end date. The user's entry is dropped when one of
+their subscriptions is saved or deleted (signals.py). Saving a
+SubscriptionPlan bumps a generation number that is part of every key, which
+drops all entries at once. Code that changes subscriptions with bulk UPDATEs
+must call invalidate_user_plan() itself.
+
+Invalidation only reaches other processes through a shared cache
+(DJANGO_CACHE_URL). With the default per-process cache the others keep a
+stale plan until their entry expires, so PLAN_CACHE_TTL defaults to 30
+seconds instead of 300.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import Subscription, SubscriptionPlan
+
+_GENERATION_KEY = 'plans:generation'
+
+
+def _plan_key(user_id) -> str:
+    return f'plans:active:{cache.get(_GENERATION_KEY, 0)}:{user_id}'
+
+
+def _limits(plan_type, max_farms, max_devices) -> dict:
+    return {'plan_type': plan_type, 'max_farms': max_farms, 'max_devices': max_devices}
+
+
+def active_plan(user_id) -> dict:
+    """
+    {'plan_type', 'max_farms', 'max_devices'} of the user's active subscription.
+    Without one, plan_type is 'none' and the limits are those of the active
+    free plan, or None (unlimited) if there is no such plan.
+    """
+    key = _plan_key(user_id)
+    plan = cache.get(key)
+    if plan is None:
+        now = timezone.now()
+        ttl = settings.PLAN_CACHE_TTL
+        active = (
+            Subscription.objects.valid()
+            .filter(user_id=user_id)
+            .order_by('-end_date')
+            .values_list('plan__plan_type', 'plan__max_farms', 'plan__max_devices', 'end_date')
+            .first()
+        )
+        if active is not None:
+            plan_type, max_farms, max_devices, end_date = active
+            plan = _limits(plan_type, max_farms, max_devices)
+            # Expire with the subscription, even if nothing saves it
+            ttl = max(1, min(settings.PLAN_CACHE_TTL, int((end_date - now).total_seconds())))
+        else:
+            free = (
+                SubscriptionPlan.objects
+                .filter(plan_type='free', is_active=True)
+                .values_list('max_farms', 'max_devices')
+                .first()
+            )
+            plan = _limits('none', *(free or (None, None)))
+        cache.set(key, plan, ttl)
+    return plan
+
+
+def invalidate_user_plan(user_id):
+    cache.delete(_plan_key(user_id))
+
+
+def invalidate_all_plans():
+    try:
+        cache.incr(_GENERATION_KEY)
+    except ValueError:
+        # Not set yet (or evicted): any value other than the current default works
+        cache.set(_GENERATION_KEY, int(timezone.now().timestamp()), None)
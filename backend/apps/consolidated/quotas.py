@@ -0,0 +1,78 @@
+"""
+Subscription quotas for farms and devices.
+
+Each user has a UserQuotaUsage row with running farm and device counts.
+Devices count against the owner of their farm. reserve() checks the count
+against the plan's limit and increments it in a single conditional UPDATE.
+The check therefore needs no COUNT over the farm or device tables, and
+concurrent creates cannot overshoot the limit. The plan limits come from
+the cached lookup in plans.py. Call reserve() in the same transaction that
+creates the object, so that a failed create gives the slot back; call
+release() when objects are deleted. Farms changing owner and devices moving
+to another owner's farm release on the old owner and reserve on the new one.
+The views lock the farm rows involved, so that a farm's device count does not
+change while it is being moved or released.
+
+The row is seeded from the real counts the first time a user needs it.
+Objects created or deleted outside the API (admin, shell, cascades from
+other models) are not counted. `manage.py reconcile_quotas` corrects that
+drift.
+"""
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from .models import Device, Farm, UserQuotaUsage
+from .plans import active_plan
+
+# resource -> (counter field, plan limit)
+RESOURCES = {
+    'farm': ('farm_count', 'max_farms'),
+    'device': ('device_count', 'max_devices'),
+}
+
+
+class QuotaExceeded(APIException):
+    status_code = status.HTTP_403_FORBIDDEN
+    default_detail = 'Your subscription plan does not allow more of these.'
+    default_code = 'quota_exceeded'
+
+
+def actual_counts(user_id) -> dict:
+    return {
+        'farm_count': Farm.objects.filter(owner_id=user_id).count(),
+        'device_count': Device.objects.filter(farm__owner_id=user_id).count(),
+    }
+
+
+def reserve(user_id, resource: str, exempt: bool = False, amount: int = 1):
+    """Count `amount` more farms/devices for the user, or raise QuotaExceeded past the plan limit."""
+    if amount <= 0:
+        return
+    field, limit_name = RESOURCES[resource]
+    limit = None if exempt else active_plan(user_id)[limit_name]
+
+    usage = UserQuotaUsage.objects.filter(user_id=user_id)
+    if limit is not None:
+        usage = usage.filter(**{f'{field}__lte': limit - amount})
+    increment = {field: F(field) + amount, 'updated_at': timezone.now()}
+    if usage.update(**increment):
+        return
+
+    # No row yet, or at the limit
+    UserQuotaUsage.objects.get_or_create(user_id=user_id, defaults=actual_counts(user_id))
+    if usage.update(**increment):
+        return
+    raise QuotaExceeded(f'Your subscription plan allows at most {limit} {resource}s.')
+
+
+def release(user_id, resource: str, amount: int = 1):
+    """Uncount `amount` deleted farms/devices of the user."""
+    if amount <= 0:
+        return
+    field, _ = RESOURCES[resource]
+    UserQuotaUsage.objects.filter(user_id=user_id).update(
+        **{field: Greatest(F(field) - amount, 0), 'updated_at': timezone.now()}
+    )
@@ -0,0 +1,188 @@
+"""
+API access rollups.
+
+The access log writer hands every flushed batch to record_batch(). It
+aggregates the batch per (route, method, status class, hour) and merges it
+into the APIAccessRollup rows: counts, timing totals and a mergeable latency
+sketch, with p50/p95/p99 precomputed per row. The same goes into one row per
+day. slowest_routes() merges the day rows of a window, so a week of traffic
+is a few rows per route instead of millions of log entries.
+"""
+import logging
+import re
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import IntegrityError, OperationalError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import APIAccessRollup
+from .sketch import LatencySketch
+
+logger = logging.getLogger(__name__)
+
+UNMATCHED_ROUTE = '<unmatched>'
+MERGE_ATTEMPTS = 3
+
+_NAMED_GROUP = re.compile(r'\(\?P<(\w+)>[^)]*\)')
+
+
+def route_template(resolver_match) -> str:
+    """'api/^farms/(?P<pk>[^/.]+)/$' -> 'api/farms/{pk}/'."""
+    if resolver_match is None or not resolver_match.route:
+        return UNMATCHED_ROUTE
+    route = _NAMED_GROUP.sub(r'{\1}', resolver_match.route)
+    route = route.replace('^', '').replace('$', '').replace('\\', '').replace('/?', '/')
+    return '/' + route.lstrip('/')
+
+
+def status_class(status_code: int) -> str:
+    return f'{status_code // 100}xx'
+
+
+class _Aggregate:
+    __slots__ = ('count', 'error_count', 'total_time', 'max_time', 'sketch')
+
+    def __init__(self):
+        self.count = 0
+        self.error_count = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.sketch = LatencySketch()
+
+
+def _day_start(moment):
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _aggregate(batch) -> dict:
+    aggregates = defaultdict(_Aggregate)
+    for entry in batch:
+        hour = entry['created_at'].replace(minute=0, second=0, microsecond=0)
+        route_key = (entry['route'] or UNMATCHED_ROUTE, entry['method'], status_class(entry['status_code']))
+        for key in ((*route_key, 'hour', hour), (*route_key, 'day', _day_start(hour))):
+            aggregate = aggregates[key]
+            aggregate.count += 1
+            if entry['status_code'] >= 500 or entry['error_message']:
+                aggregate.error_count += 1
+            aggregate.total_time += entry['response_time']
+            aggregate.max_time = max(aggregate.max_time, entry['response_time'])
+            aggregate.sketch.add(entry['response_time'] * 1000)
+    return aggregates
+
+
+def _set_percentiles(rollup, sketch: LatencySketch):
+    # A bucket estimate can land just above the true maximum
+    max_ms = rollup.max_time * 1000
+    rollup.latency_sketch = sketch.to_json()
+    rollup.p50_ms = min(sketch.quantile(0.50), max_ms)
+    rollup.p95_ms = min(sketch.quantile(0.95), max_ms)
+    rollup.p99_ms = min(sketch.quantile(0.99), max_ms)
+
+
+def _merge(aggregates: dict):
+    keys_filter = Q()
+    for route, method, status, period, period_start in aggregates:
+        keys_filter |= Q(route=route, method=method, status_class=status, period=period, period_start=period_start)
+
+    now = timezone.now()
+    with transaction.atomic():
+        existing = {
+            (rollup.route, rollup.method, rollup.status_class, rollup.period, rollup.period_start): rollup
+            # Locked in key order, so that concurrent merges of overlapping
+            # batches wait for each other instead of deadlocking
+            for rollup in APIAccessRollup.objects.select_for_update().filter(keys_filter).order_by(
+                'route', 'method', 'status_class', 'period', 'period_start'
+            )
+        }
+        updated, created = [], []
+        for key, aggregate in sorted(aggregates.items(), key=lambda item: item[0]):
+            rollup = existing.get(key)
+            if rollup is None:
+                route, method, status, period, period_start = key
+                rollup = APIAccessRollup(
+                    route=route, method=method, status_class=status, period=period, period_start=period_start
+                )
+                sketch = aggregate.sketch
+                created.append(rollup)
+            else:
+                sketch = LatencySketch.from_json(rollup.latency_sketch).merge(aggregate.sketch)
+                updated.append(rollup)
+            rollup.count += aggregate.count
+            rollup.error_count += aggregate.error_count
+            rollup.total_time += aggregate.total_time
+            rollup.max_time = max(rollup.max_time, aggregate.max_time)
+            # bulk_update skips auto_now
+            rollup.updated_at = now
+            _set_percentiles(rollup, sketch)
+
+        APIAccessRollup.objects.bulk_create(created)
+        APIAccessRollup.objects.bulk_update(updated, [
+            'count', 'error_count', 'total_time', 'max_time',
+            'p50_ms', 'p95_ms', 'p99_ms', 'latency_sketch', 'updated_at',
+        ])
+
+
+def record_batch(batch):
+    """Access log flush listener: fold a batch of log entries into the rollups."""
+    aggregates = _aggregate(batch)
+    if not aggregates:
+        return
+    for attempt in range(1, MERGE_ATTEMPTS + 1):
+        try:
+            _merge(aggregates)
+            return
+        except (IntegrityError, OperationalError) as e:
+            # IntegrityError: another process created one of the rows first; it
+            # is there to lock now. OperationalError: a deadlock or serialization
+            # failure rolled the merge back. Either way the batch can be retried
+            if attempt == MERGE_ATTEMPTS:
+                raise
+            logger.warning('Retrying API access rollup merge after %s', type(e).__name__)
+
+
+def slowest_routes(days: int = 7, limit: int = 10, order_by: str = 'p95_ms', method: str = None) -> list:
+    """
+    Routes of the last `days` days (today included) ordered by a latency
+    percentile (or count/errors), slowest first.
+    """
+    since = _day_start(timezone.now()) - timedelta(days=days - 1)
+    rows = APIAccessRollup.objects.filter(period='day', period_start__gte=since)
+    if method:
+        rows = rows.filter(method=method.upper())
+
+    merged = {}
+    for route, row_method, count, error_count, total_time, max_time, sketch in rows.values_list(
+        'route', 'method', 'count', 'error_count', 'total_time', 'max_time', 'latency_sketch'
+    ).iterator(chunk_size=2000):
+        summary = merged.get((route, row_method))
+        if summary is None:
+            summary = merged[(route, row_method)] = {
+                'count': 0, 'error_count': 0, 'total_time': 0.0, 'max_time': 0.0, 'sketch': LatencySketch()
+            }
+        summary['count'] += count
+        summary['error_count'] += error_count
+        summary['total_time'] += total_time
+        summary['max_time'] = max(summary['max_time'], max_time)
+        summary['sketch'].merge_json(sketch)
+
+    results = []
+    for (route, row_method), summary in merged.items():
+        sketch = summary['sketch']
+        max_ms = summary['max_time'] * 1000
+        results.append({
+            'route': route,
+            'method': row_method,
+            'count': summary['count'],
+            'error_count': summary['error_count'],
+            'error_rate': round(summary['error_count'] / summary['count'], 4) if summary['count'] else 0.0,
+            'avg_ms': round(summary['total_time'] / summary['count'] * 1000, 2) if summary['count'] else 0.0,
+            # A bucket estimate can land just above the true maximum
+            'p50_ms': round(min(sketch.quantile(0.50), max_ms), 2),
+            'p95_ms': round(min(sketch.quantile(0.95), max_ms), 2),
+            'p99_ms': round(min(sketch.quantile(0.99), max_ms), 2),
+            'max_ms': round(max_ms, 2),
+        })
+    results.sort(key=lambda result: result[order_by], reverse=True)
+    return results[:limit]
@@ -2,6 +2,8 @@ from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from django.contrib.auth.hashers import make_password
 from django.contrib.contenttypes.models import ContentType
+from .forecast import stock_forecasts
+from .stock import fits_total_amount
 from .models import (
     User, Farm, Batch, Device, SensorReading, SubscriptionPlan, 
     Subscription, Payment, InventoryCategory, InventoryItem, 
@@ -154,6 +156,23 @@ class InventoryItemSerializer(serializers.ModelSerializer):
         fields = '__all__'
         read_only_fields = ['created_at', 'updated_at', 'current_quantity']
 
+class InventoryItemForecastSerializer(InventoryItemSerializer):
+    daily_consumption = serializers.SerializerMethodField()
+    days_of_stock = serializers.SerializerMethodField()
+    
+    def _forecast(self, obj):
+        # The list view computes the forecasts of a whole page at once
+        forecasts = self.context.setdefault('forecasts', {})
+        if obj.id not in forecasts:
+            forecasts.update(stock_forecasts([obj]))
+        return forecasts[obj.id]
+    
+    def get_daily_consumption(self, obj):
+        return self._forecast(obj)['daily_consumption']
+    
+    def get_days_of_stock(self, obj):
+        return self._forecast(obj)['days_of_stock']
+
 class InventoryItemCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = InventoryItem
@@ -162,6 +181,14 @@ class InventoryItemCreateSerializer(serializers.ModelSerializer):
             'minimum_quantity', 'unit_price', 'expiry_date', 
             'batch_number', 'supplier', 'is_active'
         ]
+    
+    def update(self, instance, validated_data):
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        # Save only the edited fields: writing back the current_quantity read
+        # with the item would undo stock movements made in the meantime
+        instance.save(update_fields=[*validated_data, 'updated_at'])
+        return instance
 
 class InventoryTransactionSerializer(serializers.ModelSerializer):
     item = InventoryItemSerializer(read_only=True)
@@ -186,6 +213,24 @@ class InventoryTransactionCreateSerializer(serializers.ModelSerializer):
                 raise serializers.ValidationError("Insufficient quantity in inventory.")
         return data
 
+class InventoryTransactionBulkLineSerializer(serializers.Serializer):
+    # The item is a plain UUID: the view loads all items of a batch in one query
+    item = serializers.UUIDField()
+    transaction_type = serializers.ChoiceField(choices=InventoryTransaction.TRANSACTION_TYPES)
+    quantity = serializers.DecimalField(max_digits=10, decimal_places=2)
+    unit_price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False, allow_null=True)
+    notes = serializers.CharField(required=False, allow_blank=True)
+    reference = serializers.CharField(max_length=100, required=False, allow_blank=True, allow_null=True)
+    transaction_date = serializers.DateTimeField(required=False)
+    
+    def validate(self, data):
+        # Adjustments carry their sign; everything else is a positive amount
+        if data['transaction_type'] != 'adjustment' and data['quantity'] <= 0:
+            raise serializers.ValidationError({'quantity': 'Must be greater than zero.'})
+        if data.get('unit_price') is not None and not fits_total_amount(data['quantity'], data['unit_price']):
+            raise serializers.ValidationError({'unit_price': 'Quantity times unit price is too large.'})
+        return data
+
 # Alert Serializers
 class AlertRuleSerializer(serializers.ModelSerializer):
     recipients = UserSerializer(many=True, read_only=True)
@@ -0,0 +1,23 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .authentication import forget_access_versions
+from .models import Subscription, SubscriptionPlan, User
+from .plans import invalidate_all_plans, invalidate_user_plan
+
+
+@receiver([post_save, post_delete], sender=Subscription)
+def subscription_changed(sender, instance, **kwargs):
+    # Rate limits and quotas follow the user's active plan
+    invalidate_user_plan(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=SubscriptionPlan)
+def subscription_plan_changed(sender, instance, **kwargs):
+    invalidate_all_plans()
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    # Outstanding tokens fall back to the database lookup, which then fails
+    forget_access_versions([instance.pk])
@@ -0,0 +1,62 @@
+"""
+Mergeable latency sketch (DDSketch-style logarithmic buckets).
+
+A value v is counted in bucket ceil(log_gamma(v)), gamma = (1 + a) / (1 - a).
+Every quantile read back is then within relative error `a` of the true value
+(2% by default). Two sketches merge by adding bucket counts, so hourly
+rollups can be combined into any longer window without keeping raw samples.
+A sketch serializes to a small JSON dict of bucket index -> count.
+"""
+import math
+from collections import Counter
+from typing import Dict
+
+RELATIVE_ACCURACY = 0.02
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+LOG_GAMMA = math.log(GAMMA)
+# Anything faster than this is counted as this (milliseconds)
+MIN_VALUE = 0.01
+
+
+class LatencySketch:
+    def __init__(self, buckets: Dict[str, int] = None):
+        # Bucket indexes are kept as strings, as stored in JSON, so that loading
+        # and merging stored sketches needs no conversion
+        self.buckets = Counter(buckets or {})
+
+    @classmethod
+    def from_json(cls, data: dict) -> 'LatencySketch':
+        return cls(data)
+
+    def to_json(self) -> dict:
+        return dict(self.buckets)
+
+    @property
+    def count(self) -> int:
+        return sum(self.buckets.values())
+
+    def add(self, value: float):
+        self.buckets[str(math.ceil(math.log(max(value, MIN_VALUE)) / LOG_GAMMA))] += 1
+
+    def merge(self, other: 'LatencySketch') -> 'LatencySketch':
+        self.buckets.update(other.buckets)
+        return self
+
+    def merge_json(self, data: dict) -> 'LatencySketch':
+        """Merge a stored sketch without building a LatencySketch for it."""
+        self.buckets.update(data)
+        return self
+
+    def quantile(self, q: float) -> float:
+        """Value at quantile q (0..1), or 0.0 for an empty sketch."""
+        total = self.count
+        if not total:
+            return 0.0
+        rank = q * (total - 1)
+        seen = 0
+        for index in sorted(self.buckets, key=int):
+            seen += self.buckets[index]
+            if seen > rank:
+                break
+        # Midpoint of the bucket (gamma^(i-1), gamma^i] in relative terms
+        return 2 * GAMMA ** int(index) / (GAMMA + 1)
@@ -0,0 +1,230 @@
+"""
+Stock mutations for inventory items.
+
+Every change to InventoryItem.current_quantity goes through
+record_transaction(). It writes the ledger row and moves the balance in one
+transaction, and the balance moves in a single statement:
+
+    UPDATE ... SET current_quantity = current_quantity + %s
+    WHERE id = %s AND current_quantity + %s >= 0 RETURNING current_quantity
+
+The database applies concurrent movements one after another, so none is
+lost. A movement that would take the balance below zero matches no row and
+raises InsufficientStock, without a read or a SELECT ... FOR UPDATE first.
+The item row stays locked only until the transaction commits. The ORM's
+update() cannot return the new balance, hence the raw statement.
+
+record_transactions() does the same for a batch: the net change per item is
+applied with one UPDATE ... FROM (VALUES ...) and the ledger rows are
+written with one bulk INSERT. Each item must cover its net change; the
+order of the lines within the batch does not matter.
+
+Transactions given an explicit transaction_date drop the item's balance
+snapshots taken after that date (see balances.py). Usage and wastage also
+update the item's consumption forecast (forecast.py).
+"""
+import uuid
+from decimal import Decimal
+
+from functools import reduce
+from operator import or_
+
+from django.db import connection, transaction
+from django.db.models import Case, F, Q, When
+from django.utils import timezone
+
+from .forecast import CONSUMPTION_TYPES, record_consumption
+from .models import InventoryBalanceSnapshot, InventoryItem, InventoryTransaction
+
+INBOUND_TYPES = {'purchase', 'transfer_in'}
+OUTBOUND_TYPES = {'usage', 'wastage', 'transfer_out'}
+CENT = Decimal('0.01')
+
+
+class InsufficientStock(Exception):
+    def __init__(self, shortages: dict):
+        # item id -> quantity that could not be removed
+        self.shortages = shortages
+        super().__init__('Not enough stock of item ' + ', '.join(
+            f'{item_id} to remove {requested}' for item_id, requested in shortages.items()
+        ))
+
+
+def signed_quantity(transaction_type: str, quantity: Decimal) -> Decimal:
+    """The change in stock for a transaction; adjustments carry their own sign."""
+    if transaction_type in INBOUND_TYPES:
+        return quantity
+    if transaction_type in OUTBOUND_TYPES:
+        return -quantity
+    return quantity
+
+
+def signed_quantity_expression(field: str = 'quantity'):
+    """signed_quantity() as an SQL expression over InventoryTransaction rows."""
+    return Case(When(transaction_type__in=OUTBOUND_TYPES, then=-F(field)), default=F(field))
+
+
+def fits_total_amount(quantity, unit_price) -> bool:
+    """Whether quantity x unit_price fits InventoryTransaction.total_amount."""
+    field = InventoryTransaction._meta.get_field('total_amount')
+    total = (Decimal(str(quantity)) * Decimal(str(unit_price))).quantize(CENT)
+    return abs(total) < 10 ** (field.max_digits - field.decimal_places)
+
+
+def _invalidate_snapshots(earliest_dates: dict):
+    # A transaction dated before an item's later snapshots changes them; they
+    # are rebuilt by the next snapshot_inventory_balances run
+    if earliest_dates:
+        InventoryBalanceSnapshot.objects.filter(reduce(or_, (
+            Q(item_id=item_id, taken_at__gt=date) for item_id, date in earliest_dates.items()
+        ))).delete()
+
+
+def _update_sql(set_unit_price: bool) -> str:
+    table = connection.ops.quote_name(InventoryItem._meta.db_table)
+    unit_price = ', unit_price = %s' if set_unit_price else ''
+    return (
+        f'UPDATE {table} SET current_quantity = current_quantity + %s, updated_at = %s{unit_price} '
+        f'WHERE id = %s AND current_quantity + %s >= 0 '
+        f'RETURNING current_quantity'
+    )
+
+
+def move_stock(item_id, delta: Decimal, unit_price: Decimal = None) -> Decimal:
+    """
+    Add `delta` (negative to remove) to the item's balance and return the new
+    balance. Call inside transaction.atomic() together with the ledger write.
+    """
+    params = [delta, timezone.now()]
+    if unit_price is not None:
+        params.append(unit_price)
+    params += [item_id, delta]
+    with connection.cursor() as cursor:
+        cursor.execute(_update_sql(unit_price is not None), params)
+        row = cursor.fetchone()
+    if row is None:
+        if not InventoryItem.objects.filter(pk=item_id).exists():
+            raise InventoryItem.DoesNotExist(f'Inventory item {item_id} does not exist')
+        raise InsufficientStock({item_id: -delta})
+    return row[0]
+
+
+def record_transaction(item, transaction_type: str, quantity, *, unit_price=None, notes='',
+                       reference=None, created_by=None, transaction_date=None,
+                       update_item_price: bool = False):
+    """
+    Create an InventoryTransaction and apply it to the item's balance atomically.
+    Returns (transaction, new balance); raises InsufficientStock.
+    """
+    # Rounded as the columns store them, so the ledger and the balance agree
+    quantity = Decimal(str(quantity)).quantize(CENT)
+    unit_price = Decimal(str(unit_price)).quantize(CENT) if unit_price is not None else None
+    item_id = getattr(item, 'pk', item)
+
+    with transaction.atomic():
+        balance = move_stock(
+            item_id,
+            signed_quantity(transaction_type, quantity),
+            unit_price if update_item_price else None,
+        )
+        stock_transaction = InventoryTransaction.objects.create(
+            item_id=item_id,
+            transaction_type=transaction_type,
+            quantity=quantity,
+            unit_price=unit_price,
+            notes=notes,
+            reference=reference,
+            created_by=created_by,
+            transaction_date=transaction_date or timezone.now(),
+        )
+        if transaction_date is not None:
+            _invalidate_snapshots({item_id: transaction_date})
+        if transaction_type in CONSUMPTION_TYPES:
+            record_consumption({item_id: [(timezone.localdate(stock_transaction.transaction_date), quantity)]})
+
+    if isinstance(item, InventoryItem):
+        item.current_quantity = balance
+        if update_item_price:
+            item.unit_price = unit_price
+    return stock_transaction, balance
+
+
+def _move_stock_bulk(deltas: dict, unit_prices: dict) -> dict:
+    """
+    Add {item_id: delta} to the items' balances and set {item_id: unit_price}.
+    Returns {item_id: new balance} for the items that had enough stock; the
+    caller rolls back when one is missing.
+    """
+    if not deltas:
+        return {}
+    table = connection.ops.quote_name(InventoryItem._meta.db_table)
+    # Sorted so that concurrent batches lock shared items in the same order
+    item_ids = sorted(deltas, key=str)
+    values = ', '.join(['(%s::uuid, %s::numeric, %s::numeric)'] * len(item_ids))
+    params = [timezone.now()]
+    for item_id in item_ids:
+        params += [item_id, deltas[item_id], unit_prices.get(item_id)]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'UPDATE {table} AS item SET current_quantity = item.current_quantity + v.delta, '
+            f'unit_price = COALESCE(v.unit_price, item.unit_price), updated_at = %s '
+            f'FROM (VALUES {values}) AS v (id, delta, unit_price) '
+            f'WHERE item.id = v.id AND item.current_quantity + v.delta >= 0 '
+            f'RETURNING item.id, item.current_quantity',
+            params,
+        )
+        return dict(cursor.fetchall())
+
+
+def record_transactions(lines, *, created_by=None):
+    """
+    Create many InventoryTransactions and apply them to the items' balances
+    in one transaction. `lines` are dicts with item_id, transaction_type,
+    quantity and optionally unit_price, notes, reference and transaction_date;
+    the items must exist. A purchase with a unit price updates the item's
+    price, as add_stock does.
+
+    Returns (transactions, {item_id: new balance}). Raises InsufficientStock
+    for the items that cannot cover their net change, and writes nothing.
+    """
+    now = timezone.now()
+    deltas, unit_prices, transactions, earliest_dates, consumption = {}, {}, [], {}, {}
+    for line in lines:
+        # UUIDs, to match the ids the UPDATE returns
+        item_id = uuid.UUID(str(line['item_id']))
+        quantity = Decimal(str(line['quantity'])).quantize(CENT)
+        unit_price = line.get('unit_price')
+        unit_price = Decimal(str(unit_price)).quantize(CENT) if unit_price is not None else None
+        deltas[item_id] = deltas.get(item_id, 0) + signed_quantity(line['transaction_type'], quantity)
+        if line['transaction_type'] == 'purchase' and unit_price is not None:
+            unit_prices[item_id] = unit_price
+        date = line.get('transaction_date')
+        if date is not None and (item_id not in earliest_dates or date < earliest_dates[item_id]):
+            earliest_dates[item_id] = date
+        if line['transaction_type'] in CONSUMPTION_TYPES:
+            day = timezone.localdate(date or now)
+            consumption.setdefault(item_id, []).append((day, quantity))
+        # bulk_create() skips save(), which computes total_amount
+        transactions.append(InventoryTransaction(
+            item_id=item_id,
+            transaction_type=line['transaction_type'],
+            quantity=quantity,
+            unit_price=unit_price,
+            total_amount=quantity * unit_price if unit_price is not None else None,
+            notes=line.get('notes', ''),
+            reference=line.get('reference'),
+            created_by=created_by,
+            transaction_date=line.get('transaction_date') or now,
+        ))
+
+    with transaction.atomic():
+        balances = _move_stock_bulk(deltas, unit_prices)
+        if len(balances) < len(deltas):
+            # Raising rolls back the items that were updated
+            raise InsufficientStock({
+                item_id: -delta for item_id, delta in deltas.items() if item_id not in balances
+            })
+        InventoryTransaction.objects.bulk_create(transactions)
+        _invalidate_snapshots(earliest_dates)
+        record_consumption(consumption)
+    return transactions, balances
@@ -0,0 +1,125 @@
+"""
+Per-user rate limiting driven by the user's subscription plan.
+
+Each client gets a token bucket. It is keyed by user id, or by IP address for
+anonymous requests. The bucket refills at the plan's requests-per-minute rate
+and holds up to its burst size. A request takes one token; with the bucket
+empty it is rejected with 429 and a Retry-After header telling the client
+when the next token arrives. Limits per plan type are in
+settings.API_RATE_LIMITS.
+
+Checking a request needs no database query in the steady state: the user's
+plan comes from the cached lookup in plans.py. A plan change reaches other
+processes only through a shared cache (DJANGO_CACHE_URL); without one they
+keep the old limits for up to PLAN_CACHE_TTL.
+
+Buckets live in process memory by default: each worker process enforces
+the limit on its own, so the effective limit is per process. With
+API_RATE_LIMIT_BACKEND='cache' they live in the Django cache named by
+API_RATE_LIMIT_CACHE instead (e.g. Redis), shared by all processes. The
+read-modify-write there is not atomic, so concurrent requests across
+processes can slightly exceed the limit.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.throttling import BaseThrottle
+
+from .plans import active_plan
+
+# (requests per minute, burst) for plan types missing from settings.API_RATE_LIMITS
+FALLBACK_LIMIT = (60, 20)
+
+
+class InMemoryBucketStore:
+    """Token buckets in this process; least recently used buckets are evicted past max_entries."""
+
+    def __init__(self, max_entries: int = 100000):
+        self.max_entries = max_entries
+        # key -> [tokens, last refill time]
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def consume(self, key: str, rate: float, burst: int):
+        """Take a token; returns (allowed, seconds until the next token if not)."""
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [float(burst), now]
+                if len(self._buckets) > self.max_entries:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(float(burst), bucket[0] + (now - bucket[1]) * rate)
+                bucket[1] = now
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return True, 0.0
+            return False, (1 - bucket[0]) / rate
+
+
+class CacheBucketStore:
+    """Token buckets in a Django cache shared by all processes (best effort, not atomic)."""
+
+    def __init__(self, alias: str = 'default'):
+        self.cache = caches[alias]
+
+    def consume(self, key: str, rate: float, burst: int):
+        now = time.time()
+        cache_key = f'throttle:bucket:{key}'
+        tokens, updated = self.cache.get(cache_key) or (float(burst), now)
+        tokens = min(float(burst), tokens + max(0.0, now - updated) * rate)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        # An idle bucket refills completely in burst / rate seconds
+        self.cache.set(cache_key, (tokens, now), int(burst / rate) + 1)
+        return allowed, 0.0 if allowed else (1 - tokens) / rate
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_bucket_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if getattr(settings, 'API_RATE_LIMIT_BACKEND', 'memory') == 'cache':
+                    _store = CacheBucketStore(getattr(settings, 'API_RATE_LIMIT_CACHE', 'default'))
+                else:
+                    _store = InMemoryBucketStore()
+    return _store
+
+
+class SubscriptionPlanRateThrottle(BaseThrottle):
+    """DRF throttle applying the request user's plan limit (see settings.API_RATE_LIMITS)."""
+
+    def __init__(self):
+        self.limits = getattr(settings, 'API_RATE_LIMITS', {})
+        self.retry_after = None
+
+    def get_limit_key(self, request):
+        user = request.user
+        if not user or not user.is_authenticated:
+            return 'anonymous', f'ip:{self.get_ident(request)}'
+        if user.is_staff:
+            return 'staff', f'user:{user.pk}'
+        return active_plan(user.pk)['plan_type'], f'user:{user.pk}'
+
+    def allow_request(self, request, view):
+        if not getattr(settings, 'API_RATE_LIMIT_ENABLED', True):
+            return True
+        plan_type, key = self.get_limit_key(request)
+        per_minute, burst = self.limits.get(plan_type) or self.limits.get('none', FALLBACK_LIMIT)
+        allowed, self.retry_after = get_bucket_store().consume(key, per_minute / 60.0, burst)
+        return allowed
+
+    def wait(self):
+        # DRF sends this as Retry-After (rounded up to whole seconds)
+        return self.retry_after
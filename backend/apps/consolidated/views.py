@@ -1,13 +1,18 @@
 from rest_framework import viewsets, status, mixins, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.parsers import JSONParser, MultiPartParser, FormParser
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import filters
+from django.db import transaction
 from django.db.models import Q, F, Count, Sum, Avg, Max, Min, DateTimeField
 from django.db.models.functions import Trunc
 from django.utils import timezone
 from datetime import timedelta
+import csv
+import io
+from decimal import Decimal, InvalidOperation
 import logging
 
 from .models import (
@@ -20,9 +25,17 @@ from .permissions import (
     IsAdminOrReadOnly, IsOwnerOrReadOnly, IsFarmerOrAdmin, 
     IsFarmOwner, IsSubscriptionOwner, IsFarmWorker, IsOwnerOrAdmin
 )
+from .balances import balance_at, balances_at, parse_instant
+from .forecast import check_low_stock_alerts, stock_forecasts
+from .quotas import reserve, release
+from .rollups import slowest_routes
+from .stock import INBOUND_TYPES, InsufficientStock, fits_total_amount, record_transaction, record_transactions
 
 logger = logging.getLogger(__name__)
 
+BULK_TRANSACTION_LIMIT = 1000
+SUMMARY_ORDERINGS = ('p50_ms', 'p95_ms', 'p99_ms', 'avg_ms', 'max_ms', 'count', 'error_count', 'error_rate')
+
 # User Views
 class UserViewSet(viewsets.ModelViewSet):
     """
@@ -113,7 +126,36 @@ class FarmViewSet(viewsets.ModelViewSet):
     
     def perform_create(self, serializer):
         # Set the current user as the owner when creating a new farm
-        serializer.save(owner=self.request.user)
+        user = self.request.user
+        with transaction.atomic():
+            reserve(user.pk, 'farm', exempt=user.is_staff)
+            serializer.save(owner=user)
+    
+    def perform_update(self, serializer):
+        # A farm given to another owner takes its devices to their quota
+        farm = serializer.instance
+        new_owner = serializer.validated_data.get('owner')
+        if new_owner is None or new_owner.pk == farm.owner_id:
+            serializer.save()
+            return
+        with transaction.atomic():
+            old_owner_id = Farm.objects.select_for_update().values_list('owner_id', flat=True).get(pk=farm.pk)
+            device_count = farm.devices.count()
+            reserve(new_owner.pk, 'farm', exempt=self.request.user.is_staff)
+            reserve(new_owner.pk, 'device', exempt=self.request.user.is_staff, amount=device_count)
+            serializer.save()
+            release(old_owner_id, 'farm')
+            release(old_owner_id, 'device', device_count)
+    
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            # The lock waits for devices being created on the farm and blocks
+            # new ones, so the count matches what the delete removes
+            owner_id = Farm.objects.select_for_update().values_list('owner_id', flat=True).get(pk=instance.pk)
+            device_count = instance.devices.count()
+            instance.delete()
+            release(owner_id, 'farm')
+            release(owner_id, 'device', device_count)
     
     @action(detail=True, methods=['post'])
     def add_worker(self, request, pk=None):
@@ -255,6 +297,44 @@ class DeviceViewSet(viewsets.ModelViewSet):
             Q(farm__workers=user)
         ).distinct()
     
+    def _lock_farm_owners(self, *farm_ids):
+        # {farm id: owner id}, with the farm rows locked in a consistent order
+        return dict(
+            Farm.objects.select_for_update(no_key=True)
+            .filter(pk__in=farm_ids)
+            .order_by('pk')
+            .values_list('pk', 'owner_id')
+        )
+    
+    def perform_create(self, serializer):
+        # Devices count against the quota of the farm's owner
+        farm = serializer.validated_data['farm']
+        with transaction.atomic():
+            owners = self._lock_farm_owners(farm.pk)
+            reserve(owners.get(farm.pk, farm.owner_id), 'device', exempt=self.request.user.is_staff)
+            serializer.save()
+    
+    def perform_update(self, serializer):
+        # A device moved to another owner's farm moves to their quota
+        device = serializer.instance
+        new_farm = serializer.validated_data.get('farm')
+        if new_farm is None or new_farm.pk == device.farm_id:
+            serializer.save()
+            return
+        with transaction.atomic():
+            owners = self._lock_farm_owners(device.farm_id, new_farm.pk)
+            old_owner_id, new_owner_id = owners[device.farm_id], owners[new_farm.pk]
+            if old_owner_id != new_owner_id:
+                reserve(new_owner_id, 'device', exempt=self.request.user.is_staff)
+                release(old_owner_id, 'device')
+            serializer.save()
+    
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            owner_id = self._lock_farm_owners(instance.farm_id)[instance.farm_id]
+            instance.delete()
+            release(owner_id, 'device')
+    
     @action(detail=True, methods=['post'])
     def update_status(self, request, pk=None):
         """
@@ -508,8 +588,23 @@ class InventoryItemViewSet(viewsets.ModelViewSet):
     def get_serializer_class(self):
         if self.action in ['create', 'update', 'partial_update']:
             return InventoryItemCreateSerializer
+        if self.action in ['list', 'retrieve']:
+            return InventoryItemForecastSerializer
         return InventoryItemSerializer
     
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        items = page if page is not None else list(queryset)
+        
+        # Consumption forecasts for all listed items in one pass
+        context = self.get_serializer_context()
+        context['forecasts'] = stock_forecasts(items)
+        serializer = self.get_serializer(items, many=True, context=context)
+        if page is not None:
+            return self.get_paginated_response(serializer.data)
+        return Response(serializer.data)
+    
     def get_queryset(self):
         # Admins can see all items, others can only see items from their farms
         user = self.request.user
@@ -538,6 +633,61 @@ class InventoryItemViewSet(viewsets.ModelViewSet):
         serializer = InventoryTransactionSerializer(transactions, many=True)
         return Response(serializer.data)
     
+    @action(detail=True, methods=['get'])
+    def balance(self, request, pk=None):
+        """
+        Stock level of this item at `at` (an ISO datetime, or a date for the
+        end of that day; default now).
+        """
+        item = self.get_object()
+        try:
+            at = parse_instant(request.query_params.get('at'))
+        except ValueError:
+            return Response(
+                {'error': 'at must be a date or datetime'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        return Response({
+            'item': str(item.id),
+            'at': at,
+            'quantity': str(balance_at(item.id, at)),
+            'unit': item.unit,
+        })
+    
+    @action(detail=False, methods=['get'])
+    def balances(self, request):
+        """
+        Stock levels of all listed items at `at`, e.g. a farm's stock on a date
+        with ?farm=<id>&at=<date>. Takes the list's filters and pagination.
+        """
+        try:
+            at = parse_instant(request.query_params.get('at'))
+        except ValueError:
+            return Response(
+                {'error': 'at must be a date or datetime'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        queryset = self.filter_queryset(self.get_queryset().order_by('name', 'id'))
+        page = self.paginate_queryset(queryset)
+        items = list(page if page is not None else queryset)
+        quantities = balances_at([item.id for item in items], at)
+        rows = [
+            {
+                'item': str(item.id),
+                'name': item.name,
+                'farm': str(item.farm_id),
+                'at': at,
+                'quantity': str(quantities[item.id]),
+                'unit': item.unit,
+            }
+            for item in items
+        ]
+        if page is not None:
+            return self.get_paginated_response(rows)
+        return Response(rows)
+    
     @action(detail=True, methods=['post'])
     def add_stock(self, request, pk=None):
         """
@@ -555,31 +705,34 @@ class InventoryItemViewSet(viewsets.ModelViewSet):
             )
         
         try:
-            quantity = float(quantity)
-            unit_price = float(unit_price)
-        except (TypeError, ValueError):
+            quantity = Decimal(str(quantity))
+            unit_price = Decimal(str(unit_price))
+        except InvalidOperation:
             return Response(
                 {'error': 'quantity and unit_price must be numbers'}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
+        if not quantity.is_finite() or quantity <= 0 or not unit_price.is_finite() or unit_price < 0:
+            return Response(
+                {'error': 'quantity must be positive and unit_price not negative'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
-        # Create the transaction
-        transaction = InventoryTransaction.objects.create(
-            item=item,
-            transaction_type='purchase',
-            quantity=quantity,
+        # Records the purchase and updates the quantity and current unit price together
+        stock_transaction, current_quantity = record_transaction(
+            item, 'purchase', quantity,
             unit_price=unit_price,
             notes=notes,
-            created_by=request.user
+            created_by=request.user,
+            update_item_price=True,
         )
         
-        # Update the item's current quantity
-        item.current_quantity += quantity
-        item.unit_price = unit_price  # Update the current unit price
-        item.save()
-        
         return Response(
-            {'status': 'stock added', 'transaction_id': str(transaction.id)},
+            {
+                'status': 'stock added',
+                'transaction_id': str(stock_transaction.id),
+                'current_quantity': str(current_quantity),
+            },
             status=status.HTTP_201_CREATED
         )
     
@@ -599,35 +752,41 @@ class InventoryItemViewSet(viewsets.ModelViewSet):
             )
         
         try:
-            quantity = float(quantity)
-        except (TypeError, ValueError):
+            quantity = Decimal(str(quantity))
+        except InvalidOperation:
             return Response(
                 {'error': 'quantity must be a number'}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
+        if not quantity.is_finite() or quantity <= 0:
+            return Response(
+                {'error': 'quantity must be positive'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
-        if quantity > item.current_quantity:
+        # The stock check happens in the same UPDATE that removes the stock,
+        # so concurrent removals cannot take the item below zero
+        try:
+            stock_transaction, current_quantity = record_transaction(
+                item, 'usage', quantity,
+                unit_price=item.unit_price,  # Use the current unit price
+                notes=notes,
+                created_by=request.user,
+            )
+        except InsufficientStock:
             return Response(
                 {'error': 'not enough stock available'}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Create the transaction
-        transaction = InventoryTransaction.objects.create(
-            item=item,
-            transaction_type='usage',
-            quantity=quantity,
-            unit_price=item.unit_price,  # Use the current unit price
-            notes=notes,
-            created_by=request.user
-        )
-        
-        # Update the item's current quantity
-        item.current_quantity -= quantity
-        item.save()
+        check_low_stock_alerts([item.id])
         
         return Response(
-            {'status': 'stock removed', 'transaction_id': str(transaction.id)},
+            {
+                'status': 'stock removed',
+                'transaction_id': str(stock_transaction.id),
+                'current_quantity': str(current_quantity),
+            },
             status=status.HTTP_201_CREATED
         )
 
@@ -653,6 +812,122 @@ class InventoryTransactionViewSet(viewsets.ReadOnlyModelViewSet):
             Q(item__farm__owner=user) | 
             Q(item__farm__workers=user)
         ).distinct()
+    
+    @action(detail=False, methods=['post'], parser_classes=[JSONParser, MultiPartParser, FormParser])
+    def bulk(self, request):
+        """
+        Record many stock movements at once, e.g. the lines of a supplier invoice.
+        Takes a JSON list of transactions (or {"transactions": [...]}), or a CSV
+        file uploaded as `file` whose header row names the same fields. Either
+        all lines are recorded or none is; errors are reported per line.
+        """
+        if 'file' in request.FILES:
+            try:
+                lines, line_numbers = _read_transactions_csv(request.FILES['file'])
+            except (UnicodeDecodeError, csv.Error) as exc:
+                return Response(
+                    {'error': f'could not read the CSV file: {exc}'}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        else:
+            lines = request.data
+            if isinstance(lines, dict):
+                lines = lines.get('transactions')
+            if not isinstance(lines, list):
+                return Response(
+                    {'error': 'send a list of transactions or a CSV file'}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            line_numbers = range(1, len(lines) + 1)
+        
+        if not lines:
+            return Response({'error': 'no transactions given'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(lines) > BULK_TRANSACTION_LIMIT:
+            return Response(
+                {'error': f'at most {BULK_TRANSACTION_LIMIT} transactions per request'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        errors = {}
+        validated = {}
+        for index, line in enumerate(lines):
+            serializer = InventoryTransactionBulkLineSerializer(data=line)
+            if serializer.is_valid():
+                validated[index] = serializer.validated_data
+            else:
+                errors[index] = serializer.errors
+        
+        # All items of the batch in one query, limited to the user's farms
+        user = request.user
+        items = InventoryItem.objects.filter(pk__in={line['item'] for line in validated.values()})
+        if not user.is_staff:
+            items = items.filter(Q(farm__owner=user) | Q(farm__workers=user)).distinct()
+        unit_prices = dict(items.values_list('id', 'unit_price'))
+        for index, line in validated.items():
+            if line['item'] not in unit_prices:
+                errors[index] = {'item': ['Inventory item not found.']}
+        
+        stock_lines = []
+        for index, line in validated.items():
+            if index in errors:
+                continue
+            unit_price = line.get('unit_price')
+            if unit_price is None and line['transaction_type'] != 'purchase':
+                # Valued at the item's current price, as in remove_stock
+                unit_price = unit_prices[line['item']]
+                if unit_price is not None and not fits_total_amount(line['quantity'], unit_price):
+                    errors[index] = {'quantity': ["Quantity times the item's unit price is too large."]}
+            stock_lines.append({**line, 'item_id': line['item'], 'unit_price': unit_price})
+        
+        if not errors:
+            try:
+                transactions, balances = record_transactions(stock_lines, created_by=user)
+            except InsufficientStock as exc:
+                for index, line in validated.items():
+                    if line['item'] in exc.shortages:
+                        errors[index] = {'quantity': ['not enough stock available']}
+        
+        if errors:
+            return Response(
+                {
+                    'error': 'no transactions were recorded',
+                    'lines': [
+                        {'line': line_numbers[index], 'errors': line_errors}
+                        for index, line_errors in sorted(errors.items())
+                    ],
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        check_low_stock_alerts({
+            line['item'] for line in validated.values() if line['transaction_type'] not in INBOUND_TYPES
+        })
+        
+        return Response(
+            {
+                'status': 'transactions recorded',
+                'count': len(transactions),
+                'transaction_ids': [str(stock_transaction.id) for stock_transaction in transactions],
+                'current_quantities': {str(item_id): str(quantity) for item_id, quantity in balances.items()},
+            },
+            status=status.HTTP_201_CREATED
+        )
+
+
+def _read_transactions_csv(upload):
+    """Rows of an uploaded CSV file as dicts without empty cells, and their line numbers."""
+    reader = csv.DictReader(io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline=''))
+    lines, line_numbers = [], []
+    for row in reader:
+        lines.append({
+            key.strip(): value.strip()
+            for key, value in row.items()
+            if isinstance(key, str) and isinstance(value, str) and value.strip()
+        })
+        line_numbers.append(reader.line_num)
+        if len(lines) > BULK_TRANSACTION_LIMIT:
+            break
+    return lines, line_numbers
 
 # Alert Rule Views
 class AlertRuleViewSet(viewsets.ModelViewSet):
@@ -808,6 +1083,37 @@ class APIAccessLogViewSet(viewsets.ReadOnlyModelViewSet):
     
     def get_queryset(self):
         return APIAccessLog.objects.all()
+    
+    @action(detail=False, methods=['get'])
+    def summary(self, request):
+        """
+        Slowest routes over the last `days` days (default 7), from the daily rollups.
+        Optional `limit` (default 10), `method`, and `order_by`
+        (p50_ms, p95_ms, p99_ms, avg_ms, max_ms, count, error_count, error_rate).
+        """
+        order_by = request.query_params.get('order_by', 'p95_ms')
+        if order_by not in SUMMARY_ORDERINGS:
+            return Response(
+                {'error': f'order_by must be one of: {", ".join(SUMMARY_ORDERINGS)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            days = int(request.query_params.get('days', 7))
+            limit = int(request.query_params.get('limit', 10))
+        except ValueError:
+            return Response(
+                {'error': 'days and limit must be integers'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        days = min(max(days, 1), 90)
+        routes = slowest_routes(
+            days=days,
+            limit=min(max(limit, 1), 100),
+            order_by=order_by,
+            method=request.query_params.get('method'),
+        )
+        return Response({'days': days, 'order_by': order_by, 'routes': routes})
 
 # Dashboard Views
 class DashboardViewSet(viewsets.ViewSet):
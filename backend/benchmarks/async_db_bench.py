@@ -0,0 +1,209 @@
+"""
+Throughput of the FastAPI database routes: synchronous Session vs AsyncSession.
+
+Seeds a user and a set of farms into the database configured by DB_* (a local
+PostgreSQL), then serves GET /api/farms/ under uvicorn in two modes and fires
+concurrent authenticated requests at it:
+
+    sync   the previous implementation: blocking Session queries inside an
+           async route, which stall the event loop for every query
+    async  the current api.farms router on the asyncpg engine
+
+On a local database every query takes well under a millisecond, so blocking
+the loop costs little. --db-latency-ms routes the API's database traffic
+through a proxy that delays every reply, like a managed database in another
+network.
+
+Usage (from the backend directory):
+    python benchmarks/async_db_bench.py [--clients 50] [--requests 2000] [--farms 100] [--db-latency-ms 2]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+
+import aiohttp
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from fastapi import Depends, FastAPI, HTTPException  # noqa: E402
+from jose import jwt  # noqa: E402
+
+import database  # noqa: E402
+from api import schemas  # noqa: E402
+from api.auth import ALGORITHM, SECRET_KEY, create_access_token, oauth2_scheme  # noqa: E402
+from api.models import Base, Farm, User  # noqa: E402
+
+API_PORT = 8767
+PROXY_PORT = 8768
+BENCH_EMAIL = "bench@example.com"
+
+
+async def sync_read_farms(skip: int = 0, limit: int = 100, token: str = Depends(oauth2_scheme)):
+    # The route as it was before the async port: blocking queries on the event loop
+    db = database.SessionLocal()
+    try:
+        email = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]).get("sub")
+        user = db.query(User).filter(User.email == email).first()
+        if user is None:
+            raise HTTPException(status_code=401, detail="Could not validate credentials")
+        farms = db.query(Farm).filter(Farm.owner_id == user.id).offset(skip).limit(limit).all()
+        return [schemas.FarmInDB.model_validate(farm) for farm in farms]
+    finally:
+        db.close()
+
+
+def create_app() -> FastAPI:
+    """uvicorn factory; BENCH_MODE picks the implementation."""
+    app = FastAPI()
+    if os.getenv("BENCH_MODE") == "sync":
+        app.add_api_route("/api/farms/", sync_read_farms, methods=["GET"])
+    else:
+        from api import farms
+        app.include_router(farms.router, prefix="/api")
+    return app
+
+
+def seed(farm_count: int) -> str:
+    """Create the benchmark user and its farms; return a bearer token."""
+    Base.metadata.create_all(bind=database.engine)
+    with database.SessionLocal() as db:
+        user = db.query(User).filter(User.email == BENCH_EMAIL).first()
+        if user is None:
+            user = User(id=uuid.uuid4(), email=BENCH_EMAIL, password="!", role="farmer")
+            db.add(user)
+            db.flush()
+        db.query(Farm).filter(Farm.owner_id == user.id).delete()
+        db.add_all(
+            Farm(id=uuid.uuid4(), name=f"Farm {index}", owner_id=user.id, location="Arusha", size="2 acres")
+            for index in range(farm_count)
+        )
+        db.commit()
+    return create_access_token({"sub": BENCH_EMAIL})
+
+
+async def start_latency_proxy(latency_ms: float) -> asyncio.AbstractServer:
+    """TCP proxy to the database that holds back every reply by `latency_ms`."""
+    delay = latency_ms / 1000.0
+
+    async def pipe(reader, writer, delayed):
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                if delayed:
+                    await asyncio.sleep(delay)
+                writer.write(data)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def handle(client_reader, client_writer):
+        db_reader, db_writer = await asyncio.open_connection(database.DB_HOST, int(database.DB_PORT))
+        await asyncio.gather(
+            pipe(client_reader, db_writer, delayed=False),
+            pipe(db_reader, client_writer, delayed=True),
+        )
+
+    return await asyncio.start_server(handle, "127.0.0.1", PROXY_PORT)
+
+
+async def wait_until_up(session: aiohttp.ClientSession, url: str):
+    for _ in range(100):
+        try:
+            async with session.get(url) as response:
+                await response.read()
+                return
+        except aiohttp.ClientError:
+            await asyncio.sleep(0.1)
+    raise RuntimeError(f"{url} did not come up")
+
+
+async def run_mode(mode: str, token: str, clients: int, requests: int, db_env: dict) -> dict:
+    server = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "async_db_bench:create_app", "--factory",
+            "--app-dir", os.path.join(BACKEND_DIR, "benchmarks"),
+            "--port", str(API_PORT), "--log-level", "warning",
+        ],
+        cwd=BACKEND_DIR,
+        env=dict(os.environ, BENCH_MODE=mode, **db_env),
+        stdout=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{API_PORT}/api/farms/"
+    headers = {"Authorization": f"Bearer {token}"}
+    latencies = []
+    errors = 0
+    try:
+        connector = aiohttp.TCPConnector(limit=clients)
+        async with aiohttp.ClientSession(connector=connector, headers=headers) as session:
+            await wait_until_up(session, url)
+            remaining = iter(range(requests))
+
+            async def client():
+                nonlocal errors
+                for _ in remaining:
+                    started = time.perf_counter()
+                    async with session.get(url) as response:
+                        await response.read()
+                        if response.status != 200:
+                            errors += 1
+                    latencies.append((time.perf_counter() - started) * 1000)
+
+            started = time.perf_counter()
+            await asyncio.gather(*(client() for _ in range(clients)))
+            elapsed = time.perf_counter() - started
+    finally:
+        server.terminate()
+        # Waited for off the loop: the latency proxy runs on it and the server's
+        # connections close through it
+        await asyncio.to_thread(server.wait)
+
+    latencies.sort()
+    return {
+        "mode": mode,
+        "requests_per_s": round(requests / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies), 1),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1], 1),
+        "errors": errors,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--farms", type=int, default=100)
+    parser.add_argument("--db-latency-ms", type=float, default=0)
+    args = parser.parse_args()
+
+    token = seed(args.farms)
+    print(
+        f"{args.clients} concurrent clients, {args.requests} requests, {args.farms} farms per response, "
+        f"{args.db_latency_ms} ms added database latency"
+    )
+
+    proxy = None
+    db_env = {}
+    if args.db_latency_ms > 0:
+        proxy = await start_latency_proxy(args.db_latency_ms)
+        db_env = {"DB_HOST": "127.0.0.1", "DB_PORT": str(PROXY_PORT)}
+    try:
+        for mode in ("sync", "async"):
+            print(await run_mode(mode, token, args.clients, args.requests, db_env))
+    finally:
+        if proxy is not None:
+            proxy.close()
+            await proxy.wait_closed()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
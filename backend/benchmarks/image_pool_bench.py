@@ -0,0 +1,139 @@
+"""
+Concurrency benchmark: /health latency while large uploads are being processed.
+
+Starts a stub upstream model and the prediction API (main.py) under uvicorn,
+then fires a burst of large image uploads at /predict while polling /health.
+With the image work on the event loop (IMAGE_POOL_KIND=inline) the health
+checks queue up behind every decode; with the worker pool they stay fast.
+
+Usage (from the backend directory):
+    python benchmarks/image_pool_bench.py [--uploads 16] [--size 4000x3000]
+"""
+import argparse
+import asyncio
+import io
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import aiohttp
+from aiohttp import web
+from PIL import Image
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STUB_PORT = 8765
+API_PORT = 8766
+
+
+async def start_stub_upstream() -> web.AppRunner:
+    async def predict(request):
+        await request.read()
+        await asyncio.sleep(0.05)
+        return web.json_response({"prediction": "Healthy", "confidence": "97%"})
+
+    stub = web.Application(client_max_size=64 * 1024 * 1024)
+    stub.router.add_post("/predict/", predict)
+    runner = web.AppRunner(stub)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", STUB_PORT).start()
+    return runner
+
+
+def make_upload(size: str) -> bytes:
+    width, height = (int(part) for part in size.split("x"))
+    # Noise-free gradients compress too well; effect_noise gives a realistic decode cost
+    image = Image.effect_noise((width, height), 64).convert("RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+async def wait_until_up(session: aiohttp.ClientSession, url: str):
+    for _ in range(100):
+        try:
+            async with session.get(url) as response:
+                if response.status == 200:
+                    return
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.1)
+    raise RuntimeError(f"{url} did not come up")
+
+
+async def run_scenario(pool_kind: str, upload: bytes, uploads: int) -> dict:
+    env = dict(
+        os.environ,
+        IMAGE_POOL_KIND=pool_kind,
+        DISEASE_PREDICTION_API_URL=f"http://127.0.0.1:{STUB_PORT}/predict/",
+        PREDICT_MAX_CONCURRENCY=str(uploads),
+        PREDICT_MAX_QUEUE=str(uploads),
+    )
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(API_PORT), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+    )
+    base = f"http://127.0.0.1:{API_PORT}"
+    try:
+        async with aiohttp.ClientSession() as session:
+            await wait_until_up(session, f"{base}/health")
+
+            async def post_upload():
+                form = aiohttp.FormData()
+                form.add_field("file", upload, filename="flock.jpg", content_type="image/jpeg")
+                async with session.post(f"{base}/predict", data=form) as response:
+                    await response.read()
+
+            health_latencies = []
+            done = asyncio.Event()
+
+            async def poll_health():
+                while not done.is_set():
+                    started = time.perf_counter()
+                    async with session.get(f"{base}/health") as response:
+                        await response.read()
+                    health_latencies.append((time.perf_counter() - started) * 1000)
+                    await asyncio.sleep(0.01)
+
+            poller = asyncio.create_task(poll_health())
+            started = time.perf_counter()
+            await asyncio.gather(*(post_upload() for _ in range(uploads)))
+            elapsed = time.perf_counter() - started
+            done.set()
+            await poller
+    finally:
+        server.terminate()
+        server.wait()
+
+    health_latencies.sort()
+    return {
+        "pool": pool_kind,
+        "uploads_s": round(elapsed, 2),
+        "health_checks": len(health_latencies),
+        "health_p50_ms": round(statistics.median(health_latencies), 1),
+        "health_max_ms": round(health_latencies[-1], 1),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uploads", type=int, default=16)
+    parser.add_argument("--size", default="4000x3000")
+    args = parser.parse_args()
+
+    upload = make_upload(args.size)
+    print(f"Upload size: {len(upload) / 1024 / 1024:.1f} MB ({args.size}), {args.uploads} concurrent uploads")
+
+    stub = await start_stub_upstream()
+    try:
+        for pool_kind in ("inline", "thread", "process"):
+            print(await run_scenario(pool_kind, upload, args.uploads))
+    finally:
+        await stub.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
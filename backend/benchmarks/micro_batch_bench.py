@@ -0,0 +1,92 @@
+"""
+Throughput vs latency of the local model's micro-batching scheduler.
+
+Builds a synthetic NumPy model (same .npz format as local_model.py), then
+drives LocalPredictionEngine with a fixed number of concurrent clients for
+several (max_batch_size, max_wait_ms) settings. Batch size 1 is the
+unbatched baseline.
+
+Usage (from the backend directory):
+    python benchmarks/micro_batch_bench.py [--clients 32] [--requests 512]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import LocalPredictionEngine  # noqa: E402
+
+SETTINGS = [(1, 0), (4, 2), (8, 5), (16, 5), (32, 10)]
+
+
+def build_model(path: str, input_size: int, hidden: int):
+    rng = np.random.default_rng(0)
+    features = input_size * input_size * 3
+    np.savez(
+        path,
+        W0=(rng.standard_normal((features, hidden)) / np.sqrt(features)).astype(np.float32),
+        b0=np.zeros(hidden, dtype=np.float32),
+        W1=(rng.standard_normal((hidden, 4)) / np.sqrt(hidden)).astype(np.float32),
+        b1=np.zeros(4, dtype=np.float32),
+        input_size=np.array(input_size),
+    )
+
+
+async def run_setting(model_path: str, images, clients: int, requests: int, max_batch: int, max_wait_ms: float) -> dict:
+    engine = LocalPredictionEngine(model_path, max_batch_size=max_batch, max_wait_ms=max_wait_ms)
+    engine.load()
+    latencies = []
+    remaining = iter(range(requests))
+
+    async def client():
+        for index in remaining:
+            started = time.perf_counter()
+            await engine.predict(images[index % len(images)], b"")
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(clients)))
+    elapsed = time.perf_counter() - started
+    engine.shutdown()
+
+    latencies.sort()
+    return {
+        "max_batch": max_batch,
+        "max_wait_ms": max_wait_ms,
+        "throughput_img_s": round(requests / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies), 2),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1], 2),
+        "avg_batch": engine.batcher.stats()["avg_batch_size"],
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=512)
+    parser.add_argument("--input-size", type=int, default=96)
+    parser.add_argument("--hidden", type=int, default=256)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(1)
+    images = [Image.fromarray(rng.integers(0, 255, (480, 640, 3), dtype=np.uint8)) for _ in range(16)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        model_path = os.path.join(tmp, "bench.npz")
+        build_model(model_path, args.input_size, args.hidden)
+        print(f"{args.clients} concurrent clients, {args.requests} requests, "
+              f"{args.input_size}px input, {args.hidden} hidden units")
+        for max_batch, max_wait_ms in SETTINGS:
+            print(await run_setting(model_path, images, args.clients, args.requests, max_batch, max_wait_ms))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,148 @@
+"""
+Concurrency stress test for inventory stock movements.
+
+Creates an inventory item in the Django database (settings.DATABASES, a
+PostgreSQL with migrations applied), then runs threads that add and remove
+random quantities of it at the same time, each with its own connection.
+Afterwards it checks that:
+
+    - the item's current_quantity equals the sum of its ledger rows
+      (purchases minus usages)
+    - the quantity was never below zero: every removal that went through
+      left a non-negative balance
+
+Two modes:
+
+    atomic  stock.record_transaction(), the implementation the API uses
+    legacy  read the item, change current_quantity in Python, save() it,
+            as add_stock/remove_stock did before; shows the lost updates
+
+The item, its farm, owner and ledger rows are deleted at the end. The same
+guarantees are covered by tests/test_stock.py; this script measures
+throughput and shows the legacy behaviour.
+
+Usage (from the backend directory):
+    python benchmarks/stock_stress.py [--mode atomic|legacy] [--threads 16] [--ops 200] [--initial 50]
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from decimal import Decimal
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'amazing_kuku.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.db import connection, transaction  # noqa: E402
+from django.db.models import Q, Sum  # noqa: E402
+
+from apps.consolidated.models import Farm, InventoryItem, InventoryTransaction, User  # noqa: E402
+from apps.consolidated.stock import InsufficientStock, record_transaction  # noqa: E402
+
+
+def legacy_move(item_id, transaction_type, quantity):
+    # add_stock/remove_stock before the stock service: check and update in Python
+    item = InventoryItem.objects.get(pk=item_id)
+    if transaction_type == 'usage' and quantity > item.current_quantity:
+        raise InsufficientStock({item_id: quantity})
+    InventoryTransaction.objects.create(item=item, transaction_type=transaction_type, quantity=quantity)
+    if transaction_type == 'usage':
+        item.current_quantity -= quantity
+    else:
+        item.current_quantity += quantity
+    item.save()
+    return item.current_quantity
+
+
+def atomic_move(item_id, transaction_type, quantity):
+    return record_transaction(item_id, transaction_type, quantity)[1]
+
+
+def worker(move, item_id, ops, seed, results, barrier):
+    rng = random.Random(seed)
+    done = rejected = 0
+    negative = []
+    barrier.wait()
+    try:
+        for _ in range(ops):
+            transaction_type = rng.choice(('purchase', 'usage', 'usage'))
+            quantity = Decimal(rng.randint(1, 500)) / 100
+            try:
+                balance = move(item_id, transaction_type, quantity)
+            except InsufficientStock:
+                rejected += 1
+                continue
+            done += 1
+            if balance < 0:
+                negative.append(balance)
+    finally:
+        connection.close()
+    results.append((done, rejected, negative))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mode', choices=('atomic', 'legacy'), default='atomic')
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--ops', type=int, default=200, help='Movements per thread')
+    parser.add_argument('--initial', type=Decimal, default=Decimal(50), help='Starting quantity')
+    args = parser.parse_args()
+
+    suffix = uuid.uuid4().hex[:8]
+    owner = User.objects.create_user(
+        email=f'stock-stress-{suffix}@example.com', username=f'stock-stress-{suffix}', password=None
+    )
+    farm = Farm.objects.create(name='Stock stress', owner=owner, location='-', size=1)
+    item = InventoryItem.objects.create(name='Feed', farm=farm, unit='kg')
+    try:
+        if args.initial:
+            record_transaction(item, 'purchase', args.initial)
+
+        move = atomic_move if args.mode == 'atomic' else legacy_move
+        results = []
+        barrier = threading.Barrier(args.threads)
+        threads = [
+            threading.Thread(target=worker, args=(move, item.pk, args.ops, seed, results, barrier))
+            for seed in range(args.threads)
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        done = sum(r[0] for r in results)
+        rejected = sum(r[1] for r in results)
+        negative = [balance for r in results for balance in r[2]]
+        item.refresh_from_db()
+        totals = InventoryTransaction.objects.filter(item=item).aggregate(
+            inbound=Sum('quantity', filter=Q(transaction_type='purchase')),
+            outbound=Sum('quantity', filter=Q(transaction_type='usage')),
+        )
+        ledger = (totals['inbound'] or 0) - (totals['outbound'] or 0)
+
+        print(f'mode={args.mode} threads={args.threads} ops/thread={args.ops}')
+        print(f'  {done} movements, {rejected} rejected for lack of stock, '
+              f'{done / elapsed:.0f} movements/s')
+        print(f'  current_quantity={item.current_quantity} ledger={ledger} '
+              f'drift={item.current_quantity - ledger}')
+        print(f'  negative balances seen: {len(negative)}')
+        ok = item.current_quantity == ledger and not negative and item.current_quantity >= 0
+        print('OK' if ok else 'FAILED')
+        return 0 if ok else 1
+    finally:
+        with transaction.atomic():
+            owner.delete()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
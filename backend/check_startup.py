@@ -0,0 +1,98 @@
+"""
+Import-time budget check for the FastAPI services.
+
+Imports each app in a fresh interpreter under `python -X importtime` and
+fails (exit code 1) when
+    - its cumulative import time is over budget,
+    - a module that must stay lazy (numpy, aiohttp, ...) was imported, or
+    - the import itself fails (api.index is imported with the database
+      pointed at a closed port, so touching the database at import fails).
+
+Usage:
+    python check_startup.py              # every app
+    python check_startup.py main         # one app
+
+STARTUP_BUDGET_MS overrides every budget. Each app is imported
+STARTUP_CHECK_RUNS times (default 3) and the fastest run counts.
+"""
+import os
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+CHECKS = {
+    "main": {
+        "budget_ms": 1000,
+        "lazy": ["numpy", "requests", "aiohttp", "onnxruntime", "local_model"],
+        "env": {},
+    },
+    "api.index": {
+        "budget_ms": 1500,
+        "lazy": ["numpy", "requests", "aiohttp"],
+        # Nothing listens here: an import-time connection attempt fails the check
+        "env": {"DB_HOST": "127.0.0.1", "DB_PORT": "1"},
+    },
+}
+
+
+def measure(module, env):
+    """Import `module` once; return (cumulative microseconds, imported module names)."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR,
+        env={**os.environ, **env},
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        error = [line for line in result.stderr.strip().splitlines() if not line.startswith("import time:")]
+        raise RuntimeError(error[-1] if error else f"exit code {result.returncode}")
+
+    cumulative = None
+    imported = set()
+    for line in result.stderr.splitlines():
+        # "import time:  self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, total, name = line.split("|", 2)
+        name = name.strip()
+        imported.add(name)
+        if name == module and total.strip().isdigit():
+            cumulative = int(total)
+    if cumulative is None:
+        raise RuntimeError(f"{module} did not show up in the -X importtime output")
+    return cumulative, imported
+
+
+def check(module, settings, runs):
+    budget_ms = float(os.getenv("STARTUP_BUDGET_MS", settings["budget_ms"]))
+    try:
+        samples = [measure(module, settings["env"]) for _ in range(runs)]
+    except RuntimeError as e:
+        print(f"FAIL {module}: import failed: {e}")
+        return False
+
+    best_ms = min(total for total, _ in samples) / 1000
+    imported = samples[0][1]
+    eager = sorted(
+        lazy for lazy in settings["lazy"]
+        if any(name == lazy or name.startswith(lazy + ".") for name in imported)
+    )
+
+    ok = best_ms <= budget_ms and not eager
+    print(f"{'ok  ' if ok else 'FAIL'} {module}: {best_ms:.0f} ms (budget {budget_ms:.0f} ms)")
+    if eager:
+        print(f"     imported at startup but should be lazy: {', '.join(eager)}")
+    return ok
+
+
+if __name__ == "__main__":
+    runs = int(os.getenv("STARTUP_CHECK_RUNS", "3"))
+    modules = sys.argv[1:] or list(CHECKS)
+    unknown = [module for module in modules if module not in CHECKS]
+    if unknown:
+        sys.exit(f"Unknown app: {', '.join(unknown)} (expected one of {', '.join(CHECKS)})")
+
+    results = [check(module, CHECKS[module], runs) for module in modules]
+    sys.exit(0 if all(results) else 1)
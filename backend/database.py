@@ -1,9 +1,15 @@
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, QueuePool
 import os
+import time
+import uuid
 from dotenv import load_dotenv
 
+from metrics import Histogram
+
 # Load environment variables
 load_dotenv()
 
@@ -16,20 +22,106 @@ DB_NAME = os.getenv("DB_NAME", "kuku_db")
 
 # Create database URL
 SQLALCHEMY_DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+ASYNC_DATABASE_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+
+# Connection pooling
+#   DB_POOL_MODE=queue  each process keeps a pool of up to
+#                       DB_POOL_SIZE + DB_MAX_OVERFLOW connections (default)
+#   DB_POOL_MODE=null   no pooling in the process; every session opens a fresh
+#                       connection to an external pooler such as PgBouncer.
+#                       Use this for serverless deployments, where every
+#                       instance keeping its own pool exhausts PostgreSQL's
+#                       connection limit.
+DB_POOL_MODE = os.getenv("DB_POOL_MODE", "queue")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))  # seconds to wait for a free connection
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # replace connections older than this (seconds)
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+
+if DB_POOL_MODE not in ("queue", "null"):
+    raise ValueError(f"Unknown DB_POOL_MODE: {DB_POOL_MODE}")
+
+POOL_CHECKOUT_SECONDS = Histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time spent waiting for a connection from the SQLAlchemy pool.",
+    ["engine", "outcome"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+)
+
+class _TimedPoolMixin:
+    """Records how long each checkout waited for a pooled connection"""
+    engine_name = "sync"
+    
+    def _do_get(self):
+        started = time.perf_counter()
+        outcome = "ok"
+        try:
+            return super()._do_get()
+        except Exception:
+            # Pool exhausted for DB_POOL_TIMEOUT seconds, or connecting failed
+            outcome = "error"
+            raise
+        finally:
+            POOL_CHECKOUT_SECONDS.observe(time.perf_counter() - started, engine=self.engine_name, outcome=outcome)
+
+class TimedQueuePool(_TimedPoolMixin, QueuePool):
+    engine_name = "sync"
 
-# Create SQLAlchemy engine
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+class TimedAsyncQueuePool(_TimedPoolMixin, AsyncAdaptedQueuePool):
+    engine_name = "async"
+
+def _pool_options(pool_class) -> dict:
+    if DB_POOL_MODE == "null":
+        return {"poolclass": NullPool, "pool_pre_ping": DB_POOL_PRE_PING}
+    return {
+        "poolclass": pool_class,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING
+    }
+
+# Create SQLAlchemy engine (synchronous; used by scripts such as init_db.py)
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **_pool_options(TimedQueuePool))
 
 # Create session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async engine (asyncpg) used by the FastAPI routers, so queries do not block the event loop
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    # PgBouncer in transaction mode cannot keep asyncpg's named prepared statements
+    # across transactions: disable the statement cache and use unique names
+    connect_args={
+        "statement_cache_size": 0,
+        "prepared_statement_name_func": lambda: f"__asyncpg_{uuid.uuid4()}__"
+    } if DB_POOL_MODE == "null" else {},
+    **_pool_options(TimedAsyncQueuePool)
+)
+
+# Objects stay usable after commit; routes return them after committing
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 # Base class for models
 Base = declarative_base()
 
-def get_db():
-    """Dependency that creates a new SQLAlchemy session that is closed after finishing."""
-    db = SessionLocal()
-    try:
+def pool_stats() -> dict:
+    """Current state of both connection pools, for the metrics endpoint"""
+    stats = {"mode": DB_POOL_MODE}
+    for name, pool in (("sync", engine.pool), ("async", async_engine.pool)):
+        if isinstance(pool, QueuePool):
+            stats[name] = {
+                "size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "checked_in": pool.checkedin(),
+                "overflow": pool.overflow(),
+                "max_overflow": DB_MAX_OVERFLOW
+            }
+    return stats
+
+async def get_db():
+    """Dependency that creates a new async SQLAlchemy session that is closed after finishing."""
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
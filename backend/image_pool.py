@@ -0,0 +1,116 @@
+"""
+Worker pool for CPU-bound image work (PIL decode, RGB convert, JPEG encode).
+
+Decoding a large upload takes tens of milliseconds; doing it inside an async
+handler stalls every other request on the uvicorn worker. Both FastAPI apps
+(main.py and api/index.py) hand that work to this pool instead.
+
+Configuration:
+    IMAGE_POOL_KIND  thread (default), process, or inline (run on the event
+                     loop - only useful as a benchmark baseline)
+    IMAGE_POOL_SIZE  number of workers (default: CPU count, capped at 4)
+"""
+import asyncio
+import io
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import BinaryIO, Callable, Optional, Union
+
+from PIL import Image
+
+IMAGE_POOL_KIND = os.getenv("IMAGE_POOL_KIND", "thread")
+IMAGE_POOL_SIZE = int(os.getenv("IMAGE_POOL_SIZE", str(min(4, os.cpu_count() or 1))))
+
+
+def decode_image(contents: Union[bytes, BinaryIO]) -> Image.Image:
+    """Decode uploaded bytes (or a file holding them) into an RGB image."""
+    image = Image.open(io.BytesIO(contents) if isinstance(contents, bytes) else contents)
+    # Read the pixels now; the source file may be closed once the request ends
+    image.load()
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    return image
+
+
+def encode_jpeg(image: Image.Image, quality: int = 95) -> bytes:
+    """Encode an image as JPEG bytes."""
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=quality)
+    return buffer.getvalue()
+
+
+def _timed_call(func: Callable, args: tuple):
+    # Runs inside the worker; reports when the job actually started so the
+    # caller can tell queue time from run time
+    started = time.monotonic()
+    return started, func(*args)
+
+
+class ImageWorkerPool:
+    """Runs image functions in a thread or process pool and keeps queue metrics."""
+
+    def __init__(self, kind: str = IMAGE_POOL_KIND, size: int = IMAGE_POOL_SIZE):
+        if kind not in ("thread", "process", "inline"):
+            raise ValueError(f"Unknown IMAGE_POOL_KIND: {kind}")
+        self.kind = kind
+        self.size = size
+        self._executor: Optional[Executor] = None
+
+        # Metrics
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.total_queue_seconds = 0.0
+        self.total_run_seconds = 0.0
+
+    def _get_executor(self) -> Executor:
+        # Created on first use so importing the app does not spawn workers
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.size)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.size, thread_name_prefix="image-worker")
+        return self._executor
+
+    async def run(self, func: Callable, *args):
+        """Run `func(*args)` in the pool and return its result."""
+        submitted = time.monotonic()
+        self.in_flight += 1
+        try:
+            if self.kind == "inline":
+                started, result = _timed_call(func, args)
+            else:
+                loop = asyncio.get_running_loop()
+                started, result = await loop.run_in_executor(self._get_executor(), _timed_call, func, args)
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.in_flight -= 1
+
+        self.completed += 1
+        self.total_queue_seconds += max(0.0, started - submitted)
+        self.total_run_seconds += time.monotonic() - started
+        return result
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        return {
+            "kind": self.kind,
+            "size": self.size,
+            "in_flight": self.in_flight,
+            "queued": max(0, self.in_flight - self.size),
+            "completed": self.completed,
+            "failed": self.failed,
+            "avg_queue_ms": round(self.total_queue_seconds / self.completed * 1000, 2) if self.completed else 0.0,
+            "avg_run_ms": round(self.total_run_seconds / self.completed * 1000, 2) if self.completed else 0.0,
+        }
+
+
+# Shared pool for the process
+image_pool = ImageWorkerPool()
@@ -0,0 +1,158 @@
+"""
+Local CPU inference for the poultry disease classifier.
+
+Lets the prediction API answer without the external service (which has 30+
+second cold starts). The model format is picked by file extension:
+
+    .onnx  ONNX Runtime (optional dependency: pip install onnxruntime)
+    .npz   pure NumPy MLP over the resized image. The archive holds the layer
+           weights W0, b0, W1, b1, ... and may also carry `classes`,
+           `input_size`, `mean` and `std`.
+
+Images are preprocessed as a batch into one float32 tensor (N, H, W, 3) so a
+single forward pass serves many images.
+"""
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image
+
+# Class order of the upstream poultry disease model
+DEFAULT_CLASSES = ["Coccidiosis", "Healthy", "New Castle Disease", "Salmonella"]
+DEFAULT_INPUT_SIZE = 224
+IMAGENET_MEAN = (0.485, 0.456, 0.406)
+IMAGENET_STD = (0.229, 0.224, 0.225)
+
+
+def softmax(logits: np.ndarray) -> np.ndarray:
+    shifted = logits - logits.max(axis=1, keepdims=True)
+    exp = np.exp(shifted)
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+class LocalModel:
+    """Base class: batch preprocessing and top-1 decoding shared by all formats."""
+
+    def __init__(
+        self,
+        classes: Sequence[str],
+        input_size: int = DEFAULT_INPUT_SIZE,
+        mean: Sequence[float] = IMAGENET_MEAN,
+        std: Sequence[float] = IMAGENET_STD
+    ):
+        self.classes = list(classes)
+        self.input_size = int(input_size)
+        self.mean = np.asarray(mean, dtype=np.float32).reshape(1, 1, 1, 3)
+        self.std = np.asarray(std, dtype=np.float32).reshape(1, 1, 1, 3)
+
+    def preprocess(self, images: Sequence[Image.Image]) -> np.ndarray:
+        """Resize and normalize images into one (N, H, W, 3) float32 tensor."""
+        size = self.input_size
+        batch = np.empty((len(images), size, size, 3), dtype=np.float32)
+        for index, image in enumerate(images):
+            if image.mode != 'RGB':
+                image = image.convert('RGB')
+            batch[index] = np.asarray(image.resize((size, size), Image.BILINEAR), dtype=np.float32)
+        batch *= 1.0 / 255.0
+        batch -= self.mean
+        batch /= self.std
+        return batch
+
+    def forward(self, batch: np.ndarray) -> np.ndarray:
+        """Return class probabilities of shape (N, len(classes))."""
+        raise NotImplementedError
+
+    def decode(self, probabilities: np.ndarray) -> List[Tuple[str, float]]:
+        top = probabilities.argmax(axis=1)
+        return [
+            (self.classes[label], float(probabilities[row, label]))
+            for row, label in enumerate(top)
+        ]
+
+    def predict(self, images: Sequence[Image.Image]) -> List[Tuple[str, float]]:
+        """Top-1 (label, confidence) for each image."""
+        return self.decode(self.forward(self.preprocess(images)))
+
+
+class NumpyModel(LocalModel):
+    """Fully connected network over the flattened, normalized image."""
+
+    def __init__(self, layers: List[Tuple[np.ndarray, np.ndarray]], **kwargs):
+        super().__init__(**kwargs)
+        self.layers = layers
+
+    @classmethod
+    def load(cls, path: str, classes: Optional[Sequence[str]] = None) -> "NumpyModel":
+        with np.load(path, allow_pickle=False) as archive:
+            layers = []
+            while f"W{len(layers)}" in archive:
+                index = len(layers)
+                layers.append((
+                    archive[f"W{index}"].astype(np.float32),
+                    archive[f"b{index}"].astype(np.float32)
+                ))
+            if not layers:
+                raise ValueError(f"{path} contains no W0/b0 layer weights")
+            options = {
+                "classes": classes or (
+                    [str(name) for name in archive["classes"]] if "classes" in archive else DEFAULT_CLASSES
+                ),
+                "input_size": int(archive["input_size"]) if "input_size" in archive else DEFAULT_INPUT_SIZE,
+            }
+            if "mean" in archive:
+                options["mean"] = archive["mean"]
+            if "std" in archive:
+                options["std"] = archive["std"]
+        return cls(layers, **options)
+
+    def forward(self, batch: np.ndarray) -> np.ndarray:
+        activations = batch.reshape(len(batch), -1)
+        last = len(self.layers) - 1
+        for index, (weights, bias) in enumerate(self.layers):
+            activations = activations @ weights + bias
+            if index != last:
+                np.maximum(activations, 0, out=activations)
+        return softmax(activations)
+
+
+class OnnxModel(LocalModel):
+    """Model exported to ONNX, run with ONNX Runtime on the CPU."""
+
+    def __init__(self, session, **kwargs):
+        input_meta = session.get_inputs()[0]
+        shape = input_meta.shape
+        # Accept both NCHW (PyTorch exports) and NHWC (Keras exports)
+        self.channels_first = len(shape) == 4 and shape[1] == 3
+        spatial = shape[2] if self.channels_first else shape[1]
+        if isinstance(spatial, int) and "input_size" not in kwargs:
+            kwargs["input_size"] = spatial
+        super().__init__(**kwargs)
+        self.session = session
+        self.input_name = input_meta.name
+
+    @classmethod
+    def load(cls, path: str, classes: Optional[Sequence[str]] = None) -> "OnnxModel":
+        try:
+            import onnxruntime
+        except ImportError as e:
+            raise RuntimeError("onnxruntime is required for .onnx models: pip install onnxruntime") from e
+        session = onnxruntime.InferenceSession(path, providers=["CPUExecutionProvider"])
+        return cls(session, classes=classes or DEFAULT_CLASSES)
+
+    def forward(self, batch: np.ndarray) -> np.ndarray:
+        if self.channels_first:
+            batch = np.ascontiguousarray(batch.transpose(0, 3, 1, 2))
+        outputs = np.asarray(self.session.run(None, {self.input_name: batch})[0], dtype=np.float32)
+        # Exports differ on whether the softmax is part of the graph
+        if np.all(outputs >= 0) and np.allclose(outputs.sum(axis=1), 1.0, atol=1e-3):
+            return outputs
+        return softmax(outputs)
+
+
+def load_model(path: str, classes: Optional[Sequence[str]] = None) -> LocalModel:
+    """Load a local model, choosing the runtime from the file extension."""
+    if path.endswith(".onnx"):
+        return OnnxModel.load(path, classes)
+    if path.endswith(".npz"):
+        return NumpyModel.load(path, classes)
+    raise ValueError(f"Unsupported local model format: {path} (expected .onnx or .npz)")
@@ -1,22 +1,100 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import Depends, FastAPI, File, UploadFile, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from jose import JWTError, jwt
+from starlette.formparsers import MultiPartParser
 from PIL import Image
-import numpy as np
-import io
+import json
+import logging
 import os
+import hashlib
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from datetime import datetime
-from typing import Optional
-import requests
-import aiohttp
+from typing import Callable, Dict, List, Optional
 import asyncio
 from pydantic import BaseModel
 
+from image_pool import image_pool, decode_image, encode_jpeg
+from metrics import CONTENT_TYPE, ServerTimingMiddleware, record_phase, render_metrics, timed
+from prediction_store import PredictionHistoryWriter, make_record, store_from_url
+
+# Logging: LOG_LEVEL=DEBUG shows per-request details, OFF silences everything
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+logging.basicConfig(
+    level=logging.CRITICAL + 1 if LOG_LEVEL == "OFF" else LOG_LEVEL,
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+)
+logger = logging.getLogger(__name__)
+
 app = FastAPI(
     title="Amazing Kuku - Poultry Disease Prediction API",
     description="AI-powered poultry disease prediction service",
     version="1.0.0"
 )
 
+# Upload limits
+MAX_UPLOAD_BYTES = int(float(os.getenv("MAX_UPLOAD_MB", "10")) * 1024 * 1024)
+# Maximum number of images accepted by /predict/batch
+PREDICT_BATCH_MAX_FILES = int(os.getenv("PREDICT_BATCH_MAX_FILES", "50"))
+# Uploads are spooled into a SpooledTemporaryFile: kept in memory up to this
+# size, then rolled over to disk
+MultiPartParser.spool_max_size = int(float(os.getenv("UPLOAD_SPOOL_MB", "1")) * 1024 * 1024)
+
+class UploadSizeLimitMiddleware:
+    """
+    Rejects request bodies larger than the route's limit with 413.
+    
+    The Content-Length header is checked before anything is read; bodies
+    without one (chunked uploads) are counted as they stream in and cut off as
+    soon as they go over, so an oversized upload is never read in full.
+    """
+    def __init__(self, app, limits: Dict[str, int]):
+        self.app = app
+        self.limits = limits
+    
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope["path"]) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+        
+        detail = f"Upload too large (maximum is {limit // (1024 * 1024)} MB)"
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > limit:
+            response = JSONResponse({"detail": detail}, status_code=413)
+            await response(scope, receive, send)
+            return
+        
+        received = 0
+        
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+        
+        await self.app(scope, limited_receive, send)
+
+# Added before CORS so that 413 responses still carry CORS headers
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    limits={
+        # Allowance for the multipart framing around the file
+        "/predict": MAX_UPLOAD_BYTES + 64 * 1024,
+        "/predict/batch": (MAX_UPLOAD_BYTES + 64 * 1024) * PREDICT_BATCH_MAX_FILES
+    }
+)
+
+# Per-phase timing (Server-Timing header and /metrics histograms, see metrics.py)
+app.add_middleware(ServerTimingMiddleware, paths=["/predict", "/predict/batch"])
+
 # Enable CORS
 app.add_middleware(
     CORSMiddleware,
@@ -26,78 +104,372 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-class DiseasePredictor:
-    def __init__(self):
-        # External API endpoint for poultry disease prediction
-        self.external_api_url = "https://apipoultrydisease.onrender.com/predict/"
+# Upstream admission limits (the external model falls over under parallel load)
+PREDICT_MAX_CONCURRENCY = int(os.getenv("PREDICT_MAX_CONCURRENCY", "4"))
+PREDICT_MAX_QUEUE = int(os.getenv("PREDICT_MAX_QUEUE", "16"))
+PREDICT_QUEUE_TIMEOUT = float(os.getenv("PREDICT_QUEUE_TIMEOUT", "10"))
+PREDICT_RETRY_AFTER = int(os.getenv("PREDICT_RETRY_AFTER", "5"))
+
+class AdmissionController:
+    """
+    Bounds the number of concurrent upstream calls.
+    
+    Callers beyond the concurrency limit wait in a bounded queue for at most
+    `queue_timeout` seconds; when the queue is full, or the wait runs out, the
+    request is rejected straight away with 503 and a Retry-After header.
+    """
+    def __init__(self, max_concurrency: int, max_queue: int, queue_timeout: float, retry_after: int):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self._semaphore = asyncio.Semaphore(max_concurrency)
         
-    async def predict(self, image: Image.Image) -> dict:
-        """
-        Run prediction on an image using external API
+        # Metrics
+        self.active = 0
+        self.queue_depth = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+    
+    def _overloaded(self, detail: str) -> HTTPException:
+        return HTTPException(
+            status_code=503,
+            detail=detail,
+            headers={"Retry-After": str(self.retry_after)}
+        )
+    
+    @asynccontextmanager
+    async def slot(self):
+        """Hold one upstream slot for the duration of the block"""
+        if self._semaphore.locked() and self.queue_depth >= self.max_queue:
+            self.rejected += 1
+            raise self._overloaded("Prediction service is busy - please try again shortly")
+        
+        self.queue_depth += 1
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise self._overloaded("Timed out waiting for the prediction service - please try again shortly")
+        finally:
+            self.queue_depth -= 1
+        
+        waited = time.monotonic() - started
+        record_phase("admission_wait", waited)
+        self.admitted += 1
+        self.total_wait_seconds += waited
+        self.max_wait_seconds = max(self.max_wait_seconds, waited)
         
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+    
+    def stats(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "active": self.active,
+            "queue_depth": self.queue_depth,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "avg_wait_seconds": round(self.total_wait_seconds / self.admitted, 4) if self.admitted else 0.0,
+            "max_wait_seconds": round(self.max_wait_seconds, 4)
+        }
+
+# Circuit breaker and health probe settings for the external model
+BREAKER_FAILURE_RATE = float(os.getenv("BREAKER_FAILURE_RATE", "0.5"))
+BREAKER_WINDOW = int(os.getenv("BREAKER_WINDOW", "20"))
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", "5"))
+BREAKER_RESET_TIMEOUT = float(os.getenv("BREAKER_RESET_TIMEOUT", "30"))
+HEALTH_PROBE_INTERVAL = float(os.getenv("HEALTH_PROBE_INTERVAL", "30"))
+HEALTH_PROBE_URL = "https://apipoultrydisease.onrender.com/docs"
+
+class CircuitBreaker:
+    """
+    Closed/open/half-open circuit breaker driven by the failure rate of the
+    last `window_size` upstream calls.
+    
+    Once at least `min_calls` outcomes are recorded and the failure rate
+    reaches `failure_threshold`, the breaker opens and rejects calls for
+    `reset_timeout` seconds. It then lets a single trial call through
+    (half-open): success closes the breaker, failure opens it again.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    
+    def __init__(self, failure_threshold: float, window_size: int, min_calls: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.min_calls = min_calls
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self.rejected = 0
+        self._outcomes = deque(maxlen=window_size)
+        self._trial_in_flight = False
+    
+    @property
+    def failure_rate(self) -> float:
+        if not self._outcomes:
+            return 0.0
+        return self._outcomes.count(False) / len(self._outcomes)
+    
+    def is_open(self) -> bool:
+        """True while the breaker is open and still rejecting calls"""
+        return self.state == self.OPEN and time.monotonic() - self.opened_at < self.reset_timeout
+    
+    def allow_request(self) -> bool:
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                self.rejected += 1
+                return False
+            self.state = self.HALF_OPEN
+            self._trial_in_flight = False
+        
+        if self.state == self.HALF_OPEN:
+            if self._trial_in_flight:
+                self.rejected += 1
+                return False
+            self._trial_in_flight = True
+        
+        return True
+    
+    def record_success(self):
+        self._trial_in_flight = False
+        if self.state == self.HALF_OPEN:
+            self.state = self.CLOSED
+            self._outcomes.clear()
+        self._outcomes.append(True)
+    
+    def record_failure(self):
+        self._trial_in_flight = False
+        self._outcomes.append(False)
+        if self.state == self.HALF_OPEN or (
+            len(self._outcomes) >= self.min_calls and self.failure_rate >= self.failure_threshold
+        ):
+            self._trip()
+    
+    def release_trial(self):
+        """Give up a half-open trial slot whose call never reached the upstream"""
+        self._trial_in_flight = False
+    
+    def _trip(self):
+        self.state = self.OPEN
+        self.opened_at = time.monotonic()
+        self.times_opened += 1
+    
+    def retry_after(self) -> int:
+        remaining = self.reset_timeout - (time.monotonic() - self.opened_at)
+        return max(1, int(remaining + 0.999))
+    
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "failure_rate": round(self.failure_rate, 3),
+            "window_calls": len(self._outcomes),
+            "times_opened": self.times_opened,
+            "rejected": self.rejected
+        }
+
+class UpstreamHealthProber:
+    """
+    Probes the external model in the background so that /health can answer
+    from the cached result instead of making a live call on every probe.
+    """
+    def __init__(self, url: str, interval: float, timeout: float = 5):
+        self.url = url
+        self.interval = interval
+        self.timeout = timeout
+        self.status = "unknown"
+        self.checked_at: Optional[str] = None
+        self.latency_ms: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+    
+    async def probe(self):
+        import aiohttp
+        
+        started = time.monotonic()
+        try:
+            async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout)) as session:
+                async with session.get(self.url) as response:
+                    self.status = "healthy" if response.status == 200 else "unhealthy"
+        except Exception:
+            self.status = "unhealthy"
+        self.latency_ms = round((time.monotonic() - started) * 1000, 1)
+        self.checked_at = datetime.utcnow().isoformat()
+    
+    async def _run(self):
+        while True:
+            await self.probe()
+            await asyncio.sleep(self.interval)
+    
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+# Prediction engine selection
+PREDICTION_ROUTING = os.getenv("PREDICTION_ROUTING", "remote_first")  # remote_first, local_first or race
+LOCAL_MODEL_PATH = os.getenv("LOCAL_MODEL_PATH")
+LOCAL_MODEL_CLASSES = os.getenv("LOCAL_MODEL_CLASSES")
+LOCAL_INFERENCE_WORKERS = int(os.getenv("LOCAL_INFERENCE_WORKERS", "1"))
+LOCAL_BATCH_MAX_SIZE = int(os.getenv("LOCAL_BATCH_MAX_SIZE", "16"))
+LOCAL_BATCH_MAX_WAIT_MS = float(os.getenv("LOCAL_BATCH_MAX_WAIT_MS", "5"))
+
+class PredictionEngine:
+    """
+    Backend that turns an image into a prediction result.
+    
+    Results carry a "source" field naming the engine that answered; a result
+    with source "fallback" means the engine could not classify the image.
+    """
+    name = "engine"
+    
+    def is_available(self) -> bool:
+        return True
+    
+    async def predict(self, image: Image.Image, image_bytes: bytes) -> dict:
+        """
         Args:
-            image: PIL Image object
-            
-        Returns:
-            dict: Prediction result with class and confidence
+            image: decoded RGB image
+            image_bytes: the same image encoded as JPEG
         """
+        raise NotImplementedError
+    
+    def stats(self) -> dict:
+        return {"available": self.is_available()}
+
+class RemotePredictionEngine(PredictionEngine):
+    """The external model at apipoultrydisease.onrender.com"""
+    name = "external_api"
+    
+    def __init__(
+        self,
+        admission: Optional[AdmissionController] = None,
+        breaker: Optional[CircuitBreaker] = None
+    ):
+        # External API endpoint for poultry disease prediction
+        self.external_api_url = os.getenv(
+            "DISEASE_PREDICTION_API_URL", "https://apipoultrydisease.onrender.com/predict/"
+        )
+        # Limits concurrent upstream calls (unbounded when None)
+        self.admission = admission
+        # Fails fast while the upstream is known to be down
+        self.breaker = breaker
+    
+    def is_available(self) -> bool:
+        return self.breaker is None or not self.breaker.is_open()
+    
+    async def predict(self, image: Image.Image, image_bytes: bytes) -> dict:
+        return await self._admit_and_predict(image_bytes)
+    
+    async def _admit_and_predict(self, image_bytes: bytes) -> dict:
+        if self.breaker is not None and not self.breaker.allow_request():
+            raise HTTPException(
+                status_code=503,
+                detail="Disease prediction service is unavailable - please try again shortly",
+                headers={"Retry-After": str(self.breaker.retry_after())}
+            )
         try:
-            # Convert PIL image to bytes
-            img_buffer = io.BytesIO()
-            # Save as JPEG for compatibility
-            image.save(img_buffer, format='JPEG', quality=95)
-            img_buffer.seek(0)
-            
-            # Prepare multipart form data
-            async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30)) as session:
-                form_data = aiohttp.FormData()
-                form_data.add_field('file', img_buffer.getvalue(), 
-                                  filename='image.jpg', 
-                                  content_type='image/jpeg')
-                
-                print(f"Sending request to external API: {self.external_api_url}")
-                
-                async with session.post(self.external_api_url, data=form_data) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        print(f"External API response: {result}")
-                        
-                        # Parse the response and normalize the format
-                        prediction = result.get("prediction", "Unknown")
-                        confidence_str = result.get("confidence", "0%")
-                        
-                        # Extract numeric confidence value
-                        confidence = float(confidence_str.replace("%", "")) / 100.0
-                        
-                        return {
-                            "prediction": prediction,
-                            "confidence": confidence,
-                            "confidence_percentage": confidence_str,
-                            "timestamp": datetime.utcnow().isoformat(),
-                            "source": "external_api"
-                        }
-                    else:
-                        error_text = await response.text()
-                        print(f"External API error: {response.status} - {error_text}")
-                        raise HTTPException(
-                            status_code=502, 
-                            detail=f"External API error: {response.status}"
-                        )
+            if self.admission is None:
+                return await self._guarded_predict(image_bytes)
+            async with self.admission.slot():
+                return await self._guarded_predict(image_bytes)
+        finally:
+            if self.breaker is not None:
+                self.breaker.release_trial()
+    
+    async def _guarded_predict(self, image_bytes: bytes) -> dict:
+        """Call the external API and record the outcome with the circuit breaker"""
+        try:
+            result = await self._predict_external(image_bytes)
+        except HTTPException:
+            if self.breaker is not None:
+                self.breaker.record_failure()
+            raise
+        if self.breaker is not None:
+            if result.get("source") == "fallback":
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+        return result
+    
+    async def _predict_external(self, image_bytes: bytes) -> dict:
+        """
+        Send encoded JPEG bytes to the external API and normalize its response
+        """
+        # Imported on first use so it does not add to startup time
+        import aiohttp
+        
+        try:
+            with timed("upstream"):
+                # Prepare multipart form data
+                async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30)) as session:
+                    form_data = aiohttp.FormData()
+                    form_data.add_field('file', image_bytes, 
+                                      filename='image.jpg', 
+                                      content_type='image/jpeg')
+                    
+                    logger.debug("Sending request to external API: %s", self.external_api_url)
+                    
+                    async with session.post(self.external_api_url, data=form_data) as response:
+                        if response.status == 200:
+                            result = await response.json()
+                            logger.debug("External API response: %s", result)
+                            
+                            # Parse the response and normalize the format
+                            prediction = result.get("prediction", "Unknown")
+                            confidence_str = result.get("confidence", "0%")
+                            
+                            # Extract numeric confidence value
+                            confidence = float(confidence_str.replace("%", "")) / 100.0
+                            
+                            return {
+                                "prediction": prediction,
+                                "confidence": confidence,
+                                "confidence_percentage": confidence_str,
+                                "timestamp": datetime.utcnow().isoformat(),
+                                "source": "external_api"
+                            }
+                        else:
+                            error_text = await response.text()
+                            logger.warning("External API error: %s - %s", response.status, error_text)
+                            raise HTTPException(
+                                status_code=502, 
+                                detail=f"External API error: {response.status}"
+                            )
                         
         except asyncio.TimeoutError:
-            print("External API timeout")
+            logger.warning("External API timeout")
             raise HTTPException(
                 status_code=504, 
                 detail="External API timeout - please try again"
             )
         except aiohttp.ClientError as e:
-            print(f"External API connection error: {e}")
+            logger.warning("External API connection error: %s", e)
             raise HTTPException(
                 status_code=502, 
                 detail="Unable to connect to disease prediction service"
             )
         except Exception as e:
-            print(f"Unexpected error in disease prediction: {e}")
+            logger.exception("Unexpected error in disease prediction: %s", e)
             # Fallback to a simple response
             return {
                 "prediction": "Unable to predict",
@@ -108,8 +480,392 @@ class DiseasePredictor:
                 "source": "fallback"
             }
 
+class MicroBatcher:
+    """
+    Dynamic batcher: groups concurrent single-image requests into one call of
+    `run_batch(images)`, executed in a worker pool.
+    
+    A batch is dispatched when it reaches `max_batch_size` images or when its
+    oldest request has waited `max_wait_ms`, whichever comes first. While all
+    workers are busy, requests keep accumulating and go out together as soon
+    as a worker frees up.
+    """
+    def __init__(
+        self,
+        run_batch: Callable[[List[Image.Image]], list],
+        executor: ThreadPoolExecutor,
+        workers: int,
+        max_batch_size: int,
+        max_wait_ms: float
+    ):
+        self.run_batch = run_batch
+        self.executor = executor
+        self.workers = workers
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._pending: List[tuple] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._running = 0
+        
+        # Metrics
+        self.batches = 0
+        self.items = 0
+        self.largest_batch = 0
+    
+    async def submit(self, image: Image.Image):
+        """Queue one image and wait for its result"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((image, future))
+        
+        if len(self._pending) >= self.max_batch_size:
+            self._dispatch()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._on_timer)
+        
+        return await future
+    
+    def _on_timer(self):
+        self._timer = None
+        self._dispatch()
+    
+    def _dispatch(self):
+        if self._running >= self.workers:
+            # Picked up when a running batch finishes
+            return
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        
+        # Requests whose callers went away do not need a slot in the batch
+        pending = [(image, future) for image, future in self._pending if not future.done()]
+        batch, self._pending = pending[:self.max_batch_size], pending[self.max_batch_size:]
+        if not batch:
+            return
+        
+        self._running += 1
+        asyncio.ensure_future(self._run(batch))
+        
+        if self._pending and self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.max_wait, self._on_timer)
+    
+    async def _run(self, batch: List[tuple]):
+        images = [image for image, _ in batch]
+        try:
+            loop = asyncio.get_running_loop()
+            results = await loop.run_in_executor(self.executor, self.run_batch, images)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+            self.batches += 1
+            self.items += len(batch)
+            self.largest_batch = max(self.largest_batch, len(batch))
+        finally:
+            self._running -= 1
+            if self._pending:
+                self._dispatch()
+    
+    def stats(self) -> dict:
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "pending": len(self._pending),
+            "batches": self.batches,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "largest_batch": self.largest_batch
+        }
+
+class LocalPredictionEngine(PredictionEngine):
+    """
+    Classifier loaded in process (see local_model.py), run on the CPU in a worker pool.
+    Concurrent requests are micro-batched into a single forward pass.
+    """
+    name = "local_model"
+    
+    def __init__(
+        self,
+        model_path: Optional[str],
+        classes: Optional[List[str]] = None,
+        workers: int = 1,
+        max_batch_size: int = 16,
+        max_wait_ms: float = 5
+    ):
+        self.model_path = model_path
+        self.classes = classes
+        self.model = None
+        self.load_error: Optional[str] = None
+        self.inferences = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="local-inference")
+        self.batcher = MicroBatcher(
+            lambda images: self.model.predict(images),
+            self._executor,
+            workers=workers,
+            max_batch_size=max_batch_size,
+            max_wait_ms=max_wait_ms
+        )
+    
+    def load(self):
+        """Load the model once (called at startup); failures leave the engine unavailable"""
+        if not self.model_path:
+            return
+        try:
+            # NumPy (and ONNX Runtime) are only imported when a local model is configured
+            from local_model import load_model
+            
+            self.model = load_model(self.model_path, self.classes)
+            logger.info("Local model loaded from %s", self.model_path)
+        except Exception as e:
+            self.load_error = str(e)
+            logger.error("Failed to load local model from %s: %s", self.model_path, e)
+    
+    def is_available(self) -> bool:
+        return self.model is not None
+    
+    async def predict(self, image: Image.Image, image_bytes: bytes) -> dict:
+        if self.model is None:
+            raise HTTPException(status_code=503, detail="Local disease model is not loaded")
+        
+        try:
+            with timed("local_inference"):
+                label, confidence = await self.batcher.submit(image)
+        except Exception as e:
+            logger.exception("Local inference error: %s", e)
+            raise HTTPException(status_code=500, detail="Local disease model failed to classify the image")
+        
+        self.inferences += 1
+        return {
+            "prediction": label,
+            "confidence": confidence,
+            "confidence_percentage": f"{confidence * 100:.2f}%",
+            "timestamp": datetime.utcnow().isoformat(),
+            "source": self.name
+        }
+    
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+    
+    def stats(self) -> dict:
+        return {
+            "available": self.is_available(),
+            "model_path": self.model_path,
+            "load_error": self.load_error,
+            "inferences": self.inferences,
+            "batching": self.batcher.stats()
+        }
+
+class DiseasePredictor:
+    """
+    Routes predictions across engines.
+    
+    Routing modes:
+        remote_first: external API, local model when it fails or its breaker is open
+        local_first:  local model, external API when it fails or is not loaded
+        race:         both at once, the first usable answer wins
+    """
+    def __init__(
+        self,
+        remote: RemotePredictionEngine,
+        local: Optional[LocalPredictionEngine] = None,
+        routing: str = "remote_first"
+    ):
+        if routing not in ("remote_first", "local_first", "race"):
+            raise ValueError(f"Unknown PREDICTION_ROUTING: {routing}")
+        self.remote = remote
+        self.local = local
+        self.routing = routing
+        # Predictions currently in flight, keyed by image content hash
+        self._inflight: Dict[str, asyncio.Future] = {}
+        
+    async def predict(self, image: Image.Image) -> dict:
+        """
+        Run prediction on an image
+        
+        Concurrent requests for the same image share a single prediction.
+        
+        Args:
+            image: PIL Image object
+            
+        Returns:
+            dict: Prediction result with class and confidence
+        """
+        # Convert PIL image to JPEG bytes (for compatibility) off the event loop
+        with timed("encode"):
+            image_bytes = await image_pool.run(encode_jpeg, image, 95)
+        image_hash = hashlib.sha256(image_bytes).hexdigest()
+        
+        future = self._inflight.get(image_hash)
+        if future is None:
+            future = asyncio.ensure_future(self._route(image, image_bytes))
+            self._inflight[image_hash] = future
+            future.add_done_callback(lambda _: self._inflight.pop(image_hash, None))
+        else:
+            logger.debug("Joining in-flight prediction for image %s", image_hash[:12])
+        
+        # Shield the shared call so one disconnecting client does not cancel it for the others
+        result = dict(await asyncio.shield(future))
+        result["image_hash"] = image_hash
+        return result
+    
+    def _engines(self) -> List[PredictionEngine]:
+        if self.local is None:
+            return [self.remote]
+        if self.routing == "local_first":
+            return [self.local, self.remote]
+        return [self.remote, self.local]
+    
+    async def _route(self, image: Image.Image, image_bytes: bytes) -> dict:
+        engines = self._engines()
+        available = [engine for engine in engines if engine.is_available()]
+        
+        if self.routing == "race" and len(available) > 1:
+            return await self._race(available, image, image_bytes)
+        
+        # With nothing available, let the first engine produce its fail-fast error
+        fallback_result = None
+        error = None
+        for engine in available or engines[:1]:
+            try:
+                result = await engine.predict(image, image_bytes)
+            except HTTPException as e:
+                error = e
+                continue
+            if result.get("source") != "fallback":
+                return result
+            fallback_result = fallback_result or result
+        
+        if fallback_result is not None:
+            return fallback_result
+        raise error
+    
+    async def _race(self, engines: List[PredictionEngine], image: Image.Image, image_bytes: bytes) -> dict:
+        tasks = [asyncio.ensure_future(engine.predict(image, image_bytes)) for engine in engines]
+        fallback_result = None
+        error = None
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                try:
+                    result = await next_done
+                except HTTPException as e:
+                    error = e
+                    continue
+                if result.get("source") != "fallback":
+                    return result
+                fallback_result = fallback_result or result
+        finally:
+            # The loser is no longer needed
+            for task in tasks:
+                task.cancel()
+        
+        if fallback_result is not None:
+            return fallback_result
+        raise error
+
 # Initialize the predictor
-predictor = DiseasePredictor()
+admission = AdmissionController(
+    max_concurrency=PREDICT_MAX_CONCURRENCY,
+    max_queue=PREDICT_MAX_QUEUE,
+    queue_timeout=PREDICT_QUEUE_TIMEOUT,
+    retry_after=PREDICT_RETRY_AFTER
+)
+breaker = CircuitBreaker(
+    failure_threshold=BREAKER_FAILURE_RATE,
+    window_size=BREAKER_WINDOW,
+    min_calls=BREAKER_MIN_CALLS,
+    reset_timeout=BREAKER_RESET_TIMEOUT
+)
+local_engine = LocalPredictionEngine(
+    LOCAL_MODEL_PATH,
+    classes=LOCAL_MODEL_CLASSES.split(",") if LOCAL_MODEL_CLASSES else None,
+    workers=LOCAL_INFERENCE_WORKERS,
+    max_batch_size=LOCAL_BATCH_MAX_SIZE,
+    max_wait_ms=LOCAL_BATCH_MAX_WAIT_MS
+)
+predictor = DiseasePredictor(
+    remote=RemotePredictionEngine(admission=admission, breaker=breaker),
+    local=local_engine,
+    routing=PREDICTION_ROUTING
+)
+health_prober = UpstreamHealthProber(HEALTH_PROBE_URL, interval=HEALTH_PROBE_INTERVAL)
+
+# Prediction history (see prediction_store.py); off unless PREDICTION_STORE_URL is set
+prediction_store = store_from_url(os.getenv("PREDICTION_STORE_URL", ""))
+history_writer = PredictionHistoryWriter(
+    prediction_store,
+    max_queue=int(os.getenv("PREDICTION_HISTORY_QUEUE", "1000")),
+    batch_size=int(os.getenv("PREDICTION_HISTORY_BATCH", "100")),
+    flush_interval=float(os.getenv("PREDICTION_HISTORY_FLUSH_MS", "500")) / 1000.0
+) if prediction_store is not None else None
+
+# Callers identify themselves with a bearer JWT (HS256) whose `sub` is stored with their
+# predictions. PREDICTION_JWT_SECRET set to the Supabase JWT secret (with
+# PREDICTION_JWT_AUDIENCE=authenticated) accepts the app's session tokens; without it
+# every caller is anonymous.
+PREDICTION_JWT_SECRET = os.getenv("PREDICTION_JWT_SECRET", "")
+PREDICTION_JWT_AUDIENCE = os.getenv("PREDICTION_JWT_AUDIENCE") or None
+bearer_scheme = HTTPBearer(auto_error=False)
+
+def caller_id(credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer_scheme)) -> Optional[str]:
+    """
+    The caller's user id; None for anonymous callers: no token, no configured
+    secret, or a token that fails verification (predictions are still served)
+    """
+    if credentials is None or not PREDICTION_JWT_SECRET:
+        return None
+    try:
+        payload = jwt.decode(
+            credentials.credentials,
+            PREDICTION_JWT_SECRET,
+            algorithms=["HS256"],
+            audience=PREDICTION_JWT_AUDIENCE,
+            options={"verify_aud": PREDICTION_JWT_AUDIENCE is not None}
+        )
+    except JWTError:
+        logger.debug("Ignoring a bearer token that failed verification")
+        return None
+    return str(payload["sub"]) if payload.get("sub") else None
+
+def authenticated_caller_id(user_id: Optional[str] = Depends(caller_id)) -> str:
+    """caller_id() for endpoints that require a verified token"""
+    if user_id is None:
+        raise HTTPException(
+            status_code=401,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+    return user_id
+
+async def record_prediction(result: dict, started: float, filename: Optional[str], crop_type: Optional[str],
+                            user_id: Optional[str]):
+    if history_writer is not None:
+        latency_ms = (time.monotonic() - started) * 1000
+        await history_writer.record(make_record(result, latency_ms, filename, crop_type, user_id))
+
+@app.on_event("startup")
+async def start_background_tasks():
+    global history_writer
+    health_prober.start()
+    if history_writer is not None:
+        try:
+            await history_writer.start()
+        except Exception:
+            # Predictions are served without history rather than not at all
+            logger.exception("Could not open the prediction store; prediction history is disabled")
+            history_writer = None
+    # Load the local model once, off the event loop
+    await asyncio.get_running_loop().run_in_executor(None, local_engine.load)
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    await health_prober.stop()
+    if history_writer is not None:
+        await history_writer.stop()
+    image_pool.shutdown()
+    local_engine.shutdown()
 
 @app.get("/")
 async def root():
@@ -142,50 +898,70 @@ async def api_info():
 
 @app.get("/health")
 async def health_check():
-    """Health check endpoint"""
-    try:
-        # Test connectivity to external API
-        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=5)) as session:
-            async with session.get("https://apipoultrydisease.onrender.com/docs") as response:
-                external_api_status = "healthy" if response.status == 200 else "unhealthy"
-    except:
+    """Health check endpoint (answers from the background probe, never calls upstream)"""
+    external_api_status = health_prober.status
+    if breaker.state == CircuitBreaker.OPEN:
         external_api_status = "unhealthy"
     
     return {
         "status": "healthy",
         "timestamp": datetime.utcnow().isoformat(),
         "external_api_status": external_api_status,
+        "external_api_checked_at": health_prober.checked_at,
+        "external_api_latency_ms": health_prober.latency_ms,
         "services": {
             "image_processing": "healthy",
-            "disease_prediction": external_api_status
-        }
+            "disease_prediction": external_api_status,
+            "local_model": "healthy" if local_engine.is_available() else "unavailable"
+        },
+        "routing": predictor.routing,
+        "local_model": local_engine.stats(),
+        "prediction_history": history_writer.stats() if history_writer is not None else None,
+        "admission": admission.stats(),
+        "circuit_breaker": breaker.stats(),
+        "image_pool": image_pool.stats()
     }
 
+def upload_source(file: UploadFile):
+    """What to hand the image pool for an upload: its spooled file, or bytes for a process pool"""
+    file.file.seek(0)
+    if image_pool.kind == "process":
+        # File handles cannot be sent to another process
+        return file.file.read()
+    return file.file
+
 @app.post("/predict")
 async def predict_disease(
     file: UploadFile = File(...),
-    crop_type: Optional[str] = None
+    crop_type: Optional[str] = None,
+    user_id: Optional[str] = Depends(caller_id)
 ):
-    print(f"Received prediction request for file: {file.filename}, crop_type: {crop_type}")
+    started = time.monotonic()
+    logger.debug("Received prediction request for file: %s, crop_type: %s", file.filename, crop_type)
     
     # Check if the file is an image
     if not file.content_type.startswith('image/'):
         error_msg = f"File must be an image, got {file.content_type}"
-        print(error_msg)
+        logger.info(error_msg)
         raise HTTPException(status_code=400, detail=error_msg)
     
+    if file.size is not None and file.size > MAX_UPLOAD_BYTES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Upload too large (maximum is {MAX_UPLOAD_BYTES // (1024 * 1024)} MB)"
+        )
+    
     try:
-        # Read image file
-        contents = await file.read()
-        print(f"Read {len(contents)} bytes from image")
-        
-        image = Image.open(io.BytesIO(contents)).convert('RGB')
-        print(f"Image loaded: {image.size[0]}x{image.size[1]} pixels")
+        # Decode straight from the spooled upload instead of reading it into memory
+        logger.debug("Received %s bytes for image", file.size)
+        with timed("decode"):
+            image = await image_pool.run(decode_image, upload_source(file))
+        logger.debug("Image loaded: %sx%s pixels", image.size[0], image.size[1])
         
         # Make prediction using external API
-        print("Making prediction using external API...")
+        logger.debug("Making prediction (%s)...", predictor.routing)
         result = await predictor.predict(image)
-        print(f"Prediction result: {result}")
+        logger.debug("Prediction result: %s", result)
         
         # Add additional metadata
         result["filename"] = file.filename
@@ -194,6 +970,7 @@ async def predict_disease(
         if crop_type:
             result["crop_type"] = crop_type
         
+        await record_prediction(result, started, file.filename, crop_type, user_id)
         return result
         
     except HTTPException:
@@ -201,9 +978,114 @@ async def predict_disease(
         raise
     except Exception as e:
         error_msg = f"Error processing image: {str(e)}"
-        print(error_msg)
+        logger.exception(error_msg)
         raise HTTPException(status_code=500, detail=error_msg)
 
+@app.post("/predict/batch")
+async def predict_disease_batch(
+    files: List[UploadFile] = File(...),
+    crop_type: Optional[str] = None,
+    user_id: Optional[str] = Depends(caller_id)
+):
+    """
+    Predict diseases for many images uploaded in one multipart request.
+    
+    Images are read from their spooled uploads and decoded in the image worker pool
+    a few at a time, just ahead of the upstream slots, then sent upstream concurrently
+    (within the global admission limit). Results are streamed back as NDJSON, one line
+    per image in completion order; `index` is the image's position in the upload.
+    """
+    if len(files) > PREDICT_BATCH_MAX_FILES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many files: {len(files)} (maximum is {PREDICT_BATCH_MAX_FILES})"
+        )
+    
+    logger.debug("Received batch prediction request for %s files, crop_type: %s", len(files), crop_type)
+    
+    # Keep at most one admission slot's worth of images per batch in the upstream queue
+    # so a large batch waits its turn instead of overflowing the queue with 503s
+    dispatch_limit = asyncio.Semaphore(admission.max_concurrency)
+    # Uploads stay spooled until their turn: only this many images are decoded (read,
+    # for a process pool) ahead of an upstream slot, so a batch holds a bounded number
+    # of bitmaps. The files stay open until the streamed response has been sent.
+    decode_ahead = asyncio.Semaphore(2 * admission.max_concurrency)
+    
+    async def predict_one(index: int, file: UploadFile) -> dict:
+        started = time.monotonic()
+        item = {"index": index, "filename": file.filename}
+        
+        if file.size is not None and file.size > MAX_UPLOAD_BYTES:
+            item.update(status_code=413, detail=f"Upload too large (maximum is {MAX_UPLOAD_BYTES // (1024 * 1024)} MB)")
+            return item
+        
+        if not file.content_type or not file.content_type.startswith('image/'):
+            item.update(status_code=400, detail=f"File must be an image, got {file.content_type}")
+            return item
+        
+        try:
+            async with decode_ahead:
+                with timed("decode"):
+                    image = await image_pool.run(decode_image, upload_source(file))
+                image_size = f"{image.size[0]}x{image.size[1]}"
+                async with dispatch_limit:
+                    result = await predictor.predict(image)
+                del image
+        except HTTPException as e:
+            item.update(status_code=e.status_code, detail=e.detail)
+            return item
+        except Exception as e:
+            item.update(status_code=500, detail=f"Error processing image: {str(e)}")
+            return item
+        
+        item.update(result)
+        item["status_code"] = 200
+        item["image_size"] = image_size
+        if crop_type:
+            item["crop_type"] = crop_type
+        await record_prediction(item, started, file.filename, crop_type, user_id)
+        return item
+    
+    async def stream_results():
+        tasks = [asyncio.ensure_future(predict_one(index, file)) for index, file in enumerate(files)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield json.dumps(await next_done) + "\n"
+        finally:
+            # Client went away: stop the predictions that have not finished yet
+            for task in tasks:
+                task.cancel()
+    
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics: pipeline phase histograms plus admission, breaker, pool and history stats"""
+    body = render_metrics({
+        "prediction_admission": admission.stats(),
+        "prediction_circuit_breaker": breaker.stats(),
+        "image_pool": image_pool.stats(),
+        "local_model": local_engine.stats(),
+        "prediction_history": history_writer.stats() if history_writer is not None else None
+    })
+    return PlainTextResponse(body, media_type=CONTENT_TYPE)
+
+@app.get("/predictions")
+async def list_predictions(page: int = 1, page_size: int = 20, user_id: str = Depends(authenticated_caller_id)):
+    """The caller's prediction history, newest first"""
+    if history_writer is None:
+        raise HTTPException(status_code=404, detail="Prediction history is disabled")
+    if page < 1 or not 1 <= page_size <= 100:
+        raise HTTPException(status_code=400, detail="page must be >= 1 and page_size between 1 and 100")
+    
+    count, results = await history_writer.list_page(user_id, page_size, (page - 1) * page_size)
+    return {
+        "count": count,
+        "page": page,
+        "page_size": page_size,
+        "results": results
+    }
+
 if __name__ == "__main__":
     import uvicorn
     import os
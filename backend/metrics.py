@@ -0,0 +1,208 @@
+"""
+Request timing and Prometheus metrics.
+
+Histogram and render_metrics() are shared by both FastAPI apps; the rest of
+this module times the prediction pipeline.
+
+ServerTimingMiddleware gives every timed request a PhaseTimer; code along the
+prediction pipeline wraps its work in `timed("<phase>")`. Each phase duration
+is then
+    - sent back in the request's Server-Timing response header, and
+    - observed into the `prediction_phase_seconds` histogram on /metrics.
+
+Phases: upload (receiving the request body), decode, encode, admission_wait,
+upstream (external API call) and local_inference.
+"""
+import contextvars
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Prometheus text exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# The upstream call can take 30+ seconds on a cold start
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels, rendered in Prometheus format."""
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts, sum, count]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        # Some histograms are observed from worker threads (e.g. the sync DB pool)
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._series.items())
+        for key, (counts, total, count) in snapshot:
+            labels = dict(zip(self.label_names, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_labels({**labels, 'le': _number(bound)})} {cumulative}")
+            lines.append(f"{self.name}_bucket{_labels({**labels, 'le': '+Inf'})} {count}")
+            lines.append(f"{self.name}_sum{_labels(labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(labels)} {count}")
+        return lines
+
+
+PHASE_SECONDS = Histogram(
+    "prediction_phase_seconds",
+    "Time spent in each phase of the prediction pipeline.",
+    ["phase"]
+)
+REQUEST_SECONDS = Histogram(
+    "prediction_request_seconds",
+    "End-to-end time of prediction requests.",
+    ["path", "status"]
+)
+HISTOGRAMS = [PHASE_SECONDS, REQUEST_SECONDS]
+
+
+class PhaseTimer:
+    """Phase durations collected for one request."""
+
+    def __init__(self):
+        self.phases: Dict[str, float] = {}
+
+    def add(self, phase: str, seconds: float):
+        # A phase that runs more than once (e.g. per image) is reported as its total
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def header(self, total: Optional[float] = None) -> str:
+        """Server-Timing header value, durations in milliseconds."""
+        entries = [f"{phase};dur={seconds * 1000:.1f}" for phase, seconds in self.phases.items()]
+        if total is not None:
+            entries.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(entries)
+
+
+_current_timer: contextvars.ContextVar = contextvars.ContextVar("prediction_timer", default=None)
+
+
+def record_phase(phase: str, seconds: float):
+    """Observe a phase duration, and add it to the current request's timer if there is one."""
+    PHASE_SECONDS.observe(seconds, phase=phase)
+    timer = _current_timer.get()
+    if timer is not None:
+        timer.add(phase, seconds)
+
+
+@contextmanager
+def timed(phase: str):
+    """Time the enclosed block as `phase` (failed attempts included)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_phase(phase, time.perf_counter() - started)
+
+
+class ServerTimingMiddleware:
+    """
+    Times requests to the given paths: records the upload phase, adds a
+    Server-Timing header with every phase finished before the response
+    starts, and observes the end-to-end time in `prediction_request_seconds`.
+
+    Streaming responses send their headers early, so their Server-Timing only
+    covers what happened before the first byte; the histograms get everything.
+    """
+
+    def __init__(self, app, paths: Iterable[str]):
+        self.app = app
+        self.paths = set(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        timer = PhaseTimer()
+        token = _current_timer.set(timer)
+        started = time.perf_counter()
+        status = 500
+
+        async def timed_receive():
+            message = await receive()
+            if message["type"] == "http.request" and not message.get("more_body", False):
+                record_phase("upload", time.perf_counter() - started)
+            return message
+
+        async def timed_send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                header = timer.header(time.perf_counter() - started).encode("latin-1")
+                message = {**message, "headers": [*message.get("headers", []), (b"server-timing", header)]}
+            await send(message)
+
+        try:
+            await self.app(scope, timed_receive, timed_send)
+        finally:
+            REQUEST_SECONDS.observe(time.perf_counter() - started, path=scope["path"], status=str(status))
+            _current_timer.reset(token)
+
+
+def _render_stats(prefix: str, stats: dict) -> List[str]:
+    # Numbers and booleans become gauges, strings an info-style series with the
+    # value as a label; nested dicts are flattened into the metric name
+    lines = []
+    for key, value in stats.items():
+        name = f"{prefix}_{key}"
+        if isinstance(value, dict):
+            lines.extend(_render_stats(name, value))
+        elif isinstance(value, bool):
+            lines.extend([f"# TYPE {name} gauge", f"{name} {int(value)}"])
+        elif isinstance(value, (int, float)):
+            lines.extend([f"# TYPE {name} gauge", f"{name} {_number(value)}"])
+        elif isinstance(value, str):
+            lines.extend([f"# TYPE {name}_info gauge", f"{name}_info{_labels({key: value})} 1"])
+    return lines
+
+
+def render_metrics(stats: Dict[str, Optional[dict]], histograms: Sequence[Histogram] = HISTOGRAMS) -> str:
+    """Histograms (the prediction ones by default) plus component stats (metric prefix -> stats dict)."""
+    lines = []
+    for histogram in histograms:
+        lines.extend(histogram.render())
+    for prefix, component_stats in stats.items():
+        if component_stats is not None:
+            lines.extend(_render_stats(prefix, component_stats))
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,319 @@
+"""
+Prediction history for the disease prediction API.
+
+Every prediction served by /predict is recorded (image hash, result, latency,
+source) with the id of the authenticated caller, so the frontend does not need
+a second round-trip to store it. GET /predictions lists the caller's own
+records; predictions made without a token are stored without a user and are
+never listed.
+Records go through PredictionHistoryWriter, which buffers them in memory and
+writes them in batches off the event loop; requests never wait on the
+database.
+
+Stores are chosen by PREDICTION_STORE_URL:
+    (empty)                     history disabled (default)
+    sqlite:///predictions.db    SQLite via the standard library, for tests and development
+    postgresql://...            any SQLAlchemy URL (SQLAlchemy required)
+"""
+import asyncio
+import json
+import logging
+import sqlite3
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = (
+    "id", "created_at", "user_id", "image_hash", "filename", "prediction",
+    "confidence", "source", "latency_ms", "crop_type", "result",
+)
+
+
+def make_record(result: dict, latency_ms: float, filename: Optional[str] = None,
+                crop_type: Optional[str] = None, user_id: Optional[str] = None) -> dict:
+    """Build a history record from a prediction result."""
+    return {
+        "id": uuid.uuid4().hex,
+        "created_at": datetime.utcnow().isoformat(),
+        "user_id": user_id,
+        "image_hash": result.get("image_hash"),
+        "filename": filename,
+        "prediction": result.get("prediction"),
+        "confidence": result.get("confidence"),
+        "source": result.get("source"),
+        "latency_ms": round(latency_ms, 2),
+        "crop_type": crop_type,
+        "result": json.dumps(result, default=str),
+    }
+
+
+class PredictionStore:
+    """Synchronous storage backend; always called from the writer's own thread."""
+
+    def open(self):
+        """Create the table if needed."""
+
+    def write_batch(self, records: List[dict]):
+        raise NotImplementedError
+
+    def list_page(self, user_id: str, limit: int, offset: int) -> Tuple[int, List[dict]]:
+        """Return (total count, records newest first) of one user."""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    @staticmethod
+    def _to_dict(record: dict) -> dict:
+        record = dict(record)
+        record["result"] = json.loads(record["result"]) if record.get("result") else None
+        return record
+
+
+class SQLitePredictionStore(PredictionStore):
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def open(self):
+        # Only ever used from the writer's single thread
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS prediction_history (
+                id TEXT PRIMARY KEY,
+                created_at TEXT NOT NULL,
+                user_id TEXT,
+                image_hash TEXT,
+                filename TEXT,
+                prediction TEXT,
+                confidence REAL,
+                source TEXT,
+                latency_ms REAL,
+                crop_type TEXT,
+                result TEXT
+            )
+            """
+        )
+        # Tables created before records carried a user
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(prediction_history)")}
+        if "user_id" not in columns:
+            self._conn.execute("ALTER TABLE prediction_history ADD COLUMN user_id TEXT")
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_prediction_history_user_created_at "
+            "ON prediction_history (user_id, created_at)"
+        )
+        self._conn.commit()
+
+    def write_batch(self, records: List[dict]):
+        placeholders = ", ".join(f":{column}" for column in COLUMNS)
+        with self._conn:
+            self._conn.executemany(
+                f"INSERT INTO prediction_history ({', '.join(COLUMNS)}) VALUES ({placeholders})",
+                records,
+            )
+
+    def list_page(self, user_id: str, limit: int, offset: int) -> Tuple[int, List[dict]]:
+        total = self._conn.execute(
+            "SELECT COUNT(*) FROM prediction_history WHERE user_id = ?", (user_id,)
+        ).fetchone()[0]
+        rows = self._conn.execute(
+            "SELECT * FROM prediction_history WHERE user_id = ? "
+            "ORDER BY created_at DESC LIMIT ? OFFSET ?",
+            (user_id, limit, offset),
+        ).fetchall()
+        return total, [self._to_dict(dict(row)) for row in rows]
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+class SQLAlchemyPredictionStore(PredictionStore):
+    def __init__(self, url: str):
+        self.url = url
+        self._engine = None
+        self._table = None
+
+    def open(self):
+        from sqlalchemy import Column, Float, Index, MetaData, String, Table, Text, create_engine, inspect, text
+
+        metadata = MetaData()
+        self._table = Table(
+            "prediction_history", metadata,
+            Column("id", String(32), primary_key=True),
+            Column("created_at", String(32), nullable=False),
+            Column("user_id", String(64)),
+            Column("image_hash", String(64)),
+            Column("filename", Text),
+            Column("prediction", String(255)),
+            Column("confidence", Float),
+            Column("source", String(32)),
+            Column("latency_ms", Float),
+            Column("crop_type", String(100)),
+            Column("result", Text),
+        )
+        index = Index("idx_prediction_history_user_created_at", self._table.c.user_id, self._table.c.created_at)
+        self._engine = create_engine(self.url, pool_pre_ping=True)
+        metadata.create_all(self._engine)
+        # Tables created before records carried a user
+        columns = {column["name"] for column in inspect(self._engine).get_columns("prediction_history")}
+        if "user_id" not in columns:
+            with self._engine.begin() as conn:
+                conn.execute(text("ALTER TABLE prediction_history ADD COLUMN user_id VARCHAR(64)"))
+            index.create(self._engine, checkfirst=True)
+
+    def write_batch(self, records: List[dict]):
+        with self._engine.begin() as conn:
+            conn.execute(self._table.insert(), records)
+
+    def list_page(self, user_id: str, limit: int, offset: int) -> Tuple[int, List[dict]]:
+        from sqlalchemy import func, select
+
+        mine = self._table.c.user_id == user_id
+        with self._engine.connect() as conn:
+            total = conn.execute(select(func.count()).select_from(self._table).where(mine)).scalar_one()
+            rows = conn.execute(
+                select(self._table)
+                .where(mine)
+                .order_by(self._table.c.created_at.desc())
+                .limit(limit)
+                .offset(offset)
+            ).mappings().all()
+        return total, [self._to_dict(dict(row)) for row in rows]
+
+    def close(self):
+        if self._engine is not None:
+            self._engine.dispose()
+
+
+def store_from_url(url: Optional[str]) -> Optional[PredictionStore]:
+    if not url:
+        return None
+    if url.startswith("sqlite:///"):
+        return SQLitePredictionStore(url[len("sqlite:///"):])
+    return SQLAlchemyPredictionStore(url)
+
+
+class PredictionHistoryWriter:
+    """
+    Buffered asynchronous writer.
+
+    `record()` puts a record on a bounded in-memory queue. A background task
+    drains the queue into batches of up to `batch_size` records, or whatever
+    arrived within `flush_interval` seconds, and inserts each batch in one
+    statement on the store's thread. When the queue is full, `record()`
+    waits at most `max_block` seconds for room (backpressure) and then drops
+    the record rather than stall the request.
+    """
+
+    def __init__(self, store: PredictionStore, max_queue: int = 1000, batch_size: int = 100,
+                 flush_interval: float = 0.5, max_block: float = 0.05):
+        self.store = store
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_block = max_block
+        self.max_queue = max_queue
+        # Queue and executor are created in start() so a restarted app gets fresh ones
+        self._queue: Optional[asyncio.Queue] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._task: Optional[asyncio.Task] = None
+
+        # Metrics
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+
+    async def _call(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def start(self):
+        """Open the store; raises, leaving the writer stopped, when that fails."""
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prediction-store")
+        try:
+            await self._call(self.store.open)
+        except BaseException:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+            raise
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Flush whatever is buffered, then close the store."""
+        if self._executor is None:
+            # Never started, or start() failed
+            return
+        if self._task is not None:
+            # Sentinel: the flush loop writes everything queued before it, then exits
+            await self._queue.put(None)
+            await self._task
+            self._task = None
+        await self._call(self.store.close)
+        self._executor.shutdown(wait=True)
+        self._executor = None
+
+    async def record(self, record: dict):
+        if self._queue is None:
+            self.dropped += 1
+            return
+        try:
+            self._queue.put_nowait(record)
+        except asyncio.QueueFull:
+            try:
+                await asyncio.wait_for(self._queue.put(record), timeout=self.max_block)
+            except asyncio.TimeoutError:
+                self.dropped += 1
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            record = await self._queue.get()
+            if record is None:
+                break
+            batch = [record]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    record = await asyncio.wait_for(self._queue.get(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    break
+                if record is None:
+                    stopping = True
+                    break
+                batch.append(record)
+            await self._flush(batch)
+
+    async def _flush(self, batch: List[dict]):
+        try:
+            await self._call(self.store.write_batch, batch)
+        except Exception as e:
+            self.failed += len(batch)
+            logger.error("Failed to write %s prediction records: %s", len(batch), e)
+            return
+        self.written += len(batch)
+        self.batches += 1
+
+    async def list_page(self, user_id: str, limit: int, offset: int) -> Tuple[int, List[dict]]:
+        return await self._call(self.store.list_page, user_id, limit, offset)
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "max_queue": self.max_queue,
+            "written": self.written,
+            "batches": self.batches,
+            "dropped": self.dropped,
+            "failed": self.failed,
+        }
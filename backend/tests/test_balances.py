@@ -0,0 +1,100 @@
+"""
+Point-in-time balances (apps/consolidated/balances.py): a read between
+snapshots must equal a replay of the item's full ledger.
+"""
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+from django.core.management import call_command
+from django.utils import timezone
+
+from apps.consolidated.balances import balance_at, balances_at
+from apps.consolidated.models import Farm, InventoryBalanceSnapshot, InventoryItem, InventoryTransaction, User
+from apps.consolidated.stock import record_transaction
+
+pytestmark = pytest.mark.django_db
+
+# (day of March 2026, hour, type, quantity); adjustments carry their own sign
+LEDGER = [
+    (1, 8, 'purchase', '100'),
+    (1, 17, 'usage', '12.5'),
+    (2, 9, 'adjustment', '-4'),
+    (2, 18, 'wastage', '1.25'),
+    (3, 7, 'transfer_in', '20'),
+    (3, 12, 'usage', '30'),
+    (3, 20, 'adjustment', '2.5'),
+    (4, 10, 'transfer_out', '15'),
+    (5, 11, 'usage', '8'),
+]
+
+
+def at(day, hour, minute=0):
+    return timezone.make_aware(datetime(2026, 3, day, hour, minute))
+
+
+def replay(item, instant):
+    """The balance at `instant` from every ledger row, without snapshots."""
+    balance = Decimal(0)
+    for row in InventoryTransaction.objects.filter(item=item, transaction_date__lte=instant):
+        if row.transaction_type in ('usage', 'wastage', 'transfer_out'):
+            balance -= row.quantity
+        else:
+            balance += row.quantity
+    return balance
+
+
+@pytest.fixture
+def items():
+    owner = User.objects.create_user(email='balances@example.com', username='balances', password=None)
+    farm = Farm.objects.create(name='Balances', owner=owner, location='-', size=1)
+    feed = InventoryItem.objects.create(name='Feed', farm=farm, unit='kg')
+    grit = InventoryItem.objects.create(name='Grit', farm=farm, unit='kg')
+    for day, hour, transaction_type, quantity in LEDGER:
+        record_transaction(feed, transaction_type, Decimal(quantity), transaction_date=at(day, hour))
+    record_transaction(grit, 'purchase', Decimal('3'), transaction_date=at(2, 12))
+    return feed, grit
+
+
+@pytest.mark.parametrize('instant', [
+    at(1, 8), at(2, 12), at(3, 0), at(3, 12), at(3, 15, 30), at(4, 23, 59), at(6, 0),
+])
+def test_balance_between_snapshots_matches_a_full_replay(items, instant):
+    feed, grit = items
+    call_command('snapshot_inventory_balances', until='2026-03-04')
+    assert InventoryBalanceSnapshot.objects.filter(item=feed).count() == 3
+
+    assert balance_at(feed.pk, instant) == replay(feed, instant)
+    assert balances_at([feed.pk, grit.pk], instant) == {
+        feed.pk: replay(feed, instant),
+        grit.pk: replay(grit, instant),
+    }
+
+
+def test_snapshot_holds_the_balance_before_its_time(items):
+    feed, _ = items
+    call_command('snapshot_inventory_balances', until='2026-03-04')
+
+    snapshot = InventoryBalanceSnapshot.objects.get(item=feed, taken_at=at(3, 0))
+    assert snapshot.quantity == Decimal('82.25')
+    assert snapshot.transaction_count == 2
+
+
+def test_latest_balance_matches_current_quantity(items):
+    feed, _ = items
+    call_command('snapshot_inventory_balances', until='2026-03-06')
+
+    feed.refresh_from_db()
+    assert balance_at(feed.pk, at(6, 12)) == feed.current_quantity == Decimal('51.75')
+
+
+def test_backdated_transaction_drops_later_snapshots(items):
+    feed, _ = items
+    call_command('snapshot_inventory_balances', until='2026-03-04')
+
+    record_transaction(feed, 'adjustment', Decimal('-6'), transaction_date=at(2, 20))
+
+    assert list(
+        InventoryBalanceSnapshot.objects.filter(item=feed).values_list('taken_at', flat=True)
+    ) == [at(2, 0)]
+    assert balance_at(feed.pk, at(3, 12)) == replay(feed, at(3, 12))
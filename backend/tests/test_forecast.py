@@ -0,0 +1,107 @@
+"""
+Consumption forecasts (apps/consolidated/forecast.py): the running update
+done per transaction must agree with the NumPy rebuild, and the
+inventory_days_lt rule fires on the forecast's days of stock.
+"""
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+import pytest
+from django.conf import settings
+from django.core.management import call_command
+from django.utils import timezone
+
+from apps.consolidated.forecast import check_low_stock_alerts, consumption_rates, stock_forecasts
+from apps.consolidated.models import Alert, AlertRule, Farm, InventoryConsumption, InventoryItem, User
+from apps.consolidated.stock import record_transaction
+
+pytestmark = pytest.mark.django_db
+
+# (day, quantity) in recording order: same-day entries, idle gaps and backdated days
+USAGE = [
+    (date(2026, 2, 1), '12'),
+    (date(2026, 2, 1), '3.5'),
+    (date(2026, 2, 2), '10'),
+    (date(2026, 2, 6), '7.25'),
+    (date(2026, 2, 4), '5'),
+    (date(2026, 2, 6), '1'),
+    (date(2026, 2, 9), '20'),
+    (date(2026, 1, 30), '4'),
+    (date(2026, 2, 9), '2.5'),
+]
+
+
+def noon(day):
+    return timezone.make_aware(datetime.combine(day, time(12)))
+
+
+@pytest.fixture
+def farm():
+    owner = User.objects.create_user(email='forecast@example.com', username='forecast', password=None)
+    return Farm.objects.create(name='Forecast', owner=owner, location='-', size=1)
+
+
+def expected_rate(usage, today):
+    """The bias-corrected EWMA of daily consumption before `today`, from its definition."""
+    r = 0.5 ** (1 / settings.INVENTORY_FORECAST_HALF_LIFE_DAYS)
+    daily = {}
+    for day, quantity in usage:
+        daily[day] = daily.get(day, 0) + float(quantity)
+    first = min(daily)
+    weighted = sum((1 - r) * r ** ((today - day).days - 1) * x for day, x in daily.items() if day < today)
+    return weighted / (1 - r ** (today - first).days)
+
+
+def test_running_update_matches_the_rebuild(farm):
+    item = InventoryItem.objects.create(name='Feed', farm=farm, unit='kg')
+    record_transaction(item, 'purchase', Decimal('500'), transaction_date=noon(date(2026, 1, 1)))
+    for day, quantity in USAGE:
+        record_transaction(item, 'usage', Decimal(quantity), transaction_date=noon(day))
+    running = InventoryConsumption.objects.get(item=item)
+
+    call_command('rebuild_consumption_forecasts')
+    rebuilt = InventoryConsumption.objects.get(item=item)
+
+    assert (rebuilt.first_day, rebuilt.last_day) == (running.first_day, running.last_day) == (
+        date(2026, 1, 30), date(2026, 2, 9)
+    )
+    assert rebuilt.last_day_quantity == pytest.approx(running.last_day_quantity) == 22.5
+    assert rebuilt.weighted_rate == pytest.approx(running.weighted_rate)
+    for today in (date(2026, 2, 9), date(2026, 2, 10), date(2026, 2, 20)):
+        running_rate, rebuilt_rate = consumption_rates([running, rebuilt], today)
+        assert running_rate == pytest.approx(rebuilt_rate)
+    assert consumption_rates([running], date(2026, 2, 12))[0] == pytest.approx(
+        expected_rate(USAGE, date(2026, 2, 12))
+    )
+
+
+def test_no_rate_until_a_day_with_consumption_has_ended(farm):
+    item = InventoryItem.objects.create(name='Feed', farm=farm, unit='kg')
+    record_transaction(item, 'purchase', Decimal('50'))
+    record_transaction(item, 'usage', Decimal('5'))
+
+    assert stock_forecasts([item])[item.id] == {'daily_consumption': None, 'days_of_stock': None}
+
+
+def test_days_of_stock_rule(farm):
+    item = InventoryItem.objects.create(name='Feed', farm=farm, unit='kg')
+    today = timezone.localdate()
+    record_transaction(item, 'purchase', Decimal('140'), transaction_date=noon(today - timedelta(days=11)))
+    for days_ago in range(10, 0, -1):
+        record_transaction(item, 'usage', Decimal('10'), transaction_date=noon(today - timedelta(days=days_ago)))
+
+    # 40 kg left at a steady 10 kg/day
+    assert stock_forecasts([item])[item.id] == {'daily_consumption': 10.0, 'days_of_stock': 4.0}
+    firing = AlertRule.objects.create(name='Short', condition_type='inventory_days_lt', condition_value=5,
+                                      inventory_item=item, farm=farm)
+    quiet = AlertRule.objects.create(name='Critical', condition_type='inventory_days_lt', condition_value=3,
+                                     inventory_item=item, farm=farm)
+    level = AlertRule.objects.create(name='Level', condition_type='inventory_low', condition_value=20, farm=farm)
+
+    check_low_stock_alerts([item.id])
+    check_low_stock_alerts([item.id])
+
+    alert = Alert.objects.get()
+    assert alert.rule == firing
+    assert alert.triggered_value == 4.0
+    assert not quiet.alerts.exists() and not level.alerts.exists()
@@ -0,0 +1,108 @@
+"""Bulk inventory transaction import (InventoryTransactionViewSet.bulk)."""
+from decimal import Decimal
+
+import pytest
+from django.core.files.uploadedfile import SimpleUploadedFile
+from rest_framework.test import APIClient
+
+from apps.consolidated.models import Farm, InventoryItem, InventoryTransaction, User
+
+pytestmark = pytest.mark.django_db
+
+URL = '/api/inventory/transactions/bulk/'
+
+
+@pytest.fixture
+def user(settings):
+    settings.API_ACCESS_LOG = {**settings.API_ACCESS_LOG, 'ENABLED': False}
+    settings.API_RATE_LIMIT_ENABLED = False
+    return User.objects.create_user(email='bulk@example.com', username='bulk', password=None, is_staff=True)
+
+
+@pytest.fixture
+def client(user):
+    client = APIClient()
+    client.force_authenticate(user)
+    return client
+
+
+@pytest.fixture
+def items(user):
+    farm = Farm.objects.create(name='Bulk', owner=user, location='-', size=1)
+    return [
+        InventoryItem.objects.create(name=name, farm=farm, unit='kg', unit_price=Decimal('2.00'))
+        for name in ('Feed', 'Grit')
+    ]
+
+
+def test_records_all_lines_and_moves_balances(client, items):
+    feed, grit = items
+    response = client.post(URL, [
+        {'item': str(feed.pk), 'transaction_type': 'purchase', 'quantity': '40', 'unit_price': '3.50'},
+        {'item': str(feed.pk), 'transaction_type': 'usage', 'quantity': '15'},
+        {'item': str(grit.pk), 'transaction_type': 'purchase', 'quantity': '5'},
+    ], format='json')
+
+    assert response.status_code == 201, response.data
+    assert response.data['count'] == 3
+    feed.refresh_from_db()
+    grit.refresh_from_db()
+    assert feed.current_quantity == Decimal('25')
+    assert feed.unit_price == Decimal('3.50')
+    assert grit.current_quantity == Decimal('5')
+    usage = InventoryTransaction.objects.get(item=feed, transaction_type='usage')
+    assert usage.total_amount == Decimal('30.00')
+
+
+def test_insufficient_stock_records_nothing(client, items):
+    feed, grit = items
+    response = client.post(URL, [
+        {'item': str(grit.pk), 'transaction_type': 'purchase', 'quantity': '5'},
+        {'item': str(feed.pk), 'transaction_type': 'usage', 'quantity': '1'},
+    ], format='json')
+
+    assert response.status_code == 400
+    assert [line['line'] for line in response.data['lines']] == [2]
+    assert not InventoryTransaction.objects.exists()
+    grit.refresh_from_db()
+    assert grit.current_quantity == 0
+
+
+def test_total_amount_out_of_range_is_a_validation_error(client, items):
+    feed, _ = items
+    response = client.post(URL, [
+        {'item': str(feed.pk), 'transaction_type': 'purchase', 'quantity': '10'},
+        {'item': str(feed.pk), 'transaction_type': 'purchase', 'quantity': '20000', 'unit_price': '5000'},
+    ], format='json')
+
+    assert response.status_code == 400
+    assert [line['line'] for line in response.data['lines']] == [2]
+    assert 'unit_price' in response.data['lines'][0]['errors']
+    assert not InventoryTransaction.objects.exists()
+
+
+def test_total_amount_at_the_item_price_is_checked(client, items):
+    feed, _ = items
+    InventoryItem.objects.filter(pk=feed.pk).update(current_quantity=Decimal('99999999'))
+    response = client.post(URL, [
+        {'item': str(feed.pk), 'transaction_type': 'usage', 'quantity': '60000000'},
+    ], format='json')
+
+    assert response.status_code == 400
+    assert response.data['lines'][0]['line'] == 1
+    assert 'quantity' in response.data['lines'][0]['errors']
+    assert not InventoryTransaction.objects.exists()
+
+
+def test_csv_upload_reports_csv_line_numbers(client, items):
+    feed, _ = items
+    upload = SimpleUploadedFile('invoice.csv', (
+        'item,transaction_type,quantity,unit_price\n'
+        f'{feed.pk},purchase,12,1.25\n'
+        f'{feed.pk},purchase,-3,\n'
+    ).encode(), content_type='text/csv')
+
+    response = client.post(URL, {'file': upload}, format='multipart')
+
+    assert response.status_code == 400
+    assert [line['line'] for line in response.data['lines']] == [3]
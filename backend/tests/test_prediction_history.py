@@ -0,0 +1,172 @@
+"""
+Prediction history (prediction_store.py): the buffered writer against a
+SQLite store, and GET /predictions paging and per-caller scoping.
+"""
+import asyncio
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from jose import jwt
+
+import main
+from prediction_store import PredictionHistoryWriter, SQLitePredictionStore, make_record
+
+SECRET = "test-prediction-secret"
+
+
+def record(user_id="alice", prediction="Healthy", created_at=None):
+    result = make_record({"prediction": prediction, "confidence": 0.9, "source": "local"}, 12.5,
+                         user_id=user_id)
+    if created_at is not None:
+        result["created_at"] = created_at.isoformat()
+    return result
+
+
+def stored(path):
+    store = SQLitePredictionStore(str(path))
+    store.open()
+    try:
+        return store._conn.execute("SELECT COUNT(*) FROM prediction_history").fetchone()[0]
+    finally:
+        store.close()
+
+
+class GatedStore(SQLitePredictionStore):
+    """Holds every write until `gate` is set."""
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.gate = threading.Event()
+
+    def write_batch(self, records):
+        self.gate.wait(5)
+        super().write_batch(records)
+
+
+@pytest.mark.asyncio
+async def test_writer_batches_records(tmp_path):
+    writer = PredictionHistoryWriter(SQLitePredictionStore(str(tmp_path / "history.db")),
+                                     batch_size=3, flush_interval=60)
+    await writer.start()
+    for _ in range(7):
+        await writer.record(record())
+    await writer.stop()
+
+    assert (writer.written, writer.batches, writer.dropped) == (7, 3, 0)
+    assert stored(tmp_path / "history.db") == 7
+
+
+@pytest.mark.asyncio
+async def test_writer_flushes_after_the_interval(tmp_path):
+    writer = PredictionHistoryWriter(SQLitePredictionStore(str(tmp_path / "history.db")),
+                                     batch_size=100, flush_interval=0.05)
+    await writer.start()
+    try:
+        await writer.record(record())
+        await asyncio.sleep(0.5)
+        assert writer.written == 1
+        assert stored(tmp_path / "history.db") == 1
+    finally:
+        await writer.stop()
+
+
+@pytest.mark.asyncio
+async def test_writer_drops_records_when_the_queue_is_full(tmp_path):
+    store = GatedStore(str(tmp_path / "history.db"))
+    writer = PredictionHistoryWriter(store, max_queue=2, batch_size=1, flush_interval=0.01, max_block=0.01)
+    await writer.start()
+    try:
+        # The first record is taken off the queue and held in write_batch
+        await writer.record(record())
+        await asyncio.sleep(0.1)
+        for _ in range(4):
+            await writer.record(record())
+        assert writer.dropped == 2
+        assert writer.stats()["queued"] == 2
+    finally:
+        store.gate.set()
+        await writer.stop()
+
+    assert writer.written == 3
+    assert stored(tmp_path / "history.db") == 3
+
+
+@pytest.mark.asyncio
+async def test_stop_flushes_buffered_records(tmp_path):
+    writer = PredictionHistoryWriter(SQLitePredictionStore(str(tmp_path / "history.db")),
+                                     batch_size=100, flush_interval=60)
+    await writer.start()
+    for _ in range(5):
+        await writer.record(record())
+    await writer.stop()
+
+    assert writer.written == 5
+    assert stored(tmp_path / "history.db") == 5
+
+
+@pytest.mark.asyncio
+async def test_records_before_start_are_dropped(tmp_path):
+    writer = PredictionHistoryWriter(SQLitePredictionStore(str(tmp_path / "history.db")))
+    await writer.record(record())
+    assert writer.dropped == 1
+
+
+def token(user_id, secret=SECRET):
+    return {"Authorization": f"Bearer {jwt.encode({'sub': user_id}, secret, algorithm='HS256')}"}
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    store = SQLitePredictionStore(str(tmp_path / "history.db"))
+    store.open()
+    start = datetime(2026, 1, 1)
+    store.write_batch(
+        [record("alice", f"alice-{n}", start + timedelta(minutes=n)) for n in range(5)]
+        + [record("bob", f"bob-{n}", start + timedelta(minutes=n)) for n in range(2)]
+        + [record(None, "anonymous", start)]
+    )
+    # Not started: list_page() only needs the store
+    monkeypatch.setattr(main, "history_writer", PredictionHistoryWriter(store))
+    monkeypatch.setattr(main, "PREDICTION_JWT_SECRET", SECRET)
+    yield TestClient(main.app)
+    store.close()
+
+
+def test_predictions_are_paged_newest_first(client):
+    response = client.get("/predictions", params={"page": 2, "page_size": 2}, headers=token("alice"))
+
+    assert response.status_code == 200
+    body = response.json()
+    assert (body["count"], body["page"], body["page_size"]) == (5, 2, 2)
+    assert [result["prediction"] for result in body["results"]] == ["alice-2", "alice-1"]
+    assert body["results"][0]["result"]["confidence"] == 0.9
+
+
+def test_predictions_are_scoped_to_the_caller(client):
+    body = client.get("/predictions", headers=token("bob")).json()
+
+    assert body["count"] == 2
+    assert {result["user_id"] for result in body["results"]} == {"bob"}
+
+
+@pytest.mark.parametrize("headers", [{}, token("alice", secret="another-key")])
+def test_predictions_require_a_verified_token(client, headers):
+    response = client.get("/predictions", headers=headers)
+
+    assert response.status_code == 401
+
+
+def test_unverified_token_still_gets_predictions(client):
+    # Rejected for not being an image, not for the token
+    response = client.post("/predict", headers=token("alice", secret="another-key"),
+                           files={"file": ("notes.txt", b"text", "text/plain")})
+
+    assert response.status_code == 400
+
+
+def test_page_size_is_bounded(client):
+    response = client.get("/predictions", params={"page_size": 101}, headers=token("alice"))
+
+    assert response.status_code == 400
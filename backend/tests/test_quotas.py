@@ -0,0 +1,95 @@
+"""
+Subscription quotas (apps/consolidated/quotas.py): the conditional-UPDATE
+reserve() and release(), and `manage.py reconcile_quotas`.
+"""
+import pytest
+from django.core.cache import cache
+from django.core.management import call_command
+
+from apps.consolidated.models import Device, Farm, SubscriptionPlan, User, UserQuotaUsage
+from apps.consolidated.quotas import QuotaExceeded, release, reserve
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture(autouse=True)
+def free_plan():
+    # Plans are cached per user; start from an empty cache
+    cache.clear()
+    yield SubscriptionPlan.objects.create(
+        name='Free', plan_type='free', description='-', price=0, duration_days=30, max_farms=2, max_devices=3
+    )
+    cache.clear()
+
+
+@pytest.fixture
+def user():
+    return User.objects.create_user(email='quota@example.com', username='quota', password=None)
+
+
+def counts(user):
+    usage = UserQuotaUsage.objects.get(user=user)
+    return usage.farm_count, usage.device_count
+
+
+def farm_of(owner, name='Farm'):
+    return Farm.objects.create(name=name, owner=owner, location='-', size=1)
+
+
+def test_reserve_up_to_the_limit(user):
+    reserve(user.pk, 'farm')
+    reserve(user.pk, 'farm')
+
+    with pytest.raises(QuotaExceeded):
+        reserve(user.pk, 'farm')
+    assert counts(user) == (2, 0)
+
+
+def test_reserve_refuses_an_amount_past_the_limit_without_counting_it(user):
+    reserve(user.pk, 'device', amount=2)
+
+    with pytest.raises(QuotaExceeded):
+        reserve(user.pk, 'device', amount=2)
+    assert counts(user) == (0, 2)
+    reserve(user.pk, 'device')
+    assert counts(user) == (0, 3)
+
+
+def test_counter_is_seeded_from_existing_objects(user):
+    farm_of(user, 'One')
+    farm_of(user, 'Two')
+
+    with pytest.raises(QuotaExceeded):
+        reserve(user.pk, 'farm')
+    assert counts(user) == (2, 0)
+
+
+def test_exempt_users_are_counted_but_not_limited(user):
+    reserve(user.pk, 'farm', amount=5, exempt=True)
+
+    assert counts(user) == (5, 0)
+
+
+def test_release_floors_at_zero(user):
+    reserve(user.pk, 'farm')
+
+    release(user.pk, 'farm', amount=3)
+
+    assert counts(user) == (0, 0)
+
+
+def test_reconcile_fixes_drifted_and_missing_counters(user):
+    farm = farm_of(user)
+    Device.objects.create(name='Probe', device_type='temperature', device_id='probe-1', farm=farm)
+    Device.objects.create(name='Scale', device_type='feed', device_id='scale-1', farm=farm)
+    UserQuotaUsage.objects.create(user=user, farm_count=5, device_count=0)
+    other = User.objects.create_user(email='other@example.com', username='other', password=None)
+    farm_of(other)
+
+    call_command('reconcile_quotas', dry_run=True)
+    assert counts(user) == (5, 0)
+    assert not UserQuotaUsage.objects.filter(user=other).exists()
+
+    call_command('reconcile_quotas')
+    assert counts(user) == (1, 2)
+    assert counts(other) == (1, 0)
@@ -0,0 +1,17 @@
+"""
+Import-time regression test: runs check_startup.py's check for every
+FastAPI app, so a heavy module moved back to import time (or an app that
+blows its budget) fails the suite.
+"""
+import os
+
+import pytest
+
+import check_startup
+
+
+@pytest.mark.parametrize("module", sorted(check_startup.CHECKS))
+def test_import_time_within_budget(module, capsys):
+    runs = int(os.getenv("STARTUP_CHECK_RUNS", "3"))
+    ok = check_startup.check(module, check_startup.CHECKS[module], runs)
+    assert ok, capsys.readouterr().out
@@ -0,0 +1,100 @@
+"""
+Stock movements under concurrency (apps/consolidated/stock.py). The threads
+need committed rows and their own connections, hence transaction=True.
+"""
+import threading
+from decimal import Decimal
+
+import pytest
+from django.db import connection
+from django.db.models import Q, Sum
+
+from apps.consolidated.models import Farm, InventoryItem, InventoryTransaction, User
+from apps.consolidated.stock import InsufficientStock, record_transaction
+
+pytestmark = pytest.mark.django_db(transaction=True)
+
+
+@pytest.fixture
+def item():
+    owner = User.objects.create_user(email='stock@example.com', username='stock', password=None)
+    farm = Farm.objects.create(name='Stock', owner=owner, location='-', size=1)
+    return InventoryItem.objects.create(name='Feed', farm=farm, unit='kg')
+
+
+def run_concurrently(target, count):
+    """Run target(index) on `count` threads that start together; returns their results."""
+    barrier = threading.Barrier(count)
+    results = [None] * count
+
+    def run(index):
+        barrier.wait()
+        try:
+            results[index] = target(index)
+        except Exception as e:
+            results[index] = e
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=run, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def ledger_balance(item):
+    totals = InventoryTransaction.objects.filter(item=item).aggregate(
+        inbound=Sum('quantity', filter=Q(transaction_type='purchase')),
+        outbound=Sum('quantity', filter=Q(transaction_type='usage')),
+    )
+    return (totals['inbound'] or 0) - (totals['outbound'] or 0)
+
+
+def test_concurrent_removals_never_go_negative(item):
+    record_transaction(item, 'purchase', Decimal('55'))
+
+    results = run_concurrently(lambda _: record_transaction(item.pk, 'usage', Decimal('10'))[1], 12)
+
+    balances = [result for result in results if not isinstance(result, Exception)]
+    errors = [result for result in results if isinstance(result, Exception)]
+    assert len(balances) == 5
+    assert all(isinstance(error, InsufficientStock) for error in errors)
+    assert sorted(balances) == [Decimal('5'), Decimal('15'), Decimal('25'), Decimal('35'), Decimal('45')]
+    item.refresh_from_db()
+    assert item.current_quantity == Decimal('5')
+    assert item.current_quantity == ledger_balance(item)
+
+
+def test_concurrent_mixed_movements_match_the_ledger(item):
+    record_transaction(item, 'purchase', Decimal('20'))
+
+    def move(index):
+        balances = []
+        for step in range(20):
+            transaction_type = 'purchase' if (index + step) % 3 == 0 else 'usage'
+            try:
+                balances.append(record_transaction(item.pk, transaction_type, Decimal('3.25'))[1])
+            except InsufficientStock:
+                pass
+        return balances
+
+    results = run_concurrently(move, 8)
+
+    assert not [result for result in results if isinstance(result, Exception)]
+    assert all(balance >= 0 for balances in results for balance in balances)
+    item.refresh_from_db()
+    assert item.current_quantity >= 0
+    assert item.current_quantity == ledger_balance(item)
+
+
+def test_rejected_removal_records_nothing(item):
+    record_transaction(item, 'purchase', Decimal('1'))
+
+    with pytest.raises(InsufficientStock):
+        record_transaction(item, 'usage', Decimal('1.01'))
+
+    item.refresh_from_db()
+    assert item.current_quantity == Decimal('1')
+    assert InventoryTransaction.objects.filter(item=item).count() == 1
@@ -1,4 +1,6 @@
 // API service for disease prediction
+import { supabase } from '../lib/supabase';
+
 const getApiBaseUrl = () => {
   // In production, use the environment variable or default to production backend
   if (import.meta.env.PROD) {
@@ -45,8 +47,11 @@ class ApiService {
       formData.append('crop_type', cropType);
     }
 
+    // The session token lets the backend keep the prediction in the user's history
+    const { data: { session } } = await supabase.auth.getSession();
     const response = await fetch(`${this.baseUrl}/predict`, {
       method: 'POST',
+      headers: session ? { Authorization: `Bearer ${session.access_token}` } : undefined,
       body: formData,
     });
 